@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cleanup scripts on synthetic data.
+
+Generates attendance and IAT documents (see synthetic_data.py), loads them
+into mongomock or a scratch database on a local mongod, and times:
+- find_and_clean_attendance   (remove_duplicate_attendance.py, scan)
+- apply_cleanup               (remove_duplicate_attendance.py, live batched writes)
+- find_duplicate_semesters    (remove_duplicate_iat_semesters.py)
+- remove_cumulative_subjects  (remove_cumulative_subjects.py, scan mode)
+
+Each step runs on a freshly loaded dataset, and the scripts' own output is
+discarded. For every step the harness reports the documents per second,
+the round-trips (commands sent), the BSON bytes sent and received and the
+peak RSS of the process so far. Round-trips and bytes come from pymongo
+command monitoring, so they are only measured against a real mongod. The
+steps share one process, so a step's peak RSS includes the steps and
+dataset loads before it; it never goes down.
+
+With --baseline the results are compared with an earlier --json file
+for the same target and dataset. A step fails when its round-trips or
+bytes rise more than --cost-tolerance above the baseline, and the run
+then exits 1. These counts do not depend on the machine; docs/sec does,
+so its change is only reported.
+
+mongomock does not evaluate pipeline updates or support arrayFilters, so
+there the apply_cleanup timings cover the client side only, its records
+are written with the whole-array rewrite instead of their minimal diffs,
+and remove_cumulative_subjects runs as a dry run.
+
+Usage:
+    python scripts/benchmark_cleanup.py [--uri mongodb://localhost:27017] [--students N]
+                                        [--steps STEP ...] [--json results.json]
+                                        [--baseline baseline.json] [--cost-tolerance FRACTION]
+
+Requirements:
+    pip install pymongo python-dotenv
+    pip install mongomock "pymongo<4.9"   (for the default mongomock target)
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+
+import bson
+from pymongo import MongoClient, monitoring
+
+from remove_cumulative_subjects import remove_cumulative_subjects
+from remove_duplicate_attendance import (
+    DEFAULT_BATCH_SIZE,
+    apply_cleanup,
+    find_and_clean_attendance,
+    print_error,
+    print_header,
+    print_info,
+    print_success,
+)
+from remove_duplicate_iat_semesters import find_duplicate_semesters
+from synthetic_data import generate_attendance, generate_iat
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+# Collections the harness loads; nothing else is touched
+ATTENDANCE_COLLECTION = 'attendances'
+IAT_COLLECTION = 'iatmarks'
+
+# Documents per insert_many while loading a dataset
+LOAD_BATCH_SIZE = 1000
+
+# Result columns compared with a baseline: the costs gate the run, the
+# throughput is only reported
+THROUGHPUT_COLUMN = 'docs_per_sec'
+COST_COLUMNS = ['round_trips', 'bytes_sent', 'bytes_received']
+
+# Dataset options recorded in --json output and matched by --baseline
+DATASET_OPTIONS = ('students', 'semesters', 'months', 'subjects', 'duplicate_rate',
+                   'invalid_rate', 'cumulative_rate', 'seed', 'batch_size')
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the commands sent and the BSON bytes of commands and replies"""
+
+    def __init__(self):
+        self.commands = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def started(self, event):
+        self.commands += 1
+        self.bytes_sent += len(bson.encode(event.command))
+
+    def succeeded(self, event):
+        self.bytes_received += len(bson.encode(event.reply))
+
+    def failed(self, event):
+        pass
+
+    def snapshot(self):
+        """Return the current counts"""
+        return self.commands, self.bytes_sent, self.bytes_received
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process so far in MB, or None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Measurement:
+    """Times the block it wraps and records the commands sent meanwhile"""
+
+    def __init__(self, counter):
+        self.counter = counter
+        self.seconds = None
+        self.counts = None
+
+    def __enter__(self):
+        self._start_counts = self.counter.snapshot() if self.counter else None
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._start
+        if self.counter:
+            self.counts = [end - start for end, start in
+                            zip(self.counter.snapshot(), self._start_counts)]
+        return False
+
+
+def step_find_and_clean_attendance(db, args, measured):
+    """Time the attendance scan"""
+    with measured:
+        find_and_clean_attendance(db)
+    return ATTENDANCE_COLLECTION
+
+
+def step_apply_cleanup(db, args, measured):
+    """Time the batched live pass over the dirty attendance records"""
+    records, _ = find_and_clean_attendance(db)
+    if not args.uri:
+        for record_info in records:
+            record_info['diff'] = None
+    with measured:
+        apply_cleanup(db, records, dry_run=False, batch_size=args.batch_size)
+    return ATTENDANCE_COLLECTION
+
+
+def step_find_duplicate_semesters(db, args, measured):
+    """Time the IAT duplicate detection"""
+    with measured:
+        find_duplicate_semesters(db)
+    return IAT_COLLECTION
+
+
+def step_remove_cumulative_subjects(db, args, measured):
+    """Time the scan-mode cumulative subject removal"""
+    with measured:
+        remove_cumulative_subjects(dry_run=not args.uri, db=db)
+    return ATTENDANCE_COLLECTION
+
+
+STEPS = {
+    'find_and_clean_attendance': step_find_and_clean_attendance,
+    'apply_cleanup': step_apply_cleanup,
+    'find_duplicate_semesters': step_find_duplicate_semesters,
+    'remove_cumulative_subjects': step_remove_cumulative_subjects,
+}
+
+
+def insert_in_batches(collection, documents):
+    """Insert documents with unordered insert_many batches"""
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == LOAD_BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+def load_dataset(db, args):
+    """Replace the benchmark collections with a fresh synthetic dataset"""
+    db.drop_collection(ATTENDANCE_COLLECTION)
+    db.drop_collection(IAT_COLLECTION)
+    insert_in_batches(db[ATTENDANCE_COLLECTION], generate_attendance(
+        args.students, args.semesters, args.months, args.subjects,
+        args.duplicate_rate, args.invalid_rate, args.cumulative_rate, args.seed))
+    insert_in_batches(db[IAT_COLLECTION], generate_iat(
+        args.students, args.semesters, args.subjects, args.duplicate_rate, args.seed))
+
+
+def run_step(db, name, args, counter):
+    """Load a fresh dataset, run one step and return its result row"""
+    load_dataset(db, args)
+    measured = Measurement(counter)
+    row = {'step': name}
+
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            collection_name = STEPS[name](db, args, measured)
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+        return row
+
+    docs = db[collection_name].estimated_document_count()
+    row.update({
+        'seconds': round(measured.seconds, 4),
+        'docs': docs,
+        'docs_per_sec': round(docs / measured.seconds, 1) if measured.seconds else None,
+        'round_trips': measured.counts[0] if measured.counts else None,
+        'bytes_sent': measured.counts[1] if measured.counts else None,
+        'bytes_received': measured.counts[2] if measured.counts else None,
+        'peak_rss_so_far_mb': peak_rss_mb(),
+    })
+    return row
+
+
+def connect(args):
+    """Return (db, client, counter) for the benchmark target"""
+    if args.uri:
+        counter = CommandCounter()
+        client = MongoClient(args.uri, serverSelectionTimeoutMS=5000, event_listeners=[counter])
+        db = client[args.database]
+        others = set(db.list_collection_names()) - {ATTENDANCE_COLLECTION, IAT_COLLECTION}
+        if others:
+            raise RuntimeError(f"database '{args.database}' holds other collections "
+                               f"({', '.join(sorted(others))}); pick a scratch database")
+        return db, client, counter
+
+    if mongomock is None:
+        raise RuntimeError("mongomock is not installed: pip install mongomock, "
+                           "or pass --uri for a local mongod")
+    client = mongomock.MongoClient()
+    return client[args.database], client, None
+
+
+def format_number(value, column):
+    """Format a result value for the table"""
+    if value is None:
+        return 'n/a'
+    if column == 'seconds':
+        return f"{value:.3f}"
+    if isinstance(value, float):
+        return f"{value:,.1f}"
+    return f"{value:,}"
+
+
+def print_results(rows):
+    """Print the result rows as a table"""
+    columns = ['seconds', 'docs_per_sec', 'round_trips', 'bytes_sent', 'bytes_received',
+               'peak_rss_so_far_mb']
+    print(f"\n  {'step':<28}" + ''.join(f"{column:>20}" for column in columns))
+    for row in rows:
+        if 'error' in row:
+            print_error(f" {row['step']:<28}{row['error']}")
+            continue
+        print(f"  {row['step']:<28}" + ''.join(f"{format_number(row[column], column):>20}" for column in columns))
+    print()
+
+
+def iter_baseline_values(rows, baseline, columns):
+    """
+    Yield (step, column, baseline, current) for the columns measured in
+    both the result rows and the steps of a baseline results file.
+    """
+    baseline_rows = {row['step']: row for row in baseline.get('steps', []) if 'error' not in row}
+    for row in rows:
+        previous = baseline_rows.get(row['step'])
+        if previous is None or 'error' in row:
+            continue
+        for column in columns:
+            before, after = previous.get(column), row.get(column)
+            if before is not None and after is not None:
+                yield row['step'], column, before, after
+
+
+def compare_to_baseline(rows, baseline, cost_tolerance):
+    """
+    Compare the costs of result rows with a baseline results file.
+
+    Returns the round-trips and bytes that rose more than cost_tolerance,
+    as (step, column, baseline, current) tuples. Steps or values missing
+    from either side are not compared.
+    """
+    return [(step, column, before, after)
+            for step, column, before, after in iter_baseline_values(rows, baseline, COST_COLUMNS)
+            if after > before * (1 + cost_tolerance)]
+
+
+def throughput_changes(rows, baseline):
+    """Return the docs/sec of each step against the baseline, as (step, baseline, current)"""
+    return [(step, before, after)
+            for step, _, before, after in iter_baseline_values(rows, baseline, [THROUGHPUT_COLUMN])]
+
+
+def check_baseline(path, target, dataset, rows, args):
+    """Compare the results with the baseline file at path; return True if none regressed"""
+    with open(path, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+
+    if baseline.get('target') != target or baseline.get('dataset') != dataset:
+        print_error(f"Baseline {path} was measured on a different target or dataset; not comparable")
+        return False
+
+    for step, before, after in throughput_changes(rows, baseline):
+        change = f" ({after / before - 1:+.0%})" if before else ""
+        print_info(f" {step}: docs/sec {format_number(before, THROUGHPUT_COLUMN)} -> "
+                   f"{format_number(after, THROUGHPUT_COLUMN)}{change}")
+
+    regressions = compare_to_baseline(rows, baseline, args.cost_tolerance)
+    for step, column, before, after in regressions:
+        print_error(f" {step}: {column} regressed from {format_number(before, column)} "
+                    f"to {format_number(after, column)}")
+    if regressions:
+        return False
+    print_success(f"No cost regressions against {path} (tolerance {args.cost_tolerance:.0%})")
+    return True
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Benchmark the cleanup scripts on synthetic data")
+    parser.add_argument('--uri', help="local mongod to run against (default: mongomock)")
+    parser.add_argument('--database', default='cleanup_benchmark',
+                        help="scratch database for the dataset (default: cleanup_benchmark)")
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--semesters', type=int, default=8)
+    parser.add_argument('--months', type=int, default=5)
+    parser.add_argument('--subjects', type=int, default=6)
+    parser.add_argument('--duplicate-rate', type=float, default=0.05)
+    parser.add_argument('--invalid-rate', type=float, default=0.02)
+    parser.add_argument('--cumulative-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"bulk_write batch size for apply_cleanup (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--steps', nargs='+', choices=list(STEPS), default=list(STEPS),
+                        help="steps to run (default: all)")
+    parser.add_argument('--json', metavar='PATH', help="also write the results to PATH as JSON")
+    parser.add_argument('--baseline', metavar='PATH',
+                        help="compare the results with an earlier --json file and exit 1 on cost regressions")
+    parser.add_argument('--cost-tolerance', type=float, default=0.05,
+                        help="allowed rise in round-trips and bytes against the baseline, "
+                             "as a fraction (default: 0.05)")
+    return parser.parse_args(argv)
+
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print_header("Cleanup Script Benchmark")
+
+    try:
+        db, client, counter = connect(args)
+    except Exception as e:
+        print_error(str(e))
+        return 1
+
+    target = args.uri or 'mongomock'
+    print_info(f"Target: {target}, database: {args.database}, students: {args.students}")
+
+    try:
+        rows = []
+        for name in args.steps:
+            print_info(f"Running {name}...")
+            rows.append(run_step(db, name, args, counter))
+    finally:
+        db.drop_collection(ATTENDANCE_COLLECTION)
+        db.drop_collection(IAT_COLLECTION)
+        client.close()
+
+    print_results(rows)
+
+    dataset = {key: getattr(args, key) for key in DATASET_OPTIONS}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as results_file:
+            json.dump({'target': target, 'dataset': dataset, 'steps': rows}, results_file, indent=2)
+        print_success(f"Results written to {args.json}")
+
+    failed = any('error' in row for row in rows)
+    if args.baseline and not check_baseline(args.baseline, target, dataset, rows, args):
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
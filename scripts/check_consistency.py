@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Cross-check attendance, IAT and external marks per student.
+
+A student's semesters and subjects should agree across attendances,
+the IAT collection and externals. This script checks every student in a
+single streaming pass, with no query per student:
+1. One cursor per collection reads the records sorted by userId, with
+   only the semester numbers and subject codes and names projected
+2. The cursors are merge-joined on userId. Only the current student is
+   held in memory, as one set of subjects per semester and
+   collection, so memory stays flat however many students there are
+3. Each student is checked for:
+   - student_missing:  records in some collections but not the others
+   - semester_missing: a semester found in some of the student's
+                       collections but not the others
+   - subject_mismatch: a semester whose subjects differ between
+                       collections (attendance's invalid subjects, as
+                       is_invalid_subject reads them, are left out)
+
+Subjects are matched by subjectCode, trimmed and upper-cased. subjectCode
+is optional in the attendance model, so a subject without one is matched
+by subjectName instead, the way attendanceController keys subjects. The
+first mismatches are printed, and --report-file writes every one as a
+JSON line.
+
+The sorts use the userId index of each collection; without one the
+server sorts on disk.
+
+Usage:
+    python scripts/check_consistency.py [--datasets NAME ...] [--report-file PATH]
+                                        [--batch-size N] [--metrics-file PATH]
+
+Requirements:
+    pip install pymongo python-dotenv
+"""
+
+import argparse
+from collections import Counter
+
+from bson import ObjectId
+
+from cleanup_audit import AuditLog
+from cleanup_metrics import METRICS, add_metrics_argument
+from cleanup_state import resolve_collection
+from remove_duplicate_attendance import (
+    DEFAULT_BATCH_SIZE,
+    connect_to_mongodb,
+    is_invalid_subject,
+    print_error,
+    print_header,
+    print_info,
+    print_success,
+    print_warning,
+)
+from remove_duplicate_semesters import resolve_semester_collection
+
+
+# Dataset -> Mongoose model
+DATASETS = {
+    'attendance': 'Attendance',
+    'iat': 'Iat',
+    'externals': 'External',
+}
+
+# Only what the checks compare is fetched
+PROJECTIONS = {
+    'attendance': {'_id': 0, 'userId': 1, 'semesters.semester': 1,
+                   'semesters.months.subjects.subjectCode': 1,
+                   'semesters.months.subjects.subjectName': 1,
+                   'semesters.months.subjects.attendedClasses': 1,
+                   'semesters.months.subjects.totalClasses': 1},
+    'iat': {'_id': 0, 'userId': 1, 'semesters.semester': 1, 'semesters.subjects.subjectCode': 1,
+            'semesters.subjects.subjectName': 1},
+    'externals': {'_id': 0, 'userId': 1, 'semesters.semester': 1, 'semesters.subjects.subjectCode': 1,
+                  'semesters.subjects.subjectName': 1},
+}
+
+# Mismatches printed before the rest are only counted
+MAX_PRINTED_MISMATCHES = 20
+
+# BSON sort order of the types a userId can have, so the merge join
+# compares keys the way the server sorted them
+BSON_TYPE_ORDER = {type(None): 1, int: 2, float: 2, str: 3, ObjectId: 7}
+
+
+def resolve_source_collection(db, dataset):
+    """Return the name of a dataset's collection, or None if there is none"""
+    model = DATASETS[dataset]
+    if model == 'Attendance':
+        return resolve_collection(db, model, ['attendances'])
+    return resolve_semester_collection(db, model)
+
+
+def sort_key(user_id):
+    """Return a key ordering userIds the way MongoDB sorts them"""
+    rank = BSON_TYPE_ORDER.get(type(user_id))
+    if rank is None:
+        return (99, str(user_id))
+    return (rank, user_id if user_id is not None else 0)
+
+
+def normalise_code(code):
+    """Return a subject code or name trimmed and upper-cased, or None if blank"""
+    if code is None:
+        return None
+    code = str(code).strip().upper()
+    return code or None
+
+
+def semester_subjects(record, dataset, subjects=None):
+    """
+    Add a record's subjects to subjects, a dict of semester -> set of
+    (code, name) pairs, and return it. Either may be None, and subjects
+    with neither are left out. Semesters without subjects still get an
+    entry.
+    """
+    subjects = {} if subjects is None else subjects
+    for semester in record.get('semesters') or []:
+        if not isinstance(semester, dict):
+            continue
+        pairs = subjects.setdefault(semester.get('semester'), set())
+        if dataset == 'attendance':
+            entries = [subject for month in semester.get('months') or [] if isinstance(month, dict)
+                       for subject in month.get('subjects') or []
+                       if isinstance(subject, dict) and not is_invalid_subject(subject)]
+        else:
+            entries = [subject for subject in semester.get('subjects') or [] if isinstance(subject, dict)]
+        pairs.update(pair for pair in ((normalise_code(subject.get('subjectCode')),
+                                        normalise_code(subject.get('subjectName'))) for subject in entries)
+                     if pair != (None, None))
+    return subjects
+
+
+def iter_students(cursor, dataset):
+    """
+    Yield (userId, semester -> subjects) per student of a cursor
+    sorted by userId, merging a student's records if there are several.
+    """
+    user_id, subjects, previous_key = None, None, None
+    for record in METRICS.timed(cursor, 'read', 'records_read'):
+        key = sort_key(record.get('userId'))
+        if subjects is not None and key == previous_key:
+            semester_subjects(record, dataset, subjects)
+            continue
+        if previous_key is not None and key < previous_key:
+            raise RuntimeError(f"{dataset} records are not sorted by userId")
+        if subjects is not None:
+            yield user_id, subjects
+        user_id, subjects, previous_key = record.get('userId'), semester_subjects(record, dataset), key
+    if subjects is not None:
+        yield user_id, subjects
+
+
+def merge_students(streams):
+    """
+    Merge-join per-student streams on userId.
+
+    streams maps dataset -> iter_students(). Yields (userId, found), where
+    found maps each dataset holding the student to its semester subjects.
+    """
+    heads = {dataset: next(stream, None) for dataset, stream in streams.items()}
+    while True:
+        current = [head for head in heads.values() if head is not None]
+        if not current:
+            return
+        user_id = min(current, key=lambda head: sort_key(head[0]))[0]
+        key = sort_key(user_id)
+
+        found = {}
+        for dataset, head in heads.items():
+            if head is not None and sort_key(head[0]) == key:
+                found[dataset] = head[1]
+                heads[dataset] = next(streams[dataset], None)
+        yield user_id, found
+
+
+def missing_subjects(pairs, other_pairs):
+    """
+    Return the labels of the subjects in other_pairs that pairs lacks.
+
+    A subject with a code is there if pairs has the code, or a subject
+    without a code of the same name. One without a code is there if
+    pairs has a subject of its name.
+    """
+    codes = {code for code, _ in pairs if code}
+    names = {name for _, name in pairs if name}
+    uncoded_names = {name for code, name in pairs if not code and name}
+    missing = set()
+    for code, name in other_pairs:
+        if code:
+            if code not in codes and name not in uncoded_names:
+                missing.add(code)
+        elif name not in names:
+            missing.add(name)
+    return sorted(missing)
+
+
+def check_student(user_id, found, datasets):
+    """Return the mismatches of one student, as (kind, details) pairs"""
+    mismatches = []
+    missing = [dataset for dataset in datasets if dataset not in found]
+    if missing:
+        mismatches.append(('student_missing', {'userId': user_id, 'present_in': [dataset for dataset in datasets if dataset in found],
+                                               'missing_from': missing}))
+
+    semesters = set().union(*found.values())
+    for semester in sorted(semesters, key=sort_key):
+        present = [dataset for dataset in datasets if semester in found.get(dataset, {})]
+        if len(present) < len(found):
+            mismatches.append(('semester_missing', {
+                'userId': user_id, 'semester': semester, 'present_in': present,
+                'missing_from': [dataset for dataset in found if dataset not in present]}))
+        if len(present) < 2:
+            continue
+
+        pairs = {dataset: found[dataset][semester] for dataset in present}
+        missing = {}
+        for dataset in present:
+            others = set().union(*(pairs[other] for other in present if other != dataset))
+            lacks = missing_subjects(pairs[dataset], others)
+            if lacks:
+                missing[dataset] = lacks
+        if missing:
+            mismatches.append(('subject_mismatch', {'userId': user_id, 'semester': semester,
+                                                    'missing_subjects': missing}))
+    return mismatches
+
+
+def describe_mismatch(kind, mismatch):
+    """Return a one-line description of a mismatch"""
+    user_id = mismatch['userId']
+    if kind == 'student_missing':
+        return (f"Student {user_id}: in {', '.join(mismatch['present_in'])}, "
+                f"missing from {', '.join(mismatch['missing_from'])}")
+    if kind == 'semester_missing':
+        return (f"Student {user_id} semester {mismatch['semester']}: in "
+                f"{', '.join(mismatch['present_in'])}, missing from {', '.join(mismatch['missing_from'])}")
+    missing = '; '.join(f"{dataset} lacks {', '.join(subjects)}"
+                        for dataset, subjects in mismatch['missing_subjects'].items())
+    return f"Student {user_id} semester {mismatch['semester']}: {missing}"
+
+
+def check_consistency(db, collections, report=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Merge-join the collections and check every student.
+
+    collections maps dataset -> collection name. Returns the totals:
+    students checked, students per dataset, and mismatches per kind.
+    """
+    report = report or AuditLog()
+    streams = {
+        dataset: iter_students(
+            db[name].find({}, PROJECTIONS[dataset], batch_size=batch_size)
+                    .sort('userId', 1).allow_disk_use(True),
+            dataset)
+        for dataset, name in collections.items()
+    }
+
+    totals = Counter()
+    printed = 0
+    for user_id, found in merge_students(streams):
+        totals['students'] += 1
+        for dataset in found:
+            totals[f'students_in_{dataset}'] += 1
+
+        with METRICS.phase('check'):
+            mismatches = check_student(user_id, found, list(collections))
+        if mismatches:
+            totals['students_with_mismatches'] += 1
+        for kind, mismatch in mismatches:
+            totals[kind] += 1
+            report.record(kind, **mismatch)
+            if printed < MAX_PRINTED_MISMATCHES:
+                print_warning(f"  {describe_mismatch(kind, mismatch)}")
+                printed += 1
+
+    METRICS.count('students_checked', totals['students'])
+    mismatch_count = totals['student_missing'] + totals['semester_missing'] + totals['subject_mismatch']
+    if mismatch_count > printed:
+        print_warning(f"  ... and {mismatch_count - printed} more mismatches")
+    return totals
+
+
+def print_consistency_summary(totals, collections):
+    """Print the students checked and the mismatches found"""
+    print("\n" + "="*70)
+    print_info("CONSISTENCY SUMMARY:")
+    print(f"  Students checked: {totals['students']}")
+    for dataset, name in collections.items():
+        print(f"  Students in {name}: {totals[f'students_in_{dataset}']}")
+    print(f"  Students with mismatches: {totals['students_with_mismatches']}")
+    print(f"  Students missing from a collection: {totals['student_missing']}")
+    print(f"  Semesters missing from a collection: {totals['semester_missing']}")
+    print(f"  Semesters with differing subjects: {totals['subject_mismatch']}")
+    print("="*70 + "\n")
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Cross-check attendance, IAT and external marks")
+    parser.add_argument('--datasets', nargs='+', metavar='NAME',
+                        help=f"collections to compare, at least two (default: {', '.join(DATASETS)})")
+    parser.add_argument('--report-file', metavar='PATH',
+                        help="append every mismatch to PATH as a JSON line")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"records per cursor batch (default: {DEFAULT_BATCH_SIZE})")
+    add_metrics_argument(parser)
+    args = parser.parse_args(argv)
+
+    unknown = [dataset for dataset in args.datasets or [] if dataset not in DATASETS]
+    if unknown:
+        parser.error(f"unknown datasets: {', '.join(unknown)} (choose from {', '.join(DATASETS)})")
+    if args.datasets is not None and len(set(args.datasets)) < 2:
+        parser.error("--datasets needs at least two collections")
+    return args
+
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print_header("Attendance / IAT / Externals Consistency Check")
+
+    db, client = connect_to_mongodb()
+
+    try:
+        collections = {}
+        for dataset in dict.fromkeys(args.datasets or DATASETS):
+            name = resolve_source_collection(db, dataset)
+            if name is None:
+                print_warning(f"No collection found for {dataset}, leaving it out")
+            else:
+                collections[dataset] = name
+
+        if len(collections) < 2:
+            print_error("Fewer than two collections to compare")
+            return
+
+        print_info(f"Merge-joining {', '.join(collections.values())} on userId...")
+        with AuditLog(args.report_file) as report:
+            totals = check_consistency(db, collections, report, args.batch_size)
+        print_consistency_summary(totals, collections)
+
+        if totals['students_with_mismatches']:
+            print_warning(f"⚠ {totals['students_with_mismatches']} students have mismatches")
+        else:
+            print_success("✓ Every student is consistent across the collections")
+
+    except Exception as e:
+        print_error(f"\nAn error occurred: {e}")
+        import traceback
+        traceback.print_exc()
+
+    finally:
+        client.close()
+        print_info("\nMongoDB connection closed.")
+        if args.metrics_file:
+            print_info(f"Metrics written to {METRICS.write(args.metrics_file, 'check_consistency')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Per-record audit trail for the cleanup scripts.
+
+With --audit-file PATH, the attendance and IAT scripts append one JSON
+line per record they plan or write to PATH, instead of (or as well as)
+printing it. Lines go through a large write buffer, so a run touching
+tens of thousands of records makes a handful of write() calls.
+
+Every line has a UTC timestamp and an event:
+- would_update: the dry run found the record needs cleaning
+- updated / not_modified: a single-record live update and its outcome
+- submitted: the record was sent in a bulk_write batch
+- batch: the outcome of one bulk_write batch (matched, modified, failed,
+  and conflicts: records changed by someone else before the write)
+- skipped_changed / skipped_missing: a planned record changed or deleted
+  before --apply-plan reached it
+
+ObjectIds and other BSON values are written as strings.
+"""
+
+import json
+from datetime import datetime, timezone
+
+
+# Bytes buffered before the audit file is written to
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+
+class AuditLog:
+    """JSONL audit file; every call is a no-op when path is None"""
+
+    def __init__(self, path=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8', buffering=buffer_size) if path else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    @property
+    def enabled(self):
+        """True if entries are being written"""
+        return self._file is not None
+
+    def record(self, event, **fields):
+        """Append one entry"""
+        if self._file is None:
+            return
+        entry = {'time': datetime.now(timezone.utc).isoformat(), 'event': event, **fields}
+        self._file.write(json.dumps(entry, default=str) + '\n')
+
+    def close(self):
+        """Flush and close the file"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def add_output_arguments(parser):
+    """Add the --quiet and --audit-file options to an argument parser"""
+    parser.add_argument('--quiet', action='store_true',
+                        help="print only the summaries, not every record and batch")
+    parser.add_argument('--audit-file', metavar='PATH',
+                        help="append one JSON line per planned or written record to PATH")
@@ -0,0 +1,265 @@
+"""
+Run metrics shared by the cleanup scripts.
+
+The shared helpers record into the process-wide METRICS object:
+- phases: wall time spent connecting, counting, detecting duplicates on
+  the server, reading cursors, cleaning records and writing
+- counters: documents scanned, flagged as dirty, matched and modified,
+  write batches, write errors and write conflicts (guarded updates that
+  matched nothing because the record changed after it was read)
+- histograms: the latency of every write round-trip (a bulk_write batch,
+  or a single update_one)
+- commands: the MongoDB commands sent, by name, with their server time,
+  for clients created with event_listeners=[METRICS.commands]
+
+With --metrics-file the scripts write them once the run ends, as JSON, or
+as a Prometheus text file when the path ends in .prom (for the
+node_exporter textfile collector).
+"""
+
+import os
+import json
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from pymongo import monitoring
+
+
+# Upper bounds (seconds) of the write latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Prefix of every Prometheus metric name
+PROMETHEUS_PREFIX = 'cleanup'
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Counts the MongoDB commands sent and their server time, by command name"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget every command seen so far"""
+        self.counts = Counter()
+        self.failures = Counter()
+        self.seconds = Counter()
+
+    def started(self, event):
+        self.counts[event.command_name] += 1
+
+    def succeeded(self, event):
+        self.seconds[event.command_name] += event.duration_micros / 1e6
+
+    def failed(self, event):
+        self.failures[event.command_name] += 1
+        self.seconds[event.command_name] += event.duration_micros / 1e6
+
+    def snapshot(self):
+        """Return {command: {'count', 'failed', 'seconds'}}"""
+        return {
+            name: {
+                'count': self.counts[name],
+                'failed': self.failures[name],
+                'seconds': round(self.seconds[name], 6),
+            }
+            for name in sorted(self.counts)
+        }
+
+
+class Metrics:
+    """Phase timings, counters and latency histograms of one run"""
+
+    def __init__(self):
+        self.commands = CommandMetrics()
+        self.reset()
+
+    def reset(self):
+        """Start a new run"""
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self.phases = Counter()
+        self.counters = Counter()
+        self.histograms = {}
+        self.commands.reset()
+
+    @contextmanager
+    def phase(self, name):
+        """Add the wall time of the wrapped block to phase name"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - started
+
+    def add_time(self, name, seconds):
+        """Add seconds to phase name"""
+        self.phases[name] += seconds
+
+    def timed(self, iterable, phase, counter=None):
+        """
+        Yield from iterable, adding the time spent waiting for each item
+        to phase and counting the items in counter.
+        """
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.phases[phase] += time.perf_counter() - started
+                return
+            self.phases[phase] += time.perf_counter() - started
+            if counter:
+                self.counters[counter] += 1
+            yield item
+
+    def count(self, name, value=1):
+        """Add value to counter name"""
+        self.counters[name] += value
+
+    def observe(self, name, seconds):
+        """Record one latency in histogram name"""
+        buckets = self.histograms.setdefault(name, {
+            'counts': [0] * (len(LATENCY_BUCKETS) + 1), 'sum': 0.0, 'count': 0})
+        buckets['counts'][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        buckets['sum'] += seconds
+        buckets['count'] += 1
+
+    def record_write(self, seconds, matched, modified, failed=0):
+        """Record the latency and outcome of one write round-trip"""
+        self.phases['write'] += seconds
+        self.observe('write_batch_seconds', seconds)
+        self.counters['write_batches'] += 1
+        self.counters['documents_matched'] += matched
+        self.counters['documents_modified'] += modified
+        self.counters['write_errors'] += failed
+
+    def rates(self):
+        """
+        Return the document throughput.
+
+        Scanned documents are divided by the read and clean time, modified
+        documents by the write time.
+        """
+        scan_seconds = self.phases['read'] + self.phases['clean']
+        write_seconds = self.phases['write']
+        return {
+            'documents_scanned_per_second':
+                round(self.counters['documents_scanned'] / scan_seconds, 1) if scan_seconds else 0.0,
+            'documents_modified_per_second':
+                round(self.counters['documents_modified'] / write_seconds, 1) if write_seconds else 0.0,
+        }
+
+    def snapshot(self):
+        """Return the metrics as a JSON-serialisable dict"""
+        return {
+            'started_at': self.started_at.isoformat(),
+            'run_seconds': round(time.perf_counter() - self._started, 6),
+            'phases': {name: round(seconds, 6) for name, seconds in sorted(self.phases.items())},
+            'counters': dict(sorted(self.counters.items())),
+            'rates': self.rates(),
+            'histograms': {
+                name: {'buckets': list(LATENCY_BUCKETS), 'counts': list(histogram['counts']),
+                       'sum': round(histogram['sum'], 6), 'count': histogram['count']}
+                for name, histogram in self.histograms.items()
+            },
+            'commands': self.commands.snapshot(),
+        }
+
+    def merge(self, snapshot):
+        """
+        Add the metrics of another process (a snapshot()) to this run.
+
+        Phase times of parallel workers add up, so they can exceed the
+        wall time of the run.
+        """
+        self.phases.update(snapshot['phases'])
+        self.counters.update(snapshot['counters'])
+        for name, histogram in snapshot['histograms'].items():
+            buckets = self.histograms.setdefault(name, {
+                'counts': [0] * (len(LATENCY_BUCKETS) + 1), 'sum': 0.0, 'count': 0})
+            buckets['counts'] = [a + b for a, b in zip(buckets['counts'], histogram['counts'])]
+            buckets['sum'] += histogram['sum']
+            buckets['count'] += histogram['count']
+        for name, command in snapshot['commands'].items():
+            self.commands.counts[name] += command['count']
+            self.commands.failures[name] += command['failed']
+            self.commands.seconds[name] += command['seconds']
+
+    def to_prometheus(self, script):
+        """Return the metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in
+                                      [('script', script)] + labels)
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value}")
+
+        metric('last_run_timestamp_seconds', 'gauge', "Start time of the last run",
+               [([], round(self.started_at.timestamp(), 3))])
+        metric('run_seconds', 'gauge', "Wall time of the last run",
+               [([], snapshot['run_seconds'])])
+        metric('phase_seconds', 'gauge', "Wall time spent in each phase of the last run",
+               [([('phase', name)], seconds) for name, seconds in snapshot['phases'].items()])
+        for name, value in list(snapshot['counters'].items()) + list(snapshot['rates'].items()):
+            metric(name, 'gauge', f"{name.replace('_', ' ').capitalize()} in the last run",
+                   [([], value)])
+        metric('mongo_commands', 'gauge', "MongoDB commands sent during the last run",
+               [([('command', name)], command['count'])
+                for name, command in snapshot['commands'].items()])
+        metric('mongo_command_failures', 'gauge', "MongoDB commands that failed during the last run",
+               [([('command', name)], command['failed'])
+                for name, command in snapshot['commands'].items()])
+        metric('mongo_command_seconds', 'gauge', "Server time of the MongoDB commands of the last run",
+               [([('command', name)], command['seconds'])
+                for name, command in snapshot['commands'].items()])
+
+        for name, histogram in snapshot['histograms'].items():
+            full_name = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {full_name} Latency of each write round-trip in the last run")
+            lines.append(f"# TYPE {full_name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(list(histogram['buckets']) + ['+Inf'], histogram['counts']):
+                cumulative += bucket_count
+                lines.append(f'{full_name}_bucket{{script="{script}",le="{bound}"}} {cumulative}')
+            lines.append(f'{full_name}_sum{{script="{script}"}} {histogram["sum"]}')
+            lines.append(f'{full_name}_count{{script="{script}"}} {histogram["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, script):
+        """
+        Write the metrics to path: Prometheus text if it ends in .prom,
+        JSON otherwise. The file is replaced atomically, so a scraper
+        never reads half of it.
+        """
+        if path.endswith('.prom'):
+            content = self.to_prometheus(script)
+        else:
+            content = json.dumps({'script': script, **self.snapshot()}, indent=2) + '\n'
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(content)
+        os.replace(tmp_path, path)
+        return path
+
+
+# Metrics of the current process, recorded by the shared helpers
+METRICS = Metrics()
+
+
+def add_metrics_argument(parser):
+    """Add the --metrics-file option to an argument parser"""
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help="write run metrics to PATH when the run ends: JSON, or "
+                             "Prometheus text if PATH ends in .prom")
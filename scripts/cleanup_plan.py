@@ -0,0 +1,157 @@
+"""
+Pre-computed cleanup plans.
+
+A dry run with --plan-file PATH writes what it would change to a plan file
+instead of asking for confirmation. A later run with --apply-plan PATH
+applies exactly those changes without scanning the collection again, so
+the two halves can run unattended (e.g. from cron) at different times.
+
+A plan file is JSON Lines (gzip-compressed if the name ends in .gz):
+- the first line is a header naming the script, database and collection
+- every other line is one record: its _id and userId, the array indexes
+  to keep (the plan), the changes it makes, a hash of the record as the
+  cleaner read it, its version (__v) and, when the plan can be written as
+  one, its minimal $pull update (the diff)
+
+Before a batch of records is written, the records are re-read by _id with
+the same projection and hashed again. A record whose hash differs was
+changed after the plan was made (e.g. by an attendanceController save),
+so its indexes may no longer be right and it is skipped. The writes are
+also guarded by the planned version, which catches a save landing between
+the re-read and the write.
+"""
+
+import os
+import gzip
+import hashlib
+from datetime import datetime, timezone
+
+import bson
+from bson import json_util
+
+
+PLAN_FORMAT = 'cleanup-plan'
+PLAN_VERSION = 1
+
+
+def record_hash(record):
+    """Return a content hash of a record as fetched with the cleaner's projection"""
+    return hashlib.blake2b(bson.encode(record), digest_size=16).hexdigest()
+
+
+def open_plan_file(path, mode):
+    """Open a plan file for text reading or writing, gzip-compressed if it ends in .gz"""
+    if path.endswith('.gz'):
+        return gzip.open(path, f'{mode}t', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class PlanWriter:
+    """
+    Writes a plan file.
+
+    The file is written under a temporary name and moved into place only
+    when the dry run finishes, so a failed run never leaves a partial plan.
+    """
+
+    def __init__(self, path, script, database, collection):
+        self.path = path
+        self.header = {
+            'format': PLAN_FORMAT,
+            'version': PLAN_VERSION,
+            'script': script,
+            'database': database,
+            'collection': collection,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+        }
+        self.count = 0
+        # Keep the .gz suffix, which decides the compression
+        self._tmp_path = f"{path}.tmp.gz" if path.endswith('.gz') else f"{path}.tmp"
+        self._file = None
+
+    def __enter__(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open_plan_file(self._tmp_path, 'w')
+        self._file.write(json_util.dumps(self.header) + '\n')
+        return self
+
+    def add(self, record_id, user_id, plan, changes, content_hash, version=None, diff=None):
+        """Add one record to the plan, with its minimal diff update if it has one"""
+        self._file.write(json_util.dumps({
+            '_id': record_id,
+            'userId': user_id,
+            'plan': plan,
+            'changes': changes,
+            'hash': content_hash,
+            'version': version,
+            'diff': diff,
+        }) + '\n')
+        self.count += 1
+
+    def __exit__(self, exc_type, *exc_info):
+        self._file.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.path)
+        else:
+            os.remove(self._tmp_path)
+        return False
+
+
+def read_plan(path, script, database):
+    """
+    Open a plan file written by script for database.
+
+    Returns (header, entries), where entries yields the planned records
+    in file order. Raises ValueError if the file is not such a plan.
+    """
+    with open_plan_file(path, 'r') as plan_file:
+        header = json_util.loads(plan_file.readline() or '{}')
+
+    if header.get('format') != PLAN_FORMAT or header.get('version') != PLAN_VERSION:
+        raise ValueError(f"{path} is not a cleanup plan file")
+    if header.get('script') != script:
+        raise ValueError(f"{path} was written by {header.get('script')}, not {script}")
+    if header.get('database') != database:
+        raise ValueError(f"{path} was made for database '{header.get('database')}', "
+                         f"not '{database}'")
+
+    def entries():
+        with open_plan_file(path, 'r') as plan_file:
+            plan_file.readline()
+            for line in plan_file:
+                yield json_util.loads(line)
+
+    return header, entries()
+
+
+def split_unchanged(collection, entries, projection):
+    """
+    Re-read the planned records by _id and compare their hashes.
+
+    Returns (unchanged, changed, missing) lists of entries.
+    """
+    record_ids = [entry['_id'] for entry in entries]
+    current = {record['_id']: record_hash(record)
+               for record in collection.find({'_id': {'$in': record_ids}}, projection)}
+
+    unchanged, changed, missing = [], [], []
+    for entry in entries:
+        if entry['_id'] not in current:
+            missing.append(entry)
+        elif current[entry['_id']] == entry['hash']:
+            unchanged.append(entry)
+        else:
+            changed.append(entry)
+    return unchanged, changed, missing
+
+
+def add_plan_arguments(parser):
+    """Add the --plan-file and --apply-plan options to an argument parser"""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--plan-file', metavar='PATH',
+                       help="dry run only: write the planned changes to PATH instead of "
+                            "asking for confirmation")
+    group.add_argument('--apply-plan', metavar='PATH',
+                       help="apply the changes planned in PATH without scanning again, "
+                            "skipping records changed since the plan was made")
@@ -0,0 +1,257 @@
+"""
+Local state shared by the cleanup scripts.
+
+State is kept in JSON files under scripts/.state/:
+- A Checkpoint records how far a live run got (the last processed _id and
+  the running totals), so an interrupted run can be resumed with --resume
+  instead of starting over.
+- A ChangeTracker records a change stream resume token and an _id
+  watermark, so --incremental runs only look at records changed since
+  the previous run.
+- collections.json caches the collection name each model resolved to,
+  so the scripts never have to list the whole catalogue. It can also be
+  edited by hand to pin a name.
+"""
+
+import os
+import re
+import time
+
+from bson import json_util
+from pymongo.errors import PyMongoError
+
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.state')
+
+# Progress steps between two checkpoint saves
+DEFAULT_CHECKPOINT_EVERY = 10
+
+# State file holding {database: {model: collection name}}
+COLLECTIONS_STATE = 'collections'
+
+
+def state_path(name):
+    """Return the path of the state file called name"""
+    return os.path.join(STATE_DIR, f"{name}.json")
+
+
+def load_state(name):
+    """Load a state file, or return None if it does not exist"""
+    try:
+        with open(state_path(name), encoding='utf-8') as state_file:
+            return json_util.loads(state_file.read())
+    except FileNotFoundError:
+        return None
+
+
+def save_state(name, state):
+    """Write a state file atomically, so a crash never leaves half a file behind"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = state_path(name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as state_file:
+        state_file.write(json_util.dumps(state, indent=2))
+    os.replace(tmp_path, path)
+
+
+def clear_state(name):
+    """Remove a state file if it exists"""
+    try:
+        os.remove(state_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def resolve_collection(db, model, candidates, pattern=None):
+    """
+    Return the name of model's collection in db, or None if there is none.
+
+    A cached name is confirmed with a single listCollections name filter.
+    On a miss the candidate names are tried, then any collection whose
+    name matches pattern (case-insensitive), and the result is cached.
+    """
+    state = load_state(COLLECTIONS_STATE) or {}
+    cached = state.get(db.name, {}).get(model)
+    if cached and db.list_collection_names(filter={'name': cached}):
+        return cached
+
+    # Plain $regex strings, which mongomock's listCollections also accepts
+    exact = '^(?:' + '|'.join(re.escape(candidate) for candidate in candidates) + ')$'
+    found = db.list_collection_names(filter={'name': {'$regex': exact}})
+    name = next((candidate for candidate in candidates if candidate in found), None)
+
+    if name is None and pattern:
+        found = db.list_collection_names(filter={'name': {'$regex': f'(?i){pattern}'}})
+        name = min(found) if found else None
+
+    if name is not None:
+        state.setdefault(db.name, {})[model] = name
+        save_state(COLLECTIONS_STATE, state)
+    return name
+
+
+class Checkpoint:
+    """Progress of a live run, saved every few steps and on failure"""
+
+    def __init__(self, name, database, every=DEFAULT_CHECKPOINT_EVERY):
+        self.name = name
+        self.database = database
+        self.every = max(1, every)
+        self.last_id = None
+        self.totals = None
+        self._steps = 0
+
+    def load(self):
+        """
+        Load the saved progress for this database.
+
+        Returns True if there is progress to resume from.
+        """
+        state = load_state(self.name)
+        if not state or state.get('database') != self.database:
+            return False
+
+        self.last_id = state['last_id']
+        self.totals = state['totals']
+        return True
+
+    def progress(self, last_id, totals):
+        """Record that everything up to last_id is done; save every `every` calls"""
+        self.last_id = last_id
+        self.totals = totals
+        self._steps += 1
+        if self._steps % self.every == 0:
+            self.save()
+
+    def save(self):
+        """Write the current progress to the state file"""
+        if self.last_id is None:
+            return
+        save_state(self.name, {
+            'database': self.database,
+            'last_id': self.last_id,
+            'totals': self.totals,
+        })
+
+    def clear(self):
+        """Forget the saved progress once a run has finished"""
+        clear_state(self.name)
+
+
+def token_reached(token, target):
+    """
+    True if the change stream resume token has reached target. Resume
+    tokens of one deployment sort by their hex-encoded _data.
+    """
+    if not token or not target:
+        return token == target
+    return token['_data'] >= target['_data']
+
+
+class ChangeTracker:
+    """
+    Finds the records of a collection changed since the last incremental run.
+
+    A change stream resumed from the stored token finds every inserted,
+    updated or replaced record. Servers without change streams (a
+    standalone mongod) fall back to an _id watermark, which only finds
+    records inserted since the last run. Without a stored state, the
+    first run is a full run that records the starting point.
+    """
+
+    CHANGE_PIPELINE = [
+        {'$match': {'operationType': {'$in': ['insert', 'update', 'replace']}}},
+        {'$project': {'documentKey': 1}},
+    ]
+
+    # How long a getMore on the change stream waits for new events
+    MAX_AWAIT_TIME_MS = 100
+
+    # How long reading the changes may take to reach the token captured
+    # for this run; the cluster time behind it advances at least every
+    # few seconds even without writes
+    DRAIN_TIMEOUT_SECONDS = 60
+
+    def __init__(self, collection, name, database):
+        self.collection = collection
+        self.name = name
+        self.database = database
+        self.mode = 'full'
+        self._next_state = None
+
+    def pending_query(self):
+        """
+        Return the query selecting the records to process this run.
+
+        Returns None for a full run. The new starting point is captured
+        before anything is read, so changes made while this run is going
+        are picked up by the next one.
+        """
+        state = load_state(self.name)
+        newest = self.collection.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+        self._next_state = {
+            'database': self.database,
+            'collection': self.collection.name,
+            'last_id': newest['_id'] if newest else None,
+            'resume_token': self._current_token(),
+        }
+
+        if not state or state.get('database') != self.database:
+            return None
+
+        if state.get('resume_token') and self._next_state['resume_token']:
+            try:
+                changed = self._changed_since(state['resume_token'], self._next_state['resume_token'])
+                self.mode = 'change-stream'
+                return {'_id': {'$in': sorted(changed)}}
+            except PyMongoError:
+                # The stored token fell off the oplog; use the watermark instead
+                pass
+
+        if state.get('last_id') is not None:
+            self.mode = 'watermark'
+            return {'_id': {'$gt': state['last_id']}}
+
+        return None
+
+    def commit(self):
+        """
+        Store the starting point for the next run. Only call it once this
+        run has handled every pending record; otherwise the next run would
+        not look at the ones left over.
+        """
+        if self._next_state:
+            save_state(self.name, self._next_state)
+
+    def _current_token(self):
+        """Return a resume token for 'now', or None without change streams"""
+        try:
+            with self.collection.watch(self.CHANGE_PIPELINE,
+                                       max_await_time_ms=self.MAX_AWAIT_TIME_MS) as stream:
+                stream.try_next()
+                return stream.resume_token
+        except PyMongoError:
+            return None
+
+    def _changed_since(self, resume_token, until_token):
+        """
+        Collect the _ids of every record changed after resume_token, up to
+        until_token.
+
+        An empty getMore does not mean the stream has caught up, so it is
+        read until its resume token reaches until_token.
+        """
+        changed = set()
+        deadline = time.monotonic() + self.DRAIN_TIMEOUT_SECONDS
+        with self.collection.watch(self.CHANGE_PIPELINE, resume_after=resume_token,
+                                   max_await_time_ms=self.MAX_AWAIT_TIME_MS) as stream:
+            while stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    changed.add(change['documentKey']['_id'])
+                elif token_reached(stream.resume_token, until_token):
+                    break
+                elif time.monotonic() > deadline:
+                    raise RuntimeError("the change stream did not catch up with the current "
+                                       "time; try the incremental run again")
+        return changed
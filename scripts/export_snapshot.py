@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""
+Export attendance, IAT and external marks to a columnar snapshot.
+
+Analytics reports otherwise aggregate the live attendances, IAT and
+externals collections, competing with the app for the primary. This
+script streams the nested records off a secondary and flattens them into
+one typed row per subject, written as compressed Parquet (or Arrow IPC)
+files partitioned by semester:
+
+    SNAPSHOT/attendance/semester=3/part-0.parquet
+    SNAPSHOT/iat/semester=3/part-0.parquet
+    SNAPSHOT/externals/semester=3/part-0.parquet
+    SNAPSHOT/_snapshot.json
+
+Reports then read the snapshot with open_snapshot(), which memory-maps
+the files, and never touch MongoDB. The rows are exported as stored,
+duplicates included; the semesterIndex / monthIndex / subjectIndex
+columns give each row's array positions, so the cleanup's keep-latest
+rules can be applied in the report.
+
+Each dataset is written to a temporary directory and moved into place
+when it is complete, so a report never reads a half-written snapshot.
+
+Usage:
+    python scripts/export_snapshot.py SNAPSHOT [--datasets NAME ...] [--format parquet|arrow]
+                                      [--compression CODEC] [--read-preference MODE]
+                                      [--row-group-size N] [--batch-size N] [--metrics-file PATH]
+
+Requirements:
+    pip install pymongo python-dotenv pyarrow
+"""
+
+import os
+import json
+import shutil
+import argparse
+from datetime import datetime, timezone
+
+from pymongo import ReadPreference
+
+from cleanup_metrics import METRICS, add_metrics_argument
+from cleanup_state import resolve_collection
+from remove_duplicate_attendance import (
+    DEFAULT_BATCH_SIZE,
+    connect_to_mongodb,
+    print_error,
+    print_header,
+    print_info,
+    print_success,
+    print_warning,
+)
+from remove_duplicate_semesters import resolve_semester_collection
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pa_dataset
+    import pyarrow.fs as pa_fs
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+MANIFEST_NAME = '_snapshot.json'
+
+# Rows buffered per semester before they are written out as a row group
+DEFAULT_ROW_GROUP_SIZE = 100_000
+
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+# Default codec of each format; compressed Arrow IPC files cannot be
+# read zero-copy, so they are left uncompressed unless asked otherwise
+DEFAULT_COMPRESSION = {'parquet': 'zstd', 'arrow': None}
+FILE_SUFFIX = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+
+def to_int(value):
+    """Return value as an int, or None when it is not a whole number"""
+    number = to_float(value)
+    return int(number) if number is not None and number.is_integer() else None
+
+
+def to_float(value):
+    """Return value as a float, or None when it is not a number (e.g. 'AB' or '')"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number == number else None
+
+
+def to_text(value):
+    """Return value as a string, or None"""
+    return None if value is None else str(value)
+
+
+def iter_subjects(record, with_months=False):
+    """
+    Yield (semester, month, subject, semester_index, month_index,
+    subject_index) for every subject of a record. month and month_index
+    are None for collections without months.
+    """
+    for semester_index, semester in enumerate(record.get('semesters') or []):
+        if not isinstance(semester, dict):
+            continue
+        if with_months:
+            months = [(month_index, month) for month_index, month in enumerate(semester.get('months') or [])
+                      if isinstance(month, dict)]
+        else:
+            months = [(None, semester)]
+        for month_index, month in months:
+            for subject_index, subject in enumerate(month.get('subjects') or []):
+                if isinstance(subject, dict):
+                    yield semester, month, subject, semester_index, month_index, subject_index
+
+
+def attendance_rows(record):
+    """Flatten an attendance record into one row per subject of every month"""
+    for semester, month, subject, semester_index, month_index, subject_index in iter_subjects(record, True):
+        yield to_int(semester.get('semester')), {
+            'recordId': to_text(record.get('_id')),
+            'userId': to_text(record.get('userId')),
+            'semesterIndex': semester_index,
+            'month': to_int(month.get('month')),
+            'monthIndex': month_index,
+            'overallAttendance': to_float(month.get('overallAttendance')),
+            'subjectIndex': subject_index,
+            'subjectCode': to_text(subject.get('subjectCode')),
+            'subjectName': to_text(subject.get('subjectName')),
+            'attendedClasses': to_float(subject.get('attendedClasses')),
+            'totalClasses': to_float(subject.get('totalClasses')),
+        }
+
+
+def iat_rows(record):
+    """Flatten an IAT record into one row per subject; the marks are stored as text"""
+    for semester, _, subject, semester_index, _, subject_index in iter_subjects(record):
+        row = {
+            'recordId': to_text(record.get('_id')),
+            'userId': to_text(record.get('userId')),
+            'semesterIndex': semester_index,
+            'subjectIndex': subject_index,
+            'subjectCode': to_text(subject.get('subjectCode')),
+            'subjectName': to_text(subject.get('subjectName')),
+        }
+        for field in ('iat1', 'iat2', 'avg'):
+            row[field] = to_float(subject.get(field))
+            row[f'{field}Text'] = to_text(subject.get(field))
+        yield to_int(semester.get('semester')), row
+
+
+def external_rows(record):
+    """Flatten an externals record into one row per subject"""
+    for semester, _, subject, semester_index, _, subject_index in iter_subjects(record):
+        yield to_int(semester.get('semester')), {
+            'recordId': to_text(record.get('_id')),
+            'userId': to_text(record.get('userId')),
+            'semesterIndex': semester_index,
+            'sgpa': to_float(semester.get('sgpa')),
+            'passingDate': to_text(semester.get('passingDate')),
+            'subjectIndex': subject_index,
+            'subjectCode': to_text(subject.get('subjectCode')),
+            'subjectName': to_text(subject.get('subjectName')),
+            'internalMarks': to_float(subject.get('internalMarks')),
+            'externalMarks': to_float(subject.get('externalMarks')),
+            'total': to_float(subject.get('total')),
+            'attempt': to_int(subject.get('attempt')),
+            'result': to_text(subject.get('result')),
+        }
+
+
+# Dataset -> (Mongoose model, flattener, columns)
+DATASETS = {
+    'attendance': ('Attendance', attendance_rows, [
+        ('recordId', 'string'), ('userId', 'string'), ('semesterIndex', 'int32'),
+        ('month', 'int32'), ('monthIndex', 'int32'), ('overallAttendance', 'float64'),
+        ('subjectIndex', 'int32'), ('subjectCode', 'string'), ('subjectName', 'string'),
+        ('attendedClasses', 'float64'), ('totalClasses', 'float64'),
+    ]),
+    'iat': ('Iat', iat_rows, [
+        ('recordId', 'string'), ('userId', 'string'), ('semesterIndex', 'int32'),
+        ('subjectIndex', 'int32'), ('subjectCode', 'string'), ('subjectName', 'string'),
+        ('iat1', 'float64'), ('iat1Text', 'string'), ('iat2', 'float64'), ('iat2Text', 'string'),
+        ('avg', 'float64'), ('avgText', 'string'),
+    ]),
+    'externals': ('External', external_rows, [
+        ('recordId', 'string'), ('userId', 'string'), ('semesterIndex', 'int32'),
+        ('sgpa', 'float64'), ('passingDate', 'string'), ('subjectIndex', 'int32'),
+        ('subjectCode', 'string'), ('subjectName', 'string'), ('internalMarks', 'float64'),
+        ('externalMarks', 'float64'), ('total', 'float64'), ('attempt', 'int32'),
+        ('result', 'string'),
+    ]),
+}
+
+# Only the flattened fields are fetched
+PROJECTIONS = {
+    'attendance': {'userId': 1, 'semesters.semester': 1, 'semesters.months.month': 1,
+                   'semesters.months.overallAttendance': 1,
+                   'semesters.months.subjects.subjectCode': 1,
+                   'semesters.months.subjects.subjectName': 1,
+                   'semesters.months.subjects.attendedClasses': 1,
+                   'semesters.months.subjects.totalClasses': 1},
+    'iat': {'userId': 1, 'semesters.semester': 1, 'semesters.subjects.subjectCode': 1,
+            'semesters.subjects.subjectName': 1, 'semesters.subjects.iat1': 1,
+            'semesters.subjects.iat2': 1, 'semesters.subjects.avg': 1},
+    'externals': {'userId': 1, 'semesters.semester': 1, 'semesters.sgpa': 1,
+                  'semesters.passingDate': 1, 'semesters.subjects': 1},
+}
+
+
+def resolve_dataset_collection(db, dataset):
+    """Return the name of a dataset's collection, or None if there is none"""
+    model = DATASETS[dataset][0]
+    if model == 'Attendance':
+        return resolve_collection(db, model, ['attendances'])
+    return resolve_semester_collection(db, model)
+
+
+def dataset_schema(dataset):
+    """Return the Arrow schema of a dataset's files (the semester lives in the path)"""
+    return pa.schema([(name, pa.type_for_alias(alias)) for name, alias in DATASETS[dataset][2]])
+
+
+def partition_name(semester):
+    """Return the hive-style directory of a semester"""
+    return f"semester={'__HIVE_DEFAULT_PARTITION__' if semester is None else semester}"
+
+
+class PartitionWriter:
+    """
+    Buffers rows per semester and writes them out as row groups
+    (Parquet) or record batches (Arrow IPC), one file per semester.
+    """
+
+    def __init__(self, directory, schema, file_format, compression, row_group_size):
+        self.directory = directory
+        self.schema = schema
+        self.file_format = file_format
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self.buffers = {}
+        self.writers = {}
+        self.rows = {}
+
+    def add(self, semester, row):
+        """Buffer one row, writing its semester's buffer out once it is full"""
+        buffer = self.buffers.setdefault(semester, [])
+        buffer.append(row)
+        if len(buffer) >= self.row_group_size:
+            self.flush(semester)
+
+    def flush(self, semester):
+        """Write the buffered rows of a semester"""
+        buffer = self.buffers.pop(semester, None)
+        if not buffer:
+            return
+        with METRICS.phase('write'):
+            table = pa.Table.from_pylist(buffer, schema=self.schema)
+            self._writer(semester).write_table(table)
+        self.rows[semester] = self.rows.get(semester, 0) + len(buffer)
+
+    def _writer(self, semester):
+        """Return the open file writer of a semester, creating it on first use"""
+        if semester not in self.writers:
+            directory = os.path.join(self.directory, partition_name(semester))
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-0.{FILE_SUFFIX[self.file_format]}")
+            if self.file_format == 'parquet':
+                self.writers[semester] = pq.ParquetWriter(path, self.schema, compression=self.compression or 'none')
+            else:
+                options = pa.ipc.IpcWriteOptions(compression=self.compression)
+                self.writers[semester] = pa.ipc.new_file(path, self.schema, options=options)
+        return self.writers[semester]
+
+    def close(self):
+        """Write every remaining buffer and close the files"""
+        for semester in list(self.buffers):
+            self.flush(semester)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+def export_dataset(collection, dataset, directory, file_format='parquet', compression=None,
+                   row_group_size=DEFAULT_ROW_GROUP_SIZE, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Stream a collection into a dataset directory of the snapshot.
+
+    The files are written under DIRECTORY.tmp and replace the previous
+    export only once complete: the previous export is renamed aside to
+    DIRECTORY.old, the new one renamed in, and only then is the old one
+    deleted. An old export left behind by a crash between the renames is
+    put back first. Returns (records, rows per semester).
+    """
+    _, flatten, _ = DATASETS[dataset]
+    tmp_directory, old_directory = f"{directory}.tmp", f"{directory}.old"
+    if os.path.isdir(old_directory):
+        if os.path.isdir(directory):
+            shutil.rmtree(old_directory)
+        else:
+            os.replace(old_directory, directory)
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+
+    writer = PartitionWriter(tmp_directory, dataset_schema(dataset), file_format, compression, row_group_size)
+    records = 0
+    try:
+        cursor = collection.find({}, PROJECTIONS[dataset], batch_size=batch_size)
+        for record in METRICS.timed(cursor, 'read', 'records_read'):
+            records += 1
+            for semester, row in flatten(record):
+                writer.add(semester, row)
+        writer.close()
+    except BaseException:
+        writer.close()
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        raise
+
+    if os.path.isdir(directory):
+        os.replace(directory, old_directory)
+    os.replace(tmp_directory, directory)
+    shutil.rmtree(old_directory, ignore_errors=True)
+    METRICS.count('rows_written', sum(writer.rows.values()))
+    return records, writer.rows
+
+
+def write_manifest(snapshot, entries):
+    """Record what the snapshot holds and when each dataset was exported"""
+    path = os.path.join(snapshot, MANIFEST_NAME)
+    manifest = {'datasets': {}}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+    manifest['datasets'].update(entries)
+
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def open_snapshot(snapshot, dataset):
+    """
+    Open one dataset of a snapshot as a pyarrow.dataset.Dataset.
+
+    The files are memory-mapped, and the semester partition is a column,
+    so filters on it skip whole directories, e.g.:
+
+        table = open_snapshot('snapshot', 'attendance').to_table(
+            filter=pyarrow.dataset.field('semester') == 3)
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed: pip install pyarrow")
+    with open(os.path.join(snapshot, MANIFEST_NAME), encoding='utf-8') as manifest_file:
+        entry = json.load(manifest_file)['datasets'][dataset]
+
+    partitioning = pa_dataset.partitioning(pa.schema([('semester', pa.int32())]), flavor='hive')
+    return pa_dataset.dataset(
+        os.path.join(snapshot, dataset),
+        schema=dataset_schema(dataset).append(pa.field('semester', pa.int32())),
+        format='parquet' if entry['format'] == 'parquet' else 'ipc',
+        partitioning=partitioning,
+        filesystem=pa_fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def print_export_summary(results):
+    """Print the records read and rows written per dataset"""
+    print("\n" + "="*70)
+    print_info("EXPORT SUMMARY:")
+    for dataset, (collection_name, records, rows) in results.items():
+        print(f"  {dataset} ({collection_name}): {records} records, {sum(rows.values())} rows, "
+              f"{len(rows)} semesters")
+    print("="*70 + "\n")
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Export a columnar analytics snapshot")
+    parser.add_argument('snapshot', metavar='SNAPSHOT', help="snapshot directory")
+    parser.add_argument('--datasets', nargs='+', metavar='NAME',
+                        help=f"datasets to export (default: all of {', '.join(DATASETS)})")
+    parser.add_argument('--format', choices=sorted(FILE_SUFFIX), default='parquet',
+                        help="file format (default: parquet)")
+    parser.add_argument('--compression',
+                        help="codec, e.g. zstd, snappy, lz4 or none (default: zstd for parquet, "
+                             "none for arrow so the files can be read zero-copy)")
+    parser.add_argument('--read-preference', choices=sorted(READ_PREFERENCES), default='secondaryPreferred',
+                        help="members to read from (default: secondaryPreferred)")
+    parser.add_argument('--row-group-size', type=int, default=DEFAULT_ROW_GROUP_SIZE,
+                        help=f"rows per row group and semester (default: {DEFAULT_ROW_GROUP_SIZE})")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"records per cursor batch (default: {DEFAULT_BATCH_SIZE})")
+    add_metrics_argument(parser)
+    args = parser.parse_args(argv)
+
+    unknown = [dataset for dataset in args.datasets or [] if dataset not in DATASETS]
+    if unknown:
+        parser.error(f"unknown datasets: {', '.join(unknown)} (choose from {', '.join(DATASETS)})")
+    if args.compression is None:
+        args.compression = DEFAULT_COMPRESSION[args.format]
+    elif args.compression == 'none':
+        args.compression = None
+    return args
+
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print_header("Analytics Snapshot Export")
+
+    if pa is None:
+        print_error("pyarrow is not installed: pip install pyarrow")
+        return
+
+    db, client = connect_to_mongodb()
+
+    try:
+        # Analytics reads go to a secondary so they do not load the primary
+        source = client.get_database(db.name, read_preference=READ_PREFERENCES[args.read_preference])
+        os.makedirs(args.snapshot, exist_ok=True)
+        results = {}
+
+        for dataset in args.datasets or list(DATASETS):
+            collection_name = resolve_dataset_collection(db, dataset)
+            if collection_name is None:
+                print_warning(f"No collection found for {dataset}, skipping")
+                continue
+
+            print_info(f"Exporting {collection_name} to {dataset}/...")
+            exported_at = datetime.now(timezone.utc).isoformat()
+            records, rows = export_dataset(source[collection_name], dataset,
+                                           os.path.join(args.snapshot, dataset), args.format,
+                                           args.compression, args.row_group_size, args.batch_size)
+            results[dataset] = (collection_name, records, rows)
+            write_manifest(args.snapshot, {dataset: {
+                'collection': collection_name,
+                'database': db.name,
+                'exported_at': exported_at,
+                'format': args.format,
+                'compression': args.compression,
+                'records': records,
+                'rows': {str(semester): count for semester, count in rows.items()},
+            }})
+
+        print_export_summary(results)
+        print_success(f"✓ Snapshot written to {args.snapshot}")
+
+    except Exception as e:
+        print_error(f"\nAn error occurred: {e}")
+        import traceback
+        traceback.print_exc()
+
+    finally:
+        client.close()
+        print_info("\nMongoDB connection closed.")
+        if args.metrics_file:
+            print_info(f"Metrics written to {METRICS.write(args.metrics_file, 'export_snapshot')}")
+
+
+if __name__ == "__main__":
+    main()
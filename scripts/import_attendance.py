@@ -0,0 +1,578 @@
+#!/usr/bin/env python3
+"""
+Bulk-import a monthly attendance sheet (CSV or XLSX).
+
+attendanceController takes one student and month per request: one HTTP
+round-trip, one findOne and one save each. This script imports a whole
+department's sheet in a handful of bulk_writes:
+1. A first pass streams the rows off the file (XLSX in openpyxl's
+   read-only mode) and validates them like the controller does. A row
+   breaking its request rules rejects its whole (student, semester,
+   month), as the controller rejects the whole request. The classes of
+   every (student, semester, month) are summed for overallAttendance
+2. A second pass streams the rows again, dropping the subjects failing
+   attendanceController's isInvalidSubject (is_controller_invalid_subject).
+   Memory stays bounded by the batch of students
+   being built plus a few numbers per (student, semester, month)
+3. The rows of up to --batch-size students are grouped by student, and
+   each student gets one upsert. It merges the subjects into the
+   student's record on the server, the way the controller merges them:
+   - a missing record, semester or month is created
+   - an existing month keeps its valid subjects, by the same rule as the
+     rows, a subject with the same subjectCode (or subjectName) is
+     replaced and new ones are appended
+   - overallAttendance is set from all of the month's rows in the sheet,
+     so a student whose rows are spread over the sheet (e.g. one sorted
+     by subject) and over several batches still gets the right value
+4. The upserts are sent in unordered bulk_write batches. Each bumps the
+   record's version (__v), so a controller save that loaded the record
+   before the import fails instead of overwriting it
+
+Without --apply the sheet is only validated and counted.
+
+The sheet needs a header row with the columns userId, subjectCode,
+subjectName, attendedClasses and totalClasses, plus semester and month
+unless --semester / --month give them for every row. Header matching
+ignores case, spaces and underscores.
+
+Usage:
+    python scripts/import_attendance.py SHEET [--sheet NAME] [--semester N] [--month N]
+                                        [--batch-size N] [--apply] [--metrics-file PATH]
+
+Requirements:
+    pip install pymongo python-dotenv
+    pip install openpyxl   (for .xlsx sheets)
+"""
+
+import re
+import csv
+import argparse
+from collections import Counter
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+
+from cleanup_metrics import METRICS, add_metrics_argument
+from remove_duplicate_attendance import (
+    DEFAULT_BATCH_SIZE,
+    VERSION_BUMP,
+    connect_to_mongodb,
+    print_error,
+    print_header,
+    print_info,
+    print_success,
+    print_warning,
+    send_batch,
+)
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+COLLECTION = 'attendances'
+
+# Normalised header -> field
+COLUMNS = {
+    'userid': 'userId',
+    'semester': 'semester',
+    'month': 'month',
+    'subjectcode': 'subjectCode',
+    'subjectname': 'subjectName',
+    'attendedclasses': 'attendedClasses',
+    'totalclasses': 'totalClasses',
+}
+REQUIRED_COLUMNS = ['userId', 'subjectName', 'attendedClasses', 'totalClasses']
+
+# Row errors printed before the rest are only counted
+MAX_PRINTED_ERRORS = 20
+
+
+def normalise_header(name):
+    """Lower-case a header and drop everything but letters and digits"""
+    return re.sub(r'[^a-z0-9]', '', str(name or '').lower())
+
+
+def iter_csv_rows(path):
+    """Yield the rows of a CSV file, header first"""
+    with open(path, newline='', encoding='utf-8-sig') as sheet_file:
+        yield from csv.reader(sheet_file)
+
+
+def iter_xlsx_rows(path, sheet=None):
+    """Yield the rows of an XLSX worksheet, header first, without loading it all"""
+    if openpyxl is None:
+        raise RuntimeError("openpyxl is not installed: pip install openpyxl")
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.active
+        yield from worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def iter_sheet(path, sheet=None, defaults=None):
+    """
+    Yield (line_number, row) for every data row of a sheet, with row
+    mapping field names to cell values. defaults fill in missing columns.
+    """
+    rows = iter_xlsx_rows(path, sheet) if path.lower().endswith(('.xlsx', '.xlsm')) else iter_csv_rows(path)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    fields = [COLUMNS.get(normalise_header(name)) for name in header]
+    missing = [field for field in REQUIRED_COLUMNS + ['semester', 'month']
+               if field not in fields and field not in (defaults or {})]
+    if missing:
+        raise ValueError(f"{path} has no {', '.join(missing)} column")
+
+    for line_number, values in enumerate(rows, start=2):
+        if not any(value not in (None, '') for value in values):
+            continue
+        row = dict(defaults or {})
+        row.update((field, value) for field, value in zip(fields, values) if field)
+        yield line_number, row
+
+
+def parse_number(value, name):
+    """Parse a cell as a number; blank cells are None"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"{name} is not a number")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} is not a number: {value!r}")
+    return int(number) if number.is_integer() else number
+
+
+def parse_text(value):
+    """Return a cell as stripped text, or None if blank"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value).strip()
+    return text or None
+
+
+def parse_row(row):
+    """
+    Validate one row with the controller's request rules.
+
+    Returns ((userId, semester, month), subject). Raises ValueError for a
+    row the controller would reject.
+    """
+    user_id = parse_text(row.get('userId'))
+    if not user_id or not ObjectId.is_valid(user_id):
+        raise ValueError(f"userId is missing or not an ObjectId: {row.get('userId')!r}")
+
+    semester = parse_number(row.get('semester'), 'semester')
+    month = parse_number(row.get('month'), 'month')
+    if not semester:
+        raise ValueError("semester is missing")
+    if not month:
+        raise ValueError("month is missing")
+
+    subject = {
+        'subjectCode': parse_text(row.get('subjectCode')),
+        'subjectName': parse_text(row.get('subjectName')),
+        'attendedClasses': parse_number(row.get('attendedClasses'), 'attendedClasses'),
+        'totalClasses': parse_number(row.get('totalClasses'), 'totalClasses'),
+    }
+    attended, total = subject['attendedClasses'], subject['totalClasses']
+    if not subject['subjectName']:
+        raise ValueError("subjectName is missing")
+    if attended is None or total is None:
+        raise ValueError("attendedClasses or totalClasses is missing")
+    if attended < 0 or total < 0:
+        raise ValueError("class counts cannot be negative")
+    if attended > total:
+        raise ValueError("attendedClasses cannot be greater than totalClasses")
+
+    return (ObjectId(user_id), semester, month), subject
+
+
+def subject_key(subject):
+    """Return the key the controller merges subjects on: subjectCode, else subjectName"""
+    return subject.get('subjectCode') or subject.get('subjectName')
+
+
+def overall_attendance(attended, total):
+    """Percentage over every subject sent, as checkMinimumAttendance works it out"""
+    return attended / total * 100 if total else 0
+
+
+def key_expr(var):
+    """Server-side subject_key of the subject in variable var"""
+    return {'$cond': [{'$in': [{'$ifNull': [f'$${var}.subjectCode', '']}, ['']]},
+                      f'$${var}.subjectName', f'$${var}.subjectCode']}
+
+
+def is_controller_invalid_subject(subject):
+    """
+    attendanceController's isInvalidSubject, which drops a subject without
+    a name, with 'no data' in it or a numeric one, or without attended or
+    total classes. invalid_expr is the same rule on the server.
+    """
+    name = subject.get('subjectName')
+    if not name:
+        return True
+    name = str(name)
+    if 'no data' in name.lower() or re.fullmatch(r'[0-9]+', name.strip()):
+        return True
+    attended, total = subject.get('attendedClasses'), subject.get('totalClasses')
+    if attended is None or attended is False or attended == '':
+        return True
+    return total is None or total is False or total == '' or total == 0
+
+
+def invalid_expr(var):
+    """Server-side is_controller_invalid_subject of the subject in variable var"""
+    name = {'$toString': {'$ifNull': [f'$${var}.subjectName', '']}}
+    return {'$or': [
+        {'$eq': [name, '']},
+        {'$regexMatch': {'input': name, 'regex': 'no data', 'options': 'i'}},
+        {'$regexMatch': {'input': {'$trim': {'input': name}}, 'regex': '^[0-9]+$'}},
+        {'$in': [{'$ifNull': [f'$${var}.attendedClasses', None]}, [None, '', False]]},
+        {'$in': [{'$ifNull': [f'$${var}.totalClasses', None]}, [None, '', False, 0]]},
+    ]}
+
+
+def replace_at(array, index, replacement):
+    """Expression for array with the element at index (bound as $$item) replaced"""
+    return {'$map': {
+        'input': {'$range': [0, {'$size': array}]},
+        'as': 'i',
+        'in': {'$let': {
+            'vars': {'item': {'$arrayElemAt': [array, '$$i']}},
+            'in': {'$cond': [{'$eq': ['$$i', index]}, replacement, '$$item']},
+        }},
+    }}
+
+
+def merged_subjects_expr(subjects):
+    """
+    Expression merging subjects into the month bound as $$item.
+
+    The month's valid subjects are kept in order, the first one with the
+    key of an incoming subject is replaced by it, and the other incoming
+    subjects are appended.
+    """
+    keys = [subject_key(subject) for subject in subjects]
+    return {'$let': {
+        'vars': {
+            'existing': {'$filter': {
+                'input': {'$ifNull': ['$$item.subjects', []]},
+                'as': 'subject',
+                'cond': {'$not': [invalid_expr('subject')]},
+            }},
+            'incoming': {'$literal': subjects},
+            'incomingKeys': {'$literal': keys},
+        },
+        'in': {'$let': {
+            'vars': {'existingKeys': {'$map': {'input': '$$existing', 'as': 'subject',
+                                               'in': key_expr('subject')}}},
+            'in': {'$concatArrays': [
+                {'$map': {
+                    'input': {'$range': [0, {'$size': '$$existing'}]},
+                    'as': 'i',
+                    'in': {'$let': {
+                        'vars': {
+                            'key': {'$arrayElemAt': ['$$existingKeys', '$$i']},
+                            'subject': {'$arrayElemAt': ['$$existing', '$$i']},
+                        },
+                        'in': {'$cond': [
+                            {'$and': [
+                                {'$in': ['$$key', '$$incomingKeys']},
+                                {'$eq': ['$$i', {'$indexOfArray': ['$$existingKeys', '$$key']}]},
+                            ]},
+                            {'$arrayElemAt': ['$$incoming', {'$indexOfArray': ['$$incomingKeys', '$$key']}]},
+                            '$$subject',
+                        ]},
+                    }},
+                }},
+                {'$filter': {
+                    'input': '$$incoming',
+                    'as': 'subject',
+                    'cond': {'$not': [{'$in': [key_expr('subject'), '$$existingKeys']}]},
+                }},
+            ]},
+        }},
+    }}
+
+
+def month_stage(semester, month, subjects, overall):
+    """
+    Build the $set stage merging one month into the record's semesters,
+    as attendanceController does: the first matching semester and month
+    are updated, a missing one is appended with new subdocument _ids.
+    """
+    new_month = {'_id': ObjectId(), 'month': month, 'subjects': subjects,
+                 'overallAttendance': overall}
+    new_semester = {'_id': ObjectId(), 'semester': semester, 'months': [new_month]}
+
+    months = {'$let': {
+        'vars': {
+            'months': {'$ifNull': ['$$item.months', []]},
+        },
+        'in': {'$let': {
+            'vars': {'index': {'$indexOfArray': [
+                {'$map': {'input': '$$months', 'as': 'm', 'in': '$$m.month'}}, month]}},
+            'in': {'$cond': [
+                {'$eq': ['$$index', -1]},
+                {'$concatArrays': ['$$months', [{'$literal': new_month}]]},
+                replace_at('$$months', '$$index', {'$mergeObjects': [
+                    '$$item',
+                    {'subjects': merged_subjects_expr(subjects), 'overallAttendance': {'$literal': overall}},
+                ]}),
+            ]},
+        }},
+    }}
+
+    return {'$set': {'semesters': {'$let': {
+        'vars': {'semesters': {'$ifNull': ['$semesters', []]}},
+        'in': {'$let': {
+            'vars': {'index': {'$indexOfArray': [
+                {'$map': {'input': '$$semesters', 'as': 's', 'in': '$$s.semester'}}, semester]}},
+            'in': {'$cond': [
+                {'$eq': ['$$index', -1]},
+                {'$concatArrays': ['$$semesters', [{'$literal': new_semester}]]},
+                replace_at('$$semesters', '$$index', {'$mergeObjects': ['$$item', {'months': months}]}),
+            ]},
+        }},
+    }}}}
+
+
+def student_pipeline(months):
+    """
+    Build the update pipeline applying every imported month of a student.
+
+    months maps (semester, month) to (subjects, overall): the valid
+    subjects of the batch and the month's overallAttendance.
+    """
+    stages = []
+    for (semester, month), (subjects, overall) in months.items():
+        subjects = [{key: value for key, value in {'_id': ObjectId(), **subject}.items()
+                     if value is not None}
+                    for subject in subjects]
+        stages.append(month_stage(semester, month, subjects, overall))
+    return stages + [VERSION_BUMP]
+
+
+def build_student_upsert(user_id, months):
+    """Build one upsert of student_pipeline(months) for the student's record"""
+    return UpdateOne({'userId': user_id}, student_pipeline(months), upsert=True)
+
+
+class ImportBatch:
+    """The students of one bulk_write batch, with the valid subjects imported for each"""
+
+    def __init__(self):
+        self.students = {}
+
+    def __len__(self):
+        return len(self.students)
+
+    def add(self, key, subject):
+        """Add a valid row; subjects failing is_controller_invalid_subject are left out"""
+        if is_controller_invalid_subject(subject):
+            return False
+        user_id, semester, month = key
+        subjects = self.students.setdefault(user_id, {}).setdefault((semester, month), {})
+        # A repeated subject replaces the earlier row, like a repeated upload
+        subjects[subject_key(subject)] = subject
+        return True
+
+    def operations(self, month_totals):
+        """
+        Return the upserts of the batch. overallAttendance comes from
+        month_totals, so a month split over several batches gets the value
+        of all its rows in every upsert.
+        """
+        operations = []
+        for user_id, months in self.students.items():
+            kept = {}
+            for (semester, month), subjects in months.items():
+                attended, total = month_totals[(user_id, semester, month)][:2]
+                kept[(semester, month)] = (list(subjects.values()), overall_attendance(attended, total))
+            operations.append(build_student_upsert(user_id, kept))
+        return operations
+
+
+def flush_batch(collection, batch, batch_number, month_totals, totals, apply):
+    """Send the upserts of one batch of students"""
+    operations = batch.operations(month_totals)
+    totals['upserts'] += len(operations)
+    if not apply or not operations:
+        return
+
+    matched, _, upserted, failed = send_batch(collection, operations, batch_number)
+    totals['created'] += upserted
+    totals['updated'] += matched
+    totals['failed'] += failed
+
+
+def row_month(row):
+    """Return the (userId, semester, month) of a rejected row, or None if it has none"""
+    try:
+        user_id = parse_text(row.get('userId'))
+        return (ObjectId(user_id), parse_number(row.get('semester'), 'semester'),
+                parse_number(row.get('month'), 'month'))
+    except (TypeError, ValueError, InvalidId):
+        return None
+
+
+def scan_sheet(path, sheet, defaults, totals):
+    """
+    Validate every row of a sheet, printing the first errors.
+
+    Returns (rejected, month_totals): the set of (userId, semester, month)
+    with a rejected row, and for every other one [attended, total, valid]
+    summed over all its rows, wherever they are in the sheet. valid counts
+    the rows passing is_controller_invalid_subject.
+    """
+    rejected = set()
+    month_totals = {}
+    errors_printed = 0
+
+    for line_number, row in METRICS.timed(iter_sheet(path, sheet, defaults), 'validate'):
+        totals['rows'] += 1
+        try:
+            key, subject = parse_row(row)
+        except ValueError as e:
+            totals['rows_rejected'] += 1
+            if errors_printed < MAX_PRINTED_ERRORS:
+                print_warning(f"  Line {line_number}: {e}")
+                errors_printed += 1
+            rejected.add(row_month(row))
+            continue
+
+        month_total = month_totals.setdefault(key, [0, 0, 0])
+        month_total[0] += subject['attendedClasses']
+        month_total[1] += subject['totalClasses']
+        month_total[2] += not is_controller_invalid_subject(subject)
+
+    if totals['rows_rejected'] > errors_printed:
+        print_warning(f"  ... and {totals['rows_rejected'] - errors_printed} more rejected rows")
+    rejected.discard(None)
+    for key in rejected:
+        month_totals.pop(key, None)
+    return rejected, month_totals
+
+
+def import_sheet(db, path, sheet=None, defaults=None, batch_size=DEFAULT_BATCH_SIZE, apply=False):
+    """
+    Import one sheet. Returns the totals: rows read and rejected, invalid
+    subjects dropped, months rejected, students and months imported, the
+    upserts sent and the records created, updated and failed.
+
+    The rows of a student need not be next to each other: a student
+    spread over several batches gets one upsert per batch, each merging
+    its part of the subjects.
+    """
+    collection = db[COLLECTION]
+    totals = Counter()
+    rejected, month_totals = scan_sheet(path, sheet, defaults, totals)
+    totals['months_rejected'] = len(rejected)
+    totals['months'] = sum(1 for month_total in month_totals.values() if month_total[2])
+    totals['months_without_valid_subjects'] = len(month_totals) - totals['months']
+    totals['students'] = len({user_id for (user_id, _, _), month_total in month_totals.items()
+                              if month_total[2]})
+    batch = ImportBatch()
+    batch_number = 0
+
+    for _, row in METRICS.timed(iter_sheet(path, sheet, defaults), 'read', 'rows_read'):
+        try:
+            key, subject = parse_row(row)
+        except ValueError:
+            continue
+        if key in rejected:
+            continue
+
+        if key[0] not in batch.students and len(batch) >= batch_size:
+            batch_number += 1
+            flush_batch(collection, batch, batch_number, month_totals, totals, apply)
+            batch = ImportBatch()
+
+        if not batch.add(key, subject):
+            totals['invalid_subjects'] += 1
+
+    if len(batch):
+        flush_batch(collection, batch, batch_number + 1, month_totals, totals, apply)
+
+    return totals
+
+
+def print_import_summary(totals, apply):
+    """Print the totals of an import"""
+    print("\n" + "="*70)
+    print_info("IMPORT SUMMARY:")
+    print(f"  Rows read: {totals['rows']}")
+    print(f"  Rows rejected: {totals['rows_rejected']}")
+    print(f"  Invalid subjects dropped: {totals['invalid_subjects']}")
+    print(f"  Months rejected with their rows: {totals['months_rejected']}")
+    print(f"  Months without a valid subject: {totals['months_without_valid_subjects']}")
+    print(f"  Students {'imported' if apply else 'to import'}: {totals['students']}")
+    print(f"  Months {'imported' if apply else 'to import'}: {totals['months']}")
+    print(f"  Upserts {'sent' if apply else 'to send'}: {totals['upserts']}")
+    if apply:
+        print(f"  Records created: {totals['created']}")
+        print(f"  Upserts updating an existing record: {totals['updated']}")
+        print(f"  Upserts failed: {totals['failed']}")
+    print("="*70 + "\n")
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Bulk-import an attendance sheet")
+    parser.add_argument('path', metavar='SHEET', help="CSV or XLSX file to import")
+    parser.add_argument('--sheet', help="worksheet of an XLSX file (default: the active one)")
+    parser.add_argument('--semester', type=int, help="semester of every row without a semester column")
+    parser.add_argument('--month', type=int, help="month of every row without a month column")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"students per bulk_write batch (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--apply', action='store_true',
+                        help="write the records; without it the sheet is only validated")
+    add_metrics_argument(parser)
+    return parser.parse_args(argv)
+
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print_header("Attendance Sheet Import")
+
+    if not args.apply:
+        print_warning("⚠ DRY RUN MODE - pass --apply to write the records")
+
+    defaults = {field: value for field, value in
+                (('semester', args.semester), ('month', args.month)) if value is not None}
+
+    db, client = connect_to_mongodb()
+
+    try:
+        print_info(f"Reading {args.path}...")
+        totals = import_sheet(db, args.path, args.sheet, defaults, args.batch_size, args.apply)
+        print_import_summary(totals, args.apply)
+        if args.apply:
+            print_success("✓ Attendance import complete!")
+
+    except Exception as e:
+        print_error(f"\nAn error occurred: {e}")
+        import traceback
+        traceback.print_exc()
+
+    finally:
+        client.close()
+        print_info("\nMongoDB connection closed.")
+        if args.metrics_file:
+            print_info(f"Metrics written to {METRICS.write(args.metrics_file, 'import_attendance')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Single-pass maintenance engine for the attendance and IAT collections.
+
+Runs the cleanup rules of remove_duplicate_attendance.py,
+remove_cumulative_subjects.py and remove_duplicate_iat_semesters.py together:
+1. semester-dedup   - duplicate semesters, keeps latest (attendance and IAT)
+2. month-dedup      - duplicate months within a semester, keeps latest
+3. subject-dedup    - duplicate subjects within a month (by subjectCode or subjectName)
+4. invalid-subjects - subjects with "No Data" or invalid values
+5. cumulative       - subjects named 'cumulative'
+
+Each collection is read in a single cursor pass, and every record that
+needs cleaning gets one combined update covering all enabled rules. The
+updates are guarded by the record's version (__v); a record saved
+between the read and the write is read, planned and retried again
+through the attendance cleanup's write_cleaned_batch loop.
+Without --apply the pass only reports what would change.
+
+Usage:
+    python scripts/maintenance_engine.py [--rules RULE ...] [--batch-size N] [--apply]
+                                         [--metrics-file PATH]
+
+Requirements:
+    pip install pymongo python-dotenv
+"""
+
+import argparse
+
+from cleanup_metrics import METRICS, add_metrics_argument
+from remove_duplicate_attendance import (
+    ATTENDANCE_PROJECTION,
+    DEFAULT_BATCH_SIZE,
+    VERSION_FIELD,
+    build_guarded_update,
+    build_plan_diff,
+    build_plan_update,
+    chunked,
+    connect_to_mongodb,
+    empty_changes,
+    is_invalid_subject,
+    needs_cleaning,
+    plan_attendance_cleanup,
+    print_error,
+    print_header,
+    print_info,
+    print_success,
+    print_warning,
+    write_cleaned_batch,
+)
+from remove_cumulative_subjects import is_cumulative_subject
+from remove_duplicate_iat_semesters import (
+    IAT_PROJECTION,
+    build_keep_diff,
+    build_keep_update,
+    keep_latest_indexes,
+    resolve_iat_collection,
+)
+from pymongo import UpdateOne
+
+
+RULES = ['semester-dedup', 'month-dedup', 'subject-dedup', 'invalid-subjects', 'cumulative']
+
+
+def attendance_pass(rules):
+    """Build the attendance pass for the enabled rules, or None if none apply"""
+    subject_filters = {}
+    if 'invalid-subjects' in rules:
+        subject_filters['invalid_subjects'] = is_invalid_subject
+    if 'cumulative' in rules:
+        subject_filters['cumulative_subjects'] = is_cumulative_subject
+
+    options = {
+        'dedup_semesters': 'semester-dedup' in rules,
+        'dedup_months': 'month-dedup' in rules,
+        'dedup_subjects': 'subject-dedup' in rules,
+        'subject_filters': subject_filters,
+    }
+    if not any(options.values()):
+        return None
+
+    def plan(record):
+        record_plan, changes = plan_attendance_cleanup(record, **options)
+        return (record_plan if needs_cleaning(record_plan, changes) else None), changes
+
+    return {
+        'collection': 'attendances',
+        'projection': ATTENDANCE_PROJECTION,
+        'counters': list(empty_changes()) + list(subject_filters),
+        'plan': plan,
+        'build_update': build_plan_update,
+        'build_diff': build_plan_diff,
+    }
+
+
+def iat_pass(db, rules):
+    """Build the IAT pass for the enabled rules, or None if none apply"""
+    if 'semester-dedup' not in rules:
+        return None
+
+    collection_name = resolve_iat_collection(db)
+    if not collection_name:
+        print_warning("Could not find IAT collection, skipping it")
+        return None
+
+    def plan(record):
+        semesters = record.get('semesters') or []
+        keep_indexes = keep_latest_indexes(semesters)
+        changes = {'duplicate_semesters': len(semesters) - len(keep_indexes)}
+        return (keep_indexes if changes['duplicate_semesters'] else None), changes
+
+    return {
+        'collection': collection_name,
+        'projection': IAT_PROJECTION,
+        'counters': ['duplicate_semesters'],
+        'plan': plan,
+        'build_update': build_keep_update,
+        'build_diff': lambda record, keep_indexes: build_keep_diff(record.get('semesters') or [],
+                                                                   keep_indexes),
+    }
+
+
+def plan_update(maintenance_pass, record):
+    """
+    Return (item, changes) for a record: item is its combined update, or
+    None if the record needs no cleaning.
+    """
+    with METRICS.phase('clean'):
+        plan, changes = maintenance_pass['plan'](record)
+    if plan is None:
+        return None, changes
+
+    diff = maintenance_pass['build_diff'](record, plan)
+    METRICS.count('array_diff_updates' if diff else 'array_rewrites')
+    return {
+        '_id': record['_id'],
+        'version': record.get(VERSION_FIELD),
+        'update': diff['update'] if diff else maintenance_pass['build_update'](plan),
+        'array_filters': diff and diff['array_filters'],
+    }, changes
+
+
+def build_item_update(item):
+    """Return the version-guarded UpdateOne of a planned item"""
+    return UpdateOne(*build_guarded_update(item['_id'], item['version'], item['update']),
+                     array_filters=item['array_filters'])
+
+
+def iter_planned_updates(collection, maintenance_pass, totals, batch_size):
+    """
+    Yield one combined update per record that needs cleaning.
+
+    The changes of every dirty record are added to totals as it is read.
+    """
+    cursor = collection.find({}, maintenance_pass['projection'], batch_size=batch_size)
+    for record in METRICS.timed(cursor, 'read', 'documents_scanned'):
+        item, changes = plan_update(maintenance_pass, record)
+        if item is None:
+            continue
+
+        METRICS.count('documents_dirty')
+        for key, value in changes.items():
+            totals[key] = totals.get(key, 0) + value
+        yield item
+
+
+def replan_records(collection, record_ids, maintenance_pass):
+    """Read records again and return the updates of the ones that still need cleaning"""
+    cursor = collection.find({'_id': {'$in': record_ids}}, maintenance_pass['projection'])
+    return [item for item, _ in (plan_update(maintenance_pass, record) for record in cursor) if item]
+
+
+def run_pass(db, maintenance_pass, batch_size=DEFAULT_BATCH_SIZE, apply=False):
+    """
+    Run one collection pass.
+
+    Returns (records_count, totals, updated_count, conflicts); conflicts
+    counts the records that kept changing through every retry.
+    """
+    collection = db[maintenance_pass['collection']]
+    print_info(f"Scanning {maintenance_pass['collection']}...")
+
+    totals = {key: 0 for key in maintenance_pass['counters']}
+    records_count = 0
+    updated_count = 0
+    conflicts = 0
+    updates = iter_planned_updates(collection, maintenance_pass, totals, batch_size)
+
+    for batch_number, batch in enumerate(chunked(updates, batch_size), start=1):
+        records_count += len(batch)
+        if apply:
+            _, modified, _, batch_conflicts = write_cleaned_batch(
+                collection, batch, batch_number, build=build_item_update,
+                reclean=lambda collection, record_ids: replan_records(collection, record_ids,
+                                                                      maintenance_pass))
+            updated_count += modified
+            conflicts += batch_conflicts
+
+    return records_count, totals, updated_count, conflicts
+
+
+def print_pass_summary(collection_name, records_count, totals, updated_count, apply, conflicts=0):
+    """Print the totals of one collection pass"""
+    print("\n" + "="*70)
+    print_info(f"{collection_name.upper()} SUMMARY:")
+    if apply:
+        print(f"  Records updated: {updated_count} of {records_count}")
+    else:
+        print(f"  Records to update: {records_count}")
+    for key, value in totals.items():
+        print(f"  {key.replace('_', ' ').capitalize()}: {value}")
+    if conflicts:
+        print_warning(f"{conflicts} records changed during the run; re-run to clean them")
+    print("="*70 + "\n")
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Run the attendance and IAT cleanup rules in one pass")
+    parser.add_argument('--rules', nargs='+', choices=RULES, default=RULES,
+                        help="rules to run (default: all)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"cursor batch and bulk_write batch size (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--apply', action='store_true',
+                        help="write the changes; without it the pass only reports them")
+    add_metrics_argument(parser)
+    return parser.parse_args(argv)
+
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print_header("Attendance & IAT Maintenance")
+
+    if not args.apply:
+        print_warning("⚠ DRY RUN MODE - pass --apply to write the changes")
+
+    db, client = connect_to_mongodb()
+
+    try:
+        passes = [attendance_pass(args.rules), iat_pass(db, args.rules)]
+
+        for maintenance_pass in filter(None, passes):
+            records_count, totals, updated_count, conflicts = run_pass(
+                db, maintenance_pass, args.batch_size, args.apply)
+            print_pass_summary(maintenance_pass['collection'], records_count,
+                               totals, updated_count, args.apply, conflicts)
+
+        if args.apply:
+            print_success("✓ Maintenance run complete!")
+
+    except Exception as e:
+        print_error(f"\nAn error occurred: {e}")
+        import traceback
+        traceback.print_exc()
+
+    finally:
+        client.close()
+        print_info("\nMongoDB connection closed.")
+        if args.metrics_file:
+            print_info(f"Metrics written to {METRICS.write(args.metrics_file, 'maintenance_engine')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Migrate attendance into one document per (userId, semester, month).
+
+The nested attendances layout (one document per student holding every
+semester, month and subject) is what lets duplicates in: the controller
+looks semesters and months up with findIndex and pushes a new entry when
+it misses. In the flattened collection every month is its own document,
+and a unique index on (userId, semester, month) rejects a duplicate at
+write time.
+
+Steps:
+1. build  - stream every attendance record through clean_attendance_record
+            and insert its months, in unordered insert_many batches, into
+            a staging collection that already has the unique index. A
+            month repeated within a batch is dropped on the client, as an
+            unordered batch does not insert in order
+2. verify - check the staging collection against the cleaned source: the
+            unique index, the month, subject and class totals, and a random
+            sample of records compared month by month. Class totals are
+            compared with a small tolerance, as float sums can differ in
+            their last digits between the client and the server
+3. swap   - verify, then rename the staging collection over the target in
+            one renameCollection with dropTarget, so the target is never
+            missing. An existing target is first copied to <target>_previous;
+            the swap refuses to run while an earlier <target>_previous exists
+
+attendances itself is never modified. Each flattened document holds
+userId, semester, month, subjects, overallAttendance and attendanceId
+(the _id of the source record).
+
+Usage:
+    python scripts/migrate_flatten_attendance.py [build] [verify] [swap]
+                                                 [--target NAME] [--batch-size N]
+                                                 [--sample N] [--metrics-file PATH]
+
+Without steps, build and verify run.
+
+Requirements:
+    pip install pymongo python-dotenv
+"""
+
+import math
+import argparse
+from numbers import Number
+
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from cleanup_metrics import METRICS, add_metrics_argument
+from remove_duplicate_attendance import (
+    DEFAULT_BATCH_SIZE,
+    chunked,
+    clean_attendance_record,
+    connect_to_mongodb,
+    print_error,
+    print_header,
+    print_info,
+    print_success,
+    print_warning,
+)
+
+
+SOURCE_COLLECTION = 'attendances'
+DEFAULT_TARGET = 'attendancemonths'
+
+# The key a flattened document is unique on
+FLAT_KEY = [('userId', ASCENDING), ('semester', ASCENDING), ('month', ASCENDING)]
+FLAT_INDEX_NAME = 'userId_semester_month'
+
+# Source records compared month by month during verify
+DEFAULT_SAMPLE_SIZE = 200
+
+# MongoDB's duplicate key error
+DUPLICATE_KEY = 11000
+
+# Totals that add up class counts, which may be floats, and the relative
+# difference allowed between their client and server sums
+CLASS_TOTALS = ('attended_classes', 'total_classes')
+CLASS_TOTAL_TOLERANCE = 1e-9
+
+STEPS = ['build', 'verify', 'swap']
+
+
+def staging_name(target):
+    """Return the name of the staging collection for target"""
+    return f"{target}_staging"
+
+
+def flatten_record(record):
+    """Yield one flattened month document per month of a cleaned record"""
+    for semester in record.get('semesters') or []:
+        for month in semester.get('months') or []:
+            yield {
+                'userId': record.get('userId'),
+                'semester': semester.get('semester'),
+                'month': month.get('month'),
+                'subjects': month.get('subjects') or [],
+                'overallAttendance': month.get('overallAttendance'),
+                'attendanceId': record['_id'],
+            }
+
+
+def iter_flat_documents(collection, batch_size=DEFAULT_BATCH_SIZE, query=None):
+    """
+    Yield the flattened months of every attendance record, cleaned first.
+
+    Records are read in _id order, so when two records share a userId the
+    older one's months are inserted first and win.
+    """
+    cursor = collection.find(query or {}, batch_size=batch_size, sort=[('_id', ASCENDING)])
+    for record in METRICS.timed(cursor, 'read', 'documents_scanned'):
+        with METRICS.phase('clean'):
+            cleaned, _ = clean_attendance_record(record)
+        if cleaned is not None:
+            yield from flatten_record(cleaned)
+
+
+def create_flat_index(collection):
+    """Create the unique (userId, semester, month) index"""
+    collection.create_index(FLAT_KEY, unique=True, name=FLAT_INDEX_NAME)
+
+
+def first_per_key(documents):
+    """
+    Return (documents, repeated): the first document of each (userId,
+    semester, month) in the batch, and how many later ones were dropped.
+    """
+    seen = set()
+    unique = []
+    for document in documents:
+        key = (document['userId'], document['semester'], document['month'])
+        if key not in seen:
+            seen.add(key)
+            unique.append(document)
+    return unique, len(documents) - len(unique)
+
+
+def insert_batch(collection, documents, batch_number):
+    """
+    Insert one unordered insert_many batch.
+
+    The server may apply an unordered batch in any order, so a month
+    repeated within the batch is dropped here and the earlier (older)
+    one is kept. Returns (inserted, duplicates, failed); duplicates are
+    months whose (userId, semester, month) is earlier in the batch or
+    already in the collection.
+    """
+    documents, repeated = first_per_key(documents)
+    with METRICS.phase('write'):
+        try:
+            inserted = len(collection.insert_many(documents, ordered=False).inserted_ids)
+            duplicates = failed = 0
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            inserted = e.details.get('nInserted', 0)
+            duplicates = sum(1 for error in errors if error.get('code') == DUPLICATE_KEY)
+            failed = len(errors) - duplicates
+            if failed:
+                print_error(f"  Batch {batch_number}: {failed} write error(s)")
+    duplicates += repeated
+
+    METRICS.count('write_batches')
+    METRICS.count('documents_inserted', inserted)
+    METRICS.count('duplicate_keys', duplicates)
+    METRICS.count('write_errors', failed)
+    return inserted, duplicates, failed
+
+
+def build_staging(db, target, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Rebuild the staging collection from the attendance records.
+
+    Returns a dict with the months inserted, the months rejected by the
+    unique index and the failed inserts.
+    """
+    staging = db[staging_name(target)]
+    staging.drop()
+    create_flat_index(staging)
+    print_info(f"Building {staging.name} from {SOURCE_COLLECTION}...")
+
+    totals = {'inserted': 0, 'duplicates': 0, 'failed': 0}
+    documents = iter_flat_documents(db[SOURCE_COLLECTION], batch_size)
+    for batch_number, batch in enumerate(chunked(documents, batch_size), start=1):
+        inserted, duplicates, failed = insert_batch(staging, batch, batch_number)
+        totals['inserted'] += inserted
+        totals['duplicates'] += duplicates
+        totals['failed'] += failed
+
+    print_info(f"Inserted {totals['inserted']} month documents")
+    if totals['duplicates']:
+        print_warning(f"{totals['duplicates']} months of records sharing a userId were "
+                      f"already inserted from an older record and were skipped")
+    if totals['failed']:
+        print_error(f"{totals['failed']} month documents failed to insert")
+    return totals
+
+
+def class_sum(subjects, field):
+    """Add up a class count over subjects, skipping non-numbers like $sum does"""
+    return sum(subject.get(field) for subject in subjects
+               if isinstance(subject.get(field), Number) and not isinstance(subject.get(field), bool))
+
+
+def empty_totals():
+    """Return the zeroed totals compared by verify"""
+    return {'months': 0, 'users': 0, 'subjects': 0, 'attended_classes': 0, 'total_classes': 0}
+
+
+def add_month_totals(totals, document):
+    """Add one flattened month to totals (users are counted separately)"""
+    totals['months'] += 1
+    totals['subjects'] += len(document['subjects'])
+    totals['attended_classes'] += class_sum(document['subjects'], 'attendedClasses')
+    totals['total_classes'] += class_sum(document['subjects'], 'totalClasses')
+
+
+def shared_user_ids(collection):
+    """Return the userIds held by more than one attendance record"""
+    pipeline = [
+        {'$group': {'_id': '$userId', 'records': {'$sum': 1}}},
+        {'$match': {'records': {'$gt': 1}}},
+    ]
+    return {group['_id'] for group in collection.aggregate(pipeline, allowDiskUse=True)}
+
+
+def expected_totals(db, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Work out the staging totals from the cleaned source records.
+
+    Only the keys of users with more than one record are remembered, to
+    leave out the months the unique index rejects.
+    """
+    source = db[SOURCE_COLLECTION]
+    shared = shared_user_ids(source)
+    seen_keys = set()
+    users = set()
+    totals = empty_totals()
+
+    for document in iter_flat_documents(source, batch_size):
+        if document['userId'] in shared:
+            key = (document['userId'], document['semester'], document['month'])
+            if key in seen_keys:
+                continue
+            seen_keys.add(key)
+        users.add(document['userId'])
+        add_month_totals(totals, document)
+
+    totals['users'] = len(users)
+    return totals
+
+
+def staging_totals(collection):
+    """Return the totals of the staging collection, added up on the server"""
+    pipeline = [
+        {'$group': {
+            '_id': '$userId',
+            'months': {'$sum': 1},
+            'subjects': {'$sum': {'$size': '$subjects'}},
+            'attended_classes': {'$sum': {'$sum': '$subjects.attendedClasses'}},
+            'total_classes': {'$sum': {'$sum': '$subjects.totalClasses'}},
+        }},
+        {'$group': {
+            '_id': None,
+            'users': {'$sum': 1},
+            'months': {'$sum': '$months'},
+            'subjects': {'$sum': '$subjects'},
+            'attended_classes': {'$sum': '$attended_classes'},
+            'total_classes': {'$sum': '$total_classes'},
+        }},
+    ]
+    totals = next(collection.aggregate(pipeline, allowDiskUse=True), None)
+    if not totals:
+        return empty_totals()
+    return {key: totals[key] for key in empty_totals()}
+
+
+def totals_match(key, expected, actual):
+    """Compare one total; class totals may differ by float rounding"""
+    if key in CLASS_TOTALS:
+        return math.isclose(actual, expected, rel_tol=CLASS_TOTAL_TOLERANCE, abs_tol=CLASS_TOTAL_TOLERANCE)
+    return actual == expected
+
+
+def has_flat_index(collection):
+    """Check that the unique (userId, semester, month) index exists"""
+    for index in collection.list_indexes():
+        if list(index['key'].items()) == FLAT_KEY and index.get('unique'):
+            return True
+    return False
+
+
+def sample_mismatches(db, staging, sample_size):
+    """
+    Compare a random sample of cleaned source records with their months in
+    staging. Returns a list of (userId, semester, month) that differ.
+    """
+    source = db[SOURCE_COLLECTION]
+    shared = shared_user_ids(source)
+    mismatches = []
+
+    for record in source.aggregate([{'$sample': {'size': sample_size}}]):
+        if record.get('userId') in shared:
+            continue
+        cleaned, _ = clean_attendance_record(record)
+        expected = list(flatten_record(cleaned)) if cleaned is not None else []
+        stored = {(document['semester'], document['month']): document
+                  for document in staging.find({'userId': record.get('userId')}, {'_id': 0})}
+
+        for document in expected:
+            key = (document['semester'], document['month'])
+            if stored.pop(key, None) != document:
+                mismatches.append((record.get('userId'), *key))
+        mismatches.extend((record.get('userId'), *key) for key in stored)
+
+    return mismatches
+
+
+def verify_staging(db, target, batch_size=DEFAULT_BATCH_SIZE, sample_size=DEFAULT_SAMPLE_SIZE):
+    """Check the staging collection against the cleaned source; returns True if it matches"""
+    staging = db[staging_name(target)]
+    print_info(f"Verifying {staging.name}...")
+    problems = []
+
+    if not has_flat_index(staging):
+        problems.append("the unique (userId, semester, month) index is missing")
+
+    with METRICS.phase('verify'):
+        expected = expected_totals(db, batch_size)
+        actual = staging_totals(staging)
+    for key, value in expected.items():
+        matched = totals_match(key, value, actual[key])
+        print(f"  {'✓' if matched else '✗'} {key.replace('_', ' ').capitalize()}: expected {value}, found {actual[key]}")
+        if not matched:
+            problems.append(f"{key} differ")
+
+    with METRICS.phase('verify'):
+        mismatches = sample_mismatches(db, staging, sample_size)
+    for user_id, semester, month in mismatches[:10]:
+        print_warning(f"  userId {user_id}, semester {semester}, month {month} differs from the source")
+    if mismatches:
+        problems.append(f"{len(mismatches)} sampled months differ")
+
+    if problems:
+        print_error(f"Verification failed: {'; '.join(problems)}")
+        return False
+
+    print_success(f"✓ {staging.name} matches the cleaned {SOURCE_COLLECTION}")
+    return True
+
+
+def previous_name(target):
+    """Return the name of the copy of target kept by swap"""
+    return f"{target}_previous"
+
+
+def swap_staging(db, target):
+    """
+    Rename the staging collection over target, keeping a copy of the old
+    target as <target>_previous. The rename drops the old target in the
+    same command, so readers never find target missing.
+
+    An earlier <target>_previous is never overwritten: the swap refuses
+    to run until it is dropped. Returns True if the swap ran.
+    """
+    existing = set(db.list_collection_names())
+    if target in existing:
+        if previous_name(target) in existing:
+            print_error(f"{previous_name(target)} already exists; drop it once it is no longer "
+                        f"needed and run the swap again")
+            return False
+        db[target].aggregate([{'$match': {}}, {'$out': previous_name(target)}], allowDiskUse=True)
+        print_info(f"Copied the old {target} to {previous_name(target)}")
+    db[staging_name(target)].rename(target, dropTarget=True)
+    print_success(f"✓ {staging_name(target)} is now {target}")
+    return True
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Flatten attendance into per-month documents")
+    parser.add_argument('steps', nargs='*', metavar='STEP',
+                        help=f"steps to run: {', '.join(STEPS)} (default: build verify)")
+    parser.add_argument('--target', default=DEFAULT_TARGET,
+                        help=f"flattened collection name (default: {DEFAULT_TARGET})")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"cursor batch and insert_many batch size (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--sample', type=int, default=DEFAULT_SAMPLE_SIZE,
+                        help=f"source records compared month by month (default: {DEFAULT_SAMPLE_SIZE})")
+    add_metrics_argument(parser)
+    args = parser.parse_args(argv)
+
+    unknown = [step for step in args.steps if step not in STEPS]
+    if unknown:
+        parser.error(f"unknown step(s): {', '.join(unknown)} (choose from {', '.join(STEPS)})")
+    return args
+
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    steps = [step for step in STEPS if step in (args.steps or ['build', 'verify'])]
+    print_header("Attendance Flattening Migration")
+
+    db, client = connect_to_mongodb()
+
+    try:
+        if staging_name(args.target) not in db.list_collection_names() and 'build' not in steps:
+            print_error(f"{staging_name(args.target)} does not exist; run the build step first")
+            return
+
+        if 'build' in steps:
+            build_staging(db, args.target, args.batch_size)
+
+        verified = False
+        if 'verify' in steps or 'swap' in steps:
+            verified = verify_staging(db, args.target, args.batch_size, args.sample)
+
+        if 'swap' in steps:
+            if verified:
+                swap_staging(db, args.target)
+            else:
+                print_warning("Not swapping: fix the problems above and run again")
+
+    except Exception as e:
+        print_error(f"\nAn error occurred: {e}")
+        import traceback
+        traceback.print_exc()
+
+    finally:
+        client.close()
+        print_info("\nMongoDB connection closed.")
+        if args.metrics_file:
+            print_info(f"Metrics written to {METRICS.write(args.metrics_file, 'migrate_flatten_attendance')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,16 @@
 """
 Script to remove subjects with name 'cumulative' from attendance records
+
+Without --apply only a dry run is made. The module can also be imported:
+nothing connects until one of the functions is called, and they all share
+one pooled client (close it with close_client()).
+
+Usage:
+    python scripts/remove_cumulative_subjects.py [--mode server|scan] [--apply]
 """
 import os
+import re
+import argparse
 import sys
 from pymongo import MongoClient
 from dotenv import load_dotenv
@@ -14,51 +23,84 @@ class Colors:
     RED = '\033[91m'
     RESET = '\033[0m'
 
-# Load environment variables from the backend directory
-script_dir = os.path.dirname(os.path.abspath(__file__))
-backend_dir = os.path.dirname(script_dir)
-env_path = os.path.join(backend_dir, '.env')
-
-print(f"{Colors.CYAN}Loading environment from: {env_path}{Colors.RESET}")
-load_dotenv(env_path)
-
-# MongoDB connection
-MONGO_URI = os.getenv('MONGODB_URI')
-if not MONGO_URI:
-    print(f"{Colors.RED}ERROR: MONGODB_URI not found in .env file{Colors.RESET}")
-    sys.exit(1)
-
-print(f"{Colors.CYAN}Connecting to MongoDB...{Colors.RESET}")
-try:
-    client = MongoClient(MONGO_URI)
-    # Test the connection
-    client.server_info()
-    print(f"{Colors.GREEN}✓ Connected to MongoDB successfully{Colors.RESET}\n")
-except Exception as e:
-    print(f"{Colors.RED}ERROR: Could not connect to MongoDB: {e}{Colors.RESET}")
-    sys.exit(1)
-
-# Auto-detect database name from URI or use default
-if '/cmrit' in MONGO_URI:
-    db_name = 'cmrit'
-else:
-    db_name = 'test'
-
-print(f"{Colors.CYAN}Using database: {db_name}{Colors.RESET}")
-db = client[db_name]
-
-# List available collections to help debug
-collections = db.list_collection_names()
-print(f"{Colors.CYAN}Available collections: {', '.join(collections)}{Colors.RESET}\n")
-
-def remove_cumulative_subjects(dry_run=True):
+# Fields read by the scan; everything else stays on the server
+CUMULATIVE_PROJECTION = {
+    'userId': 1,
+    'semesters.semester': 1,
+    'semesters.months.month': 1,
+    'semesters.months.subjects.subjectName': 1,
+    'semesters.months.subjects.attendedClasses': 1,
+    'semesters.months.subjects.totalClasses': 1,
+}
+
+# Matches the subject name 'cumulative' in any case
+CUMULATIVE_PATTERN = re.compile(r'^cumulative$', re.IGNORECASE)
+
+# Matches the records holding at least one cumulative subject
+CUMULATIVE_FILTER = {'semesters.months.subjects.subjectName': CUMULATIVE_PATTERN}
+
+# Pulls the cumulative subjects out of every month of a record, touching
+# only the months that contain one. The pull matches by name, so it is safe
+# against concurrent saves; bumping __v makes a save that loaded the record
+# earlier fail with a VersionError instead of writing to shifted positions.
+CUMULATIVE_PULL = {
+    '$pull': {'semesters.$[sem].months.$[month].subjects': {
+        'subjectName': CUMULATIVE_PATTERN
+    }},
+    '$inc': {'__v': 1},
+}
+CUMULATIVE_ARRAY_FILTERS = [
+    {'sem.months.subjects.subjectName': CUMULATIVE_PATTERN},
+    {'month.subjects.subjectName': CUMULATIVE_PATTERN},
+]
+
+# Backend .env file holding MONGODB_URI
+ENV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
+
+# Shared client, created on first use so importing this module stays cheap
+_client = None
+
+def get_client():
+    """Return the shared MongoClient, connecting on first use"""
+    global _client
+    if _client is None:
+        load_dotenv(ENV_PATH)
+        mongo_uri = os.getenv('MONGODB_URI')
+        if not mongo_uri:
+            raise RuntimeError(f"MONGODB_URI not found in {ENV_PATH}")
+        
+        print(f"{Colors.CYAN}Connecting to MongoDB...{Colors.RESET}")
+        _client = MongoClient(mongo_uri)
+    return _client
+
+def get_database():
+    """Return the database named in MONGODB_URI ('cmrit'), or 'test'"""
+    client = get_client()
+    db_name = 'cmrit' if '/cmrit' in os.getenv('MONGODB_URI') else 'test'
+    return client[db_name]
+
+def close_client():
+    """Close the shared client if it was opened"""
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+def is_cumulative_subject(subject):
+    """Check if subject is a 'cumulative' summary row"""
+    return (subject.get('subjectName') or '').lower() == 'cumulative'
+
+def remove_cumulative_subjects(dry_run=True, db=None):
     """
     Remove subjects with name 'cumulative' (case-insensitive) from attendance records
     
     Args:
         dry_run: If True, only show what would be changed without making actual changes
+        db: Database to clean (default: the database in MONGODB_URI)
+    
+    Returns (records, subjects) modified or to be modified.
     """
-    collection = db['attendances']
+    collection = (db if db is not None else get_database())['attendances']
     
     total_records = collection.count_documents({})
     print(f"{Colors.CYAN}Total attendance records: {total_records}{Colors.RESET}\n")
@@ -66,8 +108,8 @@ def remove_cumulative_subjects(dry_run=True):
     records_modified = 0
     total_subjects_removed = 0
     
-    # Find all attendance records
-    all_records = collection.find({})
+    # Find all attendance records, reading only the fields checked below
+    all_records = collection.find({}, CUMULATIVE_PROJECTION)
     
     for record in all_records:
         record_modified = False
@@ -86,7 +128,7 @@ def remove_cumulative_subjects(dry_run=True):
                 # Filter out cumulative subjects
                 filtered_subjects = [
                     subject for subject in original_subjects
-                    if subject.get('subjectName', '').lower() != 'cumulative'
+                    if not is_cumulative_subject(subject)
                 ]
                 
                 # Check if any subjects were removed
@@ -101,11 +143,8 @@ def remove_cumulative_subjects(dry_run=True):
                         print(f"  User ID: {user_id}")
                         print(f"  Semester: {semester_num}, Month: {month_num}")
                         for subject in original_subjects:
-                            if subject.get('subjectName', '').lower() == 'cumulative':
+                            if is_cumulative_subject(subject):
                                 print(f"    - {subject.get('subjectName')}: {subject.get('attendedClasses')}/{subject.get('totalClasses')}")
-                    else:
-                        # Update the subjects array
-                        month['subjects'] = filtered_subjects
         
         # Update the record if modified
         if record_modified:
@@ -113,13 +152,66 @@ def remove_cumulative_subjects(dry_run=True):
             total_subjects_removed += subjects_removed_count
             
             if not dry_run:
-                collection.replace_one(
+                collection.update_one(
                     {'_id': record['_id']},
-                    record
+                    CUMULATIVE_PULL,
+                    array_filters=CUMULATIVE_ARRAY_FILTERS
                 )
                 print(f"{Colors.GREEN}✓ Updated record for user {user_id} - Removed {subjects_removed_count} cumulative subject(s){Colors.RESET}")
     
-    # Summary
+    print_summary(dry_run, records_modified, total_subjects_removed)
+    return records_modified, total_subjects_removed
+
+def count_cumulative_subjects(collection):
+    """
+    Count the records and subjects that contain 'cumulative' on the server.
+
+    Returns (records, subjects); only the two totals cross the wire.
+    """
+    pipeline = [
+        {'$match': CUMULATIVE_FILTER},
+        {'$project': {'semesters.months.subjects.subjectName': 1}},
+        {'$unwind': '$semesters'},
+        {'$unwind': '$semesters.months'},
+        {'$unwind': '$semesters.months.subjects'},
+        {'$match': {'semesters.months.subjects.subjectName': CUMULATIVE_PATTERN}},
+        {'$group': {'_id': '$_id', 'subjects': {'$sum': 1}}},
+        {'$group': {'_id': None, 'records': {'$sum': 1}, 'subjects': {'$sum': '$subjects'}}},
+    ]
+    totals = next(collection.aggregate(pipeline, allowDiskUse=True), None)
+    if not totals:
+        return 0, 0
+    return totals['records'], totals['subjects']
+
+def remove_cumulative_subjects_server(dry_run=True, db=None):
+    """
+    Remove 'cumulative' subjects with a single server-side update_many
+
+    The dry run only counts the matches with an aggregation; the live run
+    $pulls the subjects from every matching record in one command.
+
+    Args:
+        dry_run: If True, only show what would be changed without making actual changes
+        db: Database to clean (default: the database in MONGODB_URI)
+    
+    Returns (records, subjects) modified or to be modified.
+    """
+    collection = (db if db is not None else get_database())['attendances']
+    records, subjects = count_cumulative_subjects(collection)
+    
+    if not dry_run and records:
+        result = collection.update_many(
+            CUMULATIVE_FILTER,
+            CUMULATIVE_PULL,
+            array_filters=CUMULATIVE_ARRAY_FILTERS
+        )
+        records = result.modified_count
+    
+    print_summary(dry_run, records, subjects)
+    return records, subjects
+
+def print_summary(dry_run, records_modified, total_subjects_removed):
+    """Print the totals of a dry or live run"""
     print(f"\n{Colors.CYAN}{'='*60}{Colors.RESET}")
     print(f"{Colors.CYAN}SUMMARY{Colors.RESET}")
     print(f"{Colors.CYAN}{'='*60}{Colors.RESET}")
@@ -128,21 +220,43 @@ def remove_cumulative_subjects(dry_run=True):
         print(f"{Colors.YELLOW}[DRY RUN MODE]{Colors.RESET}")
         print(f"Records that would be modified: {Colors.YELLOW}{records_modified}{Colors.RESET}")
         print(f"Total 'cumulative' subjects that would be removed: {Colors.YELLOW}{total_subjects_removed}{Colors.RESET}")
-        print(f"\n{Colors.CYAN}Run with dry_run=False to apply changes{Colors.RESET}")
+        print(f"\n{Colors.CYAN}Run with --apply to apply changes{Colors.RESET}")
     else:
         print(f"Records modified: {Colors.GREEN}{records_modified}{Colors.RESET}")
         print(f"Total 'cumulative' subjects removed: {Colors.GREEN}{total_subjects_removed}{Colors.RESET}")
         print(f"\n{Colors.GREEN}✓ Cleanup completed successfully!{Colors.RESET}")
 
-if __name__ == "__main__":
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Remove 'cumulative' subjects from attendance records")
+    parser.add_argument('--mode', choices=['server', 'scan'], default='server',
+                        help="remove the subjects with one server-side update_many (default) "
+                             "or by scanning and updating each record")
+    parser.add_argument('--apply', action='store_true',
+                        help="remove the subjects; without it only a dry run is made")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Run a dry run, or with --apply a live run; returns the exit status"""
+    args = parse_args(argv)
+    remove = remove_cumulative_subjects_server if args.mode == 'server' else remove_cumulative_subjects
+    
     print(f"{Colors.CYAN}{'='*60}{Colors.RESET}")
     print(f"{Colors.CYAN}Remove 'Cumulative' Subjects from Attendance Records{Colors.RESET}")
     print(f"{Colors.CYAN}{'='*60}{Colors.RESET}\n")
     
-    # First run in dry-run mode to see what would be changed
-    print(f"{Colors.YELLOW}Running in DRY RUN mode...{Colors.RESET}\n")
-    remove_cumulative_subjects(dry_run=True)
-    
-    # Apply the changes
-    print(f"\n{Colors.RED}Running in LIVE mode...{Colors.RESET}\n")
-    remove_cumulative_subjects(dry_run=False)
+    try:
+        if args.apply:
+            print(f"{Colors.RED}Running in LIVE mode...{Colors.RESET}\n")
+        else:
+            print(f"{Colors.YELLOW}Running in DRY RUN mode...{Colors.RESET}\n")
+        remove(dry_run=not args.apply)
+    except Exception as e:
+        print(f"{Colors.RED}ERROR: {e}{Colors.RESET}")
+        return 1
+    finally:
+        close_client()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,7 +10,11 @@ This script:
 5. Provides detailed summary of cleanup
 
 Usage:
-    python scripts/remove_duplicate_attendance.py
+    python scripts/remove_duplicate_attendance.py [--batch-size N] [--stream] [--workers N]
+                                                  [--resume] [--checkpoint-every N]
+                                                  [--incremental] [--metrics-file PATH]
+                                                  [--quiet] [--audit-file PATH]
+                                                  [--plan-file PATH | --apply-plan PATH]
 
 Requirements:
     pip install pymongo python-dotenv
@@ -18,17 +22,28 @@ Requirements:
 
 import os
 import sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from collections import Counter
+from itertools import islice
 
 try:
-    from pymongo import MongoClient
-    from pymongo.errors import ConnectionFailure
+    import bson
+    from pymongo import MongoClient, UpdateOne
+    from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
 except ImportError:
     print("Error: pymongo is not installed.")
     print("Install it using: pip install pymongo")
     sys.exit(1)
 
+from cleanup_audit import AuditLog, add_output_arguments
+from cleanup_metrics import METRICS, add_metrics_argument
+from cleanup_plan import PlanWriter, add_plan_arguments, read_plan, record_hash, split_unchanged
+from cleanup_state import DEFAULT_CHECKPOINT_EVERY, ChangeTracker, Checkpoint
+
 try:
     from dotenv import load_dotenv
     load_dotenv()
@@ -39,6 +54,46 @@ except ImportError:
 # MongoDB Configuration
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/your_database')
 
+# Fields read by the cleaner; everything else stays on the server. The
+# subdocument _ids let build_plan_diff remove elements by identity.
+ATTENDANCE_PROJECTION = {
+    'userId': 1,
+    'semesters._id': 1,
+    'semesters.semester': 1,
+    'semesters.months._id': 1,
+    'semesters.months.month': 1,
+    'semesters.months.subjects._id': 1,
+    'semesters.months.subjects.subjectCode': 1,
+    'semesters.months.subjects.subjectName': 1,
+    'semesters.months.subjects.attendedClasses': 1,
+    'semesters.months.subjects.totalClasses': 1,
+    '__v': 1,
+}
+
+# Mongoose's version key. attendanceController saves bump it whenever they
+# add or replace array elements, so a record whose __v still matches what
+# the cleaner read has not changed since.
+VERSION_FIELD = '__v'
+
+# Cleanup writes bump the version the way Mongoose does, so a save that
+# loaded the record before the cleanup fails with a VersionError instead
+# of writing to shifted array positions
+VERSION_BUMP = {'$set': {VERSION_FIELD: {'$add': [{'$ifNull': [f'${VERSION_FIELD}', 0]}, 1]}}}
+
+# Times a record changed during its guarded write is re-read, cleaned
+# again and retried
+MAX_CONFLICT_RETRIES = 3
+
+# Number of updates sent per bulk_write round-trip during the live pass
+DEFAULT_BATCH_SIZE = 500
+
+# Script name recorded in (and checked against) plan files
+PLAN_SCRIPT = 'remove_duplicate_attendance'
+
+# _id ranges handed out per worker process, so a slow range does not
+# leave the other workers idle
+RANGES_PER_WORKER = 4
+
 # Color codes for terminal output
 class Colors:
     HEADER = '\033[95m'
@@ -78,17 +133,23 @@ def print_info(message):
     print(f"{Colors.OKCYAN}ℹ {message}{Colors.ENDC}")
 
 
+def database_name():
+    """Extract the database name from MONGODB_URI"""
+    return MONGODB_URI.split('/')[-1].split('?')[0] or 'test'
+
+
 def connect_to_mongodb():
     """Connect to MongoDB and return the database instance"""
     try:
         print_info(f"Connecting to MongoDB...")
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-        
-        # Test connection
-        client.admin.command('ping')
+        with METRICS.phase('connect'):
+            client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000,
+                                 event_listeners=[METRICS.commands])
+            
+            # Test connection
+            client.admin.command('ping')
         
-        # Extract database name from URI
-        db_name = MONGODB_URI.split('/')[-1].split('?')[0] or 'test'
+        db_name = database_name()
         db = client[db_name]
         
         print_success(f"Connected to MongoDB database: {db_name}")
@@ -127,9 +188,9 @@ def is_invalid_subject(subject):
     return False
 
 
-def clean_attendance_record(record):
-    """Clean a single attendance record"""
-    changes = {
+def empty_changes():
+    """Return a zeroed change counter"""
+    return {
         'duplicate_semesters': 0,
         'duplicate_months': 0,
         'duplicate_subjects': 0,
@@ -137,6 +198,30 @@ def clean_attendance_record(record):
         'total_before': 0,
         'total_after': 0
     }
+
+
+def plan_attendance_cleanup(record, dedup_semesters=True, dedup_months=True,
+                            dedup_subjects=True, subject_filters=None):
+    """
+    Work out which array elements of an attendance record to keep.
+
+    Returns (plan, changes), or (None, changes) for a record without
+    semesters. The plan is a list of [semester_index, months] pairs in the
+    order the semesters are kept; months is a list of
+    [month_index, subject_indexes] pairs, and either level is None when it
+    is kept unchanged.
+
+    The dedup_* flags switch the individual dedup steps off. subject_filters
+    maps a change counter name to a predicate; subjects matching one are
+    dropped and counted under the first matching name. It defaults to
+    removing invalid subjects.
+    """
+    if subject_filters is None:
+        subject_filters = {'invalid_subjects': is_invalid_subject}
+    
+    changes = empty_changes()
+    for counter in subject_filters:
+        changes.setdefault(counter, 0)
     
     semesters = record.get('semesters', [])
     if not semesters:
@@ -150,66 +235,285 @@ def clean_attendance_record(record):
     # Step 1: Remove duplicate semesters (keep latest)
     seen_semesters = {}
     for idx, sem in enumerate(semesters):
-        sem_num = sem.get('semester')
+        sem_num = sem.get('semester') if dedup_semesters else idx
         seen_semesters[sem_num] = idx
     
-    unique_semesters = []
-    for sem_num, idx in seen_semesters.items():
-        unique_semesters.append(semesters[idx])
-    
-    changes['duplicate_semesters'] = len(semesters) - len(unique_semesters)
+    changes['duplicate_semesters'] = len(semesters) - len(seen_semesters)
     
-    # Step 2: For each semester, remove duplicate months (keep latest)
-    for semester in unique_semesters:
-        months = semester.get('months', [])
+    plan = []
+    for sem_idx in seen_semesters.values():
+        # Step 2: For each semester, remove duplicate months (keep latest)
+        months = semesters[sem_idx].get('months', [])
         seen_months = {}
         
         for idx, month in enumerate(months):
-            month_num = month.get('month')
+            month_num = month.get('month') if dedup_months else idx
             seen_months[month_num] = idx
         
-        unique_months = []
-        for month_num, idx in seen_months.items():
-            unique_months.append(months[idx])
-        
-        changes['duplicate_months'] += len(months) - len(unique_months)
+        changes['duplicate_months'] += len(months) - len(seen_months)
         
-        # Step 3: For each month, remove duplicate and invalid subjects
-        for month in unique_months:
-            subjects = month.get('subjects', [])
-            seen_subjects = {}
-            valid_subjects = []
+        months_plan = []
+        for month_idx in seen_months.values():
+            # Step 3: For each month, remove duplicate and invalid subjects
+            subjects = months[month_idx].get('subjects', [])
+            seen_subjects = set()
+            kept_subjects = []
             
-            for subject in subjects:
+            for subject_idx, subject in enumerate(subjects):
                 # Skip invalid subjects
-                if is_invalid_subject(subject):
-                    changes['invalid_subjects'] += 1
+                dropped_by = next((counter for counter, matches in subject_filters.items()
+                                   if matches(subject)), None)
+                if dropped_by:
+                    changes[dropped_by] += 1
+                    continue
+                
+                if not dedup_subjects:
+                    kept_subjects.append(subject_idx)
                     continue
                 
-                subject_code = subject.get('subjectCode', '').strip()
-                subject_name = subject.get('subjectName', '').strip()
+                subject_code = (subject.get('subjectCode') or '').strip()
+                subject_name = (subject.get('subjectName') or '').strip()
                 
                 # Use subjectCode as primary key, fallback to subjectName
                 key = subject_code if subject_code else subject_name
                 
-                if key and key not in seen_subjects:
-                    seen_subjects[key] = subject
-                    valid_subjects.append(subject)
-                elif key:
+                # Without a key there is nothing to dedup on; such subjects are
+                # only removed by the invalid-subject filter (empty name)
+                if not key or key not in seen_subjects:
+                    seen_subjects.add(key)
+                    kept_subjects.append(subject_idx)
+                else:
                     changes['duplicate_subjects'] += 1
             
-            month['subjects'] = valid_subjects
+            changes['total_after'] += len(kept_subjects)
+            unchanged = kept_subjects == list(range(len(subjects)))
+            months_plan.append([month_idx, None if unchanged else kept_subjects])
         
-        semester['months'] = unique_months
+        unchanged = (list(seen_months.values()) == list(range(len(months))) and
+                     all(subjects_plan is None for _, subjects_plan in months_plan))
+        plan.append([sem_idx, None if unchanged else months_plan])
     
-    # Track final counts
-    for sem in unique_semesters:
-        for month in sem.get('months', []):
-            changes['total_after'] += len(month.get('subjects', []))
+    return plan, changes
+
+
+def apply_plan(record, plan):
+    """Rebuild the semesters of a record in place from a cleanup plan"""
+    semesters = record['semesters']
+    unique_semesters = []
+    
+    for sem_idx, months_plan in plan:
+        semester = semesters[sem_idx]
+        months = semester.get('months', [])
+        if months_plan is None:
+            months_plan = [[idx, None] for idx in range(len(months))]
+        
+        unique_months = []
+        for month_idx, subjects_plan in months_plan:
+            month = months[month_idx]
+            subjects = month.get('subjects', [])
+            if subjects_plan is None:
+                month['subjects'] = list(subjects)
+            else:
+                month['subjects'] = [subjects[idx] for idx in subjects_plan]
+            unique_months.append(month)
+        
+        semester['months'] = unique_months
+        unique_semesters.append(semester)
     
     record['semesters'] = unique_semesters
+    return record
+
+
+def clean_attendance_record(record):
+    """Clean a single attendance record"""
+    plan, changes = plan_attendance_cleanup(record)
+    if plan is None:
+        return None, changes
     
-    return record, changes
+    return apply_plan(record, plan), changes
+
+
+def build_plan_update(plan):
+    """
+    Build a pipeline update that applies a cleanup plan on the server.
+
+    The kept elements are picked out of the stored document by index, so
+    fields the scan did not project (subdocument _ids, overallAttendance)
+    are written back untouched.
+    """
+    semesters = []
+    for sem_idx, months_plan in plan:
+        if months_plan is None:
+            semesters.append({'$arrayElemAt': ['$semesters', sem_idx]})
+            continue
+        
+        months = []
+        for month_idx, subjects_plan in months_plan:
+            if subjects_plan is None:
+                months.append({'$arrayElemAt': ['$$sem.months', month_idx]})
+                continue
+            
+            subjects = [{'$arrayElemAt': ['$$month.subjects', idx]} for idx in subjects_plan]
+            months.append({'$let': {
+                'vars': {'month': {'$arrayElemAt': ['$$sem.months', month_idx]}},
+                'in': {'$mergeObjects': ['$$month', {'subjects': subjects}]}
+            }})
+        
+        semesters.append({'$let': {
+            'vars': {'sem': {'$arrayElemAt': ['$semesters', sem_idx]}},
+            'in': {'$mergeObjects': ['$$sem', {'months': months}]}
+        }})
+    
+    return [{'$set': {'semesters': semesters}}]
+
+
+def build_pull_diff(path, elements, removed, array_filters=None):
+    """
+    Build a $pull removing the removed elements from the array at path by _id.
+
+    elements are all the elements the $pull can reach. Returns None if a
+    removed element has no _id, or shares it with an element that is kept.
+    """
+    removed_ids = [element.get('_id') for element in removed]
+    if None in removed_ids:
+        return None
+    
+    id_counts = Counter(element.get('_id') for element in elements)
+    if any(id_counts[element_id] != count for element_id, count in Counter(removed_ids).items()):
+        return None
+    
+    return {
+        'update': {'$pull': {path: {'_id': {'$in': list(dict.fromkeys(removed_ids))}}}},
+        'array_filters': array_filters,
+    }
+
+
+def build_plan_diff(record, plan):
+    """
+    Build a minimal update for a cleanup plan: a $pull of the removed
+    elements by _id that touches only the semesters or months holding them.
+
+    Returns {'update', 'array_filters'}, or None when the plan needs the
+    whole-array rewrite of build_plan_update: it reorders elements, it
+    removes elements at more than one level (MongoDB rejects a $pull on an
+    array and on an array inside it in the same update), an element has
+    no unique _id, or the $pull would be larger than the array.
+    """
+    semesters = record.get('semesters') or []
+    kept_semesters = [sem_idx for sem_idx, _ in plan]
+    if kept_semesters != sorted(kept_semesters):
+        return None
+    
+    # Removed elements per level, with the semesters and months holding them
+    removed = {'semesters': [], 'months': [], 'subjects': []}
+    parents = {'semesters': [], 'months': [], 'subjects': []}
+    kept = set(kept_semesters)
+    removed['semesters'] = [sem for idx, sem in enumerate(semesters) if idx not in kept]
+    
+    for sem_idx, months_plan in plan:
+        if months_plan is None:
+            continue
+        
+        semester = semesters[sem_idx]
+        months = semester.get('months') or []
+        kept_months = [month_idx for month_idx, _ in months_plan]
+        if kept_months != sorted(kept_months):
+            return None
+        
+        kept = set(kept_months)
+        dropped = [month for idx, month in enumerate(months) if idx not in kept]
+        if dropped:
+            removed['months'] += dropped
+            parents['months'].append(semester)
+        
+        for month_idx, subjects_plan in months_plan:
+            if subjects_plan is None:
+                continue
+            
+            month = months[month_idx]
+            kept = set(subjects_plan)
+            dropped = [subject for idx, subject in enumerate(month.get('subjects') or [])
+                       if idx not in kept]
+            if dropped:
+                removed['subjects'] += dropped
+                parents['subjects'].append((semester, month))
+    
+    levels = [level for level, elements in removed.items() if elements]
+    if len(levels) != 1:
+        return None
+    
+    level = levels[0]
+    all_months = [month for sem in semesters for month in sem.get('months') or []]
+    if level == 'semesters':
+        diff = build_pull_diff('semesters', semesters, removed['semesters'])
+    elif level == 'months':
+        sem_ids = [sem.get('_id') for sem in parents['months']]
+        if None in sem_ids:
+            return None
+        diff = build_pull_diff('semesters.$[sem].months', all_months, removed['months'],
+                               [{'sem._id': {'$in': sem_ids}}])
+    else:
+        sem_ids = list(dict.fromkeys(sem.get('_id') for sem, _ in parents['subjects']))
+        month_ids = [month.get('_id') for _, month in parents['subjects']]
+        if None in sem_ids or None in month_ids:
+            return None
+        all_subjects = [subject for month in all_months for subject in month.get('subjects') or []]
+        diff = build_pull_diff('semesters.$[sem].months.$[month].subjects', all_subjects,
+                               removed['subjects'],
+                               [{'sem._id': {'$in': sem_ids}}, {'month._id': {'$in': month_ids}}])
+    
+    if diff is None or len(bson.encode(diff)) >= len(bson.encode({'semesters': semesters})):
+        return None
+    return diff
+
+
+def needs_cleaning(plan, changes):
+    """Check whether a cleanup plan changes the stored record"""
+    if not plan:
+        return False
+    
+    # Every removed subject shows up in the totals, whichever rule dropped it
+    return (changes['duplicate_semesters'] > 0 or
+            changes['duplicate_months'] > 0 or
+            changes['total_before'] != changes['total_after'])
+
+
+def iter_planned_records(cursor):
+    """Yield (record, (plan, changes)) for every record of a cursor"""
+    for record in METRICS.timed(cursor, 'read', 'documents_scanned'):
+        started = time.perf_counter()
+        planned = plan_attendance_cleanup(record)
+        METRICS.add_time('clean', time.perf_counter() - started)
+        yield record, planned
+
+
+def iter_dirty_attendance(collection, batch_size=DEFAULT_BATCH_SIZE, query=None, sort=None):
+    """
+    Yield cleaned attendance records that need an update.
+
+    Records are read through a cursor fetching batch_size documents per
+    round-trip and cleaned one at a time, so only the current cursor batch
+    is held in memory. Only the fields the cleaner reads are fetched.
+    """
+    cursor = collection.find(query or {}, ATTENDANCE_PROJECTION, batch_size=batch_size, sort=sort)
+    for record, (plan, changes) in iter_planned_records(cursor):
+        if needs_cleaning(plan, changes):
+            METRICS.count('documents_dirty')
+            record_info = dirty_record_info(record, plan, changes)
+            METRICS.count('array_diff_updates' if record_info['diff'] else 'array_rewrites')
+            yield record_info
+
+
+def dirty_record_info(record, plan, changes):
+    """Return what a cleaned record's write and report need from its plan"""
+    return {
+        '_id': record['_id'],
+        'userId': record.get('userId'),
+        'version': record.get(VERSION_FIELD),
+        'plan': plan,
+        'diff': build_plan_diff(record, plan),
+        'changes': changes
+    }
 
 
 def find_and_clean_attendance(db):
@@ -217,87 +521,755 @@ def find_and_clean_attendance(db):
     print_info("Scanning Attendance collection...")
     
     attendance_collection = db['attendances']
-    total_records = attendance_collection.count_documents({})
+    with METRICS.phase('count'):
+        total_records = attendance_collection.count_documents({})
     print_info(f"Total Attendance records: {total_records}")
     
+    records_to_update = []
+    total_changes = empty_changes()
+    
     if total_records == 0:
         print_warning("No attendance records found!")
-        return []
+        return records_to_update, total_changes
     
-    records_to_update = []
-    total_changes = {
-        'duplicate_semesters': 0,
-        'duplicate_months': 0,
-        'duplicate_subjects': 0,
-        'invalid_subjects': 0,
-        'total_before': 0,
-        'total_after': 0
-    }
-    
-    for record in attendance_collection.find():
-        cleaned_record, changes = clean_attendance_record(record)
+    for record_info in iter_dirty_attendance(attendance_collection):
+        records_to_update.append(record_info)
         
-        if cleaned_record and (changes['duplicate_semesters'] > 0 or 
-                               changes['duplicate_months'] > 0 or 
-                               changes['duplicate_subjects'] > 0 or
-                               changes['invalid_subjects'] > 0):
-            records_to_update.append({
-                '_id': record['_id'],
-                'userId': record.get('userId'),
-                'cleaned_record': cleaned_record,
-                'changes': changes
-            })
+        # Accumulate total changes
+        for key in total_changes:
+            total_changes[key] += record_info['changes'][key]
+    
+    return records_to_update, total_changes
+
+
+def stream_cleanup(db, batch_size=DEFAULT_BATCH_SIZE, dry_run=True, query=None, checkpoint=None,
+                   verbose=True, audit=None):
+    """
+    Clean attendance records in a single streaming pass.
+
+    Dirty records are written in bulk_write batches as soon as batch_size
+    of them have been collected, so memory use does not grow with the
+    collection. Only running totals are kept. query limits the pass to
+    part of the collection.
+
+    With a checkpoint, the live pass walks the collection in _id order,
+    continues after the checkpoint's last _id with its saved totals, and
+    records its progress after every batch. Progress stops advancing at
+    the first failed batch, so a resumed run retries it.
+
+    verbose=False leaves out the per-batch lines. Every dirty record is
+    written to the audit log, if one is given.
+
+    Returns (records_count, total_changes, updated_count, failed_count),
+    where failed_count counts the records whose write failed or kept
+    conflicting.
+    """
+    audit = audit or AuditLog()
+    attendance_collection = db['attendances']
+    records_count = 0
+    updated_count = 0
+    total_changes = empty_changes()
+    sort = None
+    
+    if checkpoint and not dry_run:
+        sort = [('_id', 1)]
+        if checkpoint.last_id is not None:
+            after_checkpoint = {'_id': {'$gt': checkpoint.last_id}}
+            query = {'$and': [query, after_checkpoint]} if query else after_checkpoint
+            records_count = checkpoint.totals['records']
+            updated_count = checkpoint.totals['updated']
+            total_changes = checkpoint.totals['changes']
+    else:
+        checkpoint = None
+    
+    dirty_records = iter_dirty_attendance(attendance_collection, batch_size, query, sort)
+    failed_count = 0
+    
+    try:
+        for batch_number, batch in enumerate(chunked(dirty_records, batch_size), start=1):
+            records_count += len(batch)
+            for record_info in batch:
+                for key in total_changes:
+                    total_changes[key] += record_info['changes'][key]
             
-            # Accumulate total changes
+            if dry_run:
+                if verbose:
+                    print_info(f"  Batch {batch_number}: {len(batch)} records would be updated")
+                for record_info in batch:
+                    audit_record(audit, 'would_update', record_info)
+                continue
+            
+            matched, modified, failed, conflicts = write_cleaned_batch(
+                attendance_collection, batch, batch_number, verbose)
+            audit_batch(audit, batch_number, batch, matched, modified, failed, conflicts)
+            updated_count += modified
+            failed_count += failed + conflicts
+            
+            if checkpoint and not failed_count:
+                checkpoint.progress(batch[-1]['_id'], {
+                    'records': records_count,
+                    'updated': updated_count,
+                    'changes': dict(total_changes),
+                })
+    except BaseException:
+        if checkpoint:
+            checkpoint.save()
+            print_warning(f"Progress saved up to _id {checkpoint.last_id}; "
+                          f"re-run with --resume to continue")
+        raise
+    
+    if checkpoint:
+        if failed_count:
+            checkpoint.save()
+        else:
+            checkpoint.clear()
+    
+    return records_count, total_changes, updated_count, failed_count
+
+
+def split_id_ranges(collection, count):
+    """
+    Split a collection into about count _id ranges of similar size.
+
+    The split points come from $bucketAuto on _id. Returns one query per
+    range; the last range is open-ended.
+    """
+    pipeline = [
+        {'$project': {'_id': 1}},
+        {'$bucketAuto': {'groupBy': '$_id', 'buckets': count}},
+    ]
+    bounds = [bucket['_id']['min'] for bucket in collection.aggregate(pipeline, allowDiskUse=True)]
+    
+    queries = []
+    for lower, upper in zip(bounds, bounds[1:] + [None]):
+        id_range = {'$gte': lower}
+        if upper is not None:
+            id_range['$lt'] = upper
+        queries.append({'_id': id_range})
+    return queries
+
+
+def clean_id_range(query, batch_size, dry_run, verbose=True):
+    """
+    Clean one _id range in a worker process with its own MongoClient.
+
+    Returns the stream_cleanup totals and the worker's metrics for the range.
+    """
+    METRICS.reset()
+    client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000,
+                         event_listeners=[METRICS.commands])
+    try:
+        totals = stream_cleanup(client[database_name()], batch_size, dry_run, query,
+                                verbose=verbose)
+        return totals, METRICS.snapshot()
+    finally:
+        client.close()
+
+
+def parallel_cleanup(db, workers, batch_size=DEFAULT_BATCH_SIZE, dry_run=True, verbose=True):
+    """
+    Clean attendance records across worker processes, one _id range at a time.
+
+    Returns the merged (records_count, total_changes, updated_count,
+    failed_count) of all ranges. The workers' metrics are merged into
+    METRICS.
+    """
+    queries = split_id_ranges(db['attendances'], workers * RANGES_PER_WORKER)
+    print_info(f"Cleaning {len(queries)} _id ranges with {workers} worker processes")
+    
+    records_count = 0
+    updated_count = 0
+    failed_count = 0
+    total_changes = empty_changes()
+    
+    # Forked children must not inherit the parent's MongoClient
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [executor.submit(clean_id_range, query, batch_size, dry_run, verbose)
+                   for query in queries]
+        for future in as_completed(futures):
+            (range_records, range_changes, range_updated, range_failed), range_metrics = future.result()
+            METRICS.merge(range_metrics)
+            records_count += range_records
+            updated_count += range_updated
+            failed_count += range_failed
             for key in total_changes:
-                total_changes[key] += changes[key]
+                total_changes[key] += range_changes[key]
     
-    return records_to_update, total_changes
+    return records_count, total_changes, updated_count, failed_count
 
 
-def apply_cleanup(db, records_to_update, dry_run=True):
-    """Apply cleanup to attendance records"""
+def apply_cleanup(db, records_to_update, dry_run=True, batch_size=None, verbose=True, audit=None):
+    """Apply cleanup to attendance records
+
+    When batch_size is given, live updates are sent through
+    apply_cleanup_batched instead of one update_one per record.
+    verbose=False leaves out the per-record lines; every record is
+    written to the audit log, if one is given.
+    """
+    audit = audit or AuditLog()
+    if batch_size and not dry_run:
+        return apply_cleanup_batched(db, records_to_update, batch_size, verbose, audit)
+    
     attendance_collection = db['attendances']
     updated_count = 0
     
     for record_info in records_to_update:
-        record_id = record_info['_id']
         user_id = record_info['userId']
-        cleaned_record = record_info['cleaned_record']
         changes = record_info['changes']
         
-        print_info(f"\nUser ID: {user_id}")
-        print(f"  Duplicate semesters removed: {changes['duplicate_semesters']}")
-        print(f"  Duplicate months removed: {changes['duplicate_months']}")
-        print(f"  Duplicate subjects removed: {changes['duplicate_subjects']}")
-        print(f"  Invalid subjects removed: {changes['invalid_subjects']}")
-        print(f"  Total subjects: {changes['total_before']} → {changes['total_after']}")
+        if verbose:
+            print_info(f"\nUser ID: {user_id}")
+            print(f"  Duplicate semesters removed: {changes['duplicate_semesters']}")
+            print(f"  Duplicate months removed: {changes['duplicate_months']}")
+            print(f"  Duplicate subjects removed: {changes['duplicate_subjects']}")
+            print(f"  Invalid subjects removed: {changes['invalid_subjects']}")
+            print(f"  Total subjects: {changes['total_before']} → {changes['total_after']}")
         
         if not dry_run:
-            result = attendance_collection.update_one(
-                {'_id': record_id},
-                {'$set': {'semesters': cleaned_record['semesters']}}
-            )
-            
-            if result.modified_count > 0:
-                print_success(f"  ✓ Updated successfully")
+            if update_cleaned_record(attendance_collection, record_info) > 0:
+                if verbose:
+                    print_success(f"  ✓ Updated successfully")
                 updated_count += 1
+                audit_record(audit, 'updated', record_info)
             else:
-                print_error(f"  ✗ Update failed")
+                if verbose:
+                    print_error(f"  ✗ Update failed")
+                audit_record(audit, 'not_modified', record_info)
         else:
-            print_warning(f"  [DRY RUN] Would update this record")
+            if verbose:
+                print_warning(f"  [DRY RUN] Would update this record")
+            audit_record(audit, 'would_update', record_info)
     
     return updated_count
 
 
+def audit_record(audit, event, record_info, **fields):
+    """Write one cleaned attendance record to the audit log"""
+    audit.record(event, _id=record_info['_id'], userId=record_info['userId'],
+                 changes=record_info['changes'], **fields)
+
+
+def audit_batch(audit, batch_number, batch, matched, modified, failed, conflicts=0):
+    """Write the records of one bulk_write batch and its outcome to the audit log"""
+    if not audit.enabled:
+        return
+    for record_info in batch:
+        audit_record(audit, 'submitted', record_info, batch=batch_number)
+    audit.record('batch', batch=batch_number, records=len(batch), matched=matched,
+                 modified=modified, failed=failed, conflicts=conflicts)
+
+
+def chunked(iterable, size):
+    """Yield successive lists of at most size items from iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def build_guarded_update(record_id, version, update):
+    """
+    Return (filter, update) for a write that only applies if the record
+    still has the version the cleaner read, and that bumps the version.
+
+    update is either a pipeline or an update document.
+    """
+    if isinstance(update, list):
+        update = update + [VERSION_BUMP]
+    else:
+        update = {**update, '$inc': {VERSION_FIELD: 1}}
+    # A None version matches records without __v, as the cleaner read them
+    return {'_id': record_id, VERSION_FIELD: version}, update
+
+
+def build_record_update(record_info, build_plan=build_plan_update):
+    """
+    Return (filter, update, array_filters) for one cleaned record.
+
+    The record's minimal diff is used when it has one; otherwise build_plan
+    rewrites its arrays from the plan.
+    """
+    diff = record_info.get('diff')
+    if diff:
+        update, array_filters = diff['update'], diff['array_filters']
+    else:
+        update, array_filters = build_plan(record_info['plan']), None
+    record_filter, update = build_guarded_update(record_info['_id'], record_info.get('version'),
+                                                 update)
+    return record_filter, update, array_filters
+
+
+def build_update(record_info, build_plan=build_plan_update):
+    """Build the guarded write operation for one cleaned record"""
+    record_filter, update, array_filters = build_record_update(record_info, build_plan)
+    return UpdateOne(record_filter, update, array_filters=array_filters)
+
+
+def reclean_records(collection, record_ids):
+    """Read records again and return the ones that still need cleaning"""
+    return list(iter_dirty_attendance(collection, query={'_id': {'$in': record_ids}}))
+
+
+class GuardedBatch:
+    """
+    Bookkeeping of one batch of version-guarded writes and its retries.
+
+    A record changed since it was read is not matched by its update.
+    record() adds up one write and returns the _ids of the batch to read
+    again; retry() carries on with the ones that still need cleaning, up
+    to MAX_CONFLICT_RETRIES times. The sync and asyncio cleanups drive it
+    from their own write loops.
+    """
+
+    def __init__(self, batch, batch_number, build=build_update):
+        self.batch = batch
+        self.batch_number = batch_number
+        self.build = build
+        self.attempt = 0
+        self.matched = self.modified = self.failed = self.conflicts = 0
+
+    def operations(self):
+        """Return the writes of the records still to write"""
+        return [self.build(record_info) for record_info in self.batch]
+
+    def record(self, matched, modified, failed):
+        """Add one write's counts; returns the _ids to read again, or None when done"""
+        self.matched += matched
+        self.modified += modified
+        self.failed += failed
+        self.conflicts = max(len(self.batch) - matched - failed, 0)
+        if not self.conflicts:
+            return None
+
+        METRICS.count('write_conflicts', self.conflicts)
+        if self.attempt == MAX_CONFLICT_RETRIES:
+            print_warning(f"  Batch {self.batch_number}: {self.conflicts} records kept changing "
+                          f"and were skipped")
+            return None
+        self.attempt += 1
+        return [record_info['_id'] for record_info in self.batch]
+
+    def retry(self, batch, verbose=True):
+        """Carry on with the records read again; returns False if none still need cleaning"""
+        if not batch:
+            self.conflicts = 0
+            return False
+        if verbose:
+            print_warning(f"  Batch {self.batch_number}: {self.conflicts} records changed during the "
+                          f"write; retrying {len(batch)} after cleaning them again")
+        self.batch = batch
+        return True
+
+    def totals(self):
+        """Return (matched, modified, failed, conflicts); conflicts kept changing to the end"""
+        return self.matched, self.modified, self.failed, self.conflicts
+
+
+def write_cleaned_batch(collection, batch, batch_number, verbose=True, build=build_update,
+                        reclean=reclean_records):
+    """
+    Write one batch of cleaned records with version-guarded updates.
+
+    A record changed since it was read is not matched by its update. The
+    batch's records are then read again, and the ones that still need
+    cleaning are cleaned again and retried, up to MAX_CONFLICT_RETRIES
+    times. build turns a batch entry into its UpdateOne and
+    reclean(collection, record_ids) re-reads and re-plans the entries, so
+    other collections' cleanups reuse the same loop.
+
+    Returns (matched, modified, failed, conflicts); conflicts counts the
+    records still changing after the last retry.
+    """
+    guarded = GuardedBatch(batch, batch_number, build)
+    while True:
+        record_ids = guarded.record(*write_batch(collection, guarded.operations(), batch_number, verbose))
+        if record_ids is None or not guarded.retry(reclean(collection, record_ids), verbose):
+            return guarded.totals()
+
+
+def update_cleaned_record(collection, record_info):
+    """
+    Write one cleaned record with a version-guarded update_one.
+
+    If the record changed since it was read, it is read again, cleaned
+    again and retried, up to MAX_CONFLICT_RETRIES times. Returns the
+    number of records modified (0 or 1).
+    """
+    for attempt in range(MAX_CONFLICT_RETRIES + 1):
+        record_filter, update, array_filters = build_record_update(record_info)
+        started = time.perf_counter()
+        result = collection.update_one(record_filter, update, array_filters=array_filters)
+        METRICS.record_write(time.perf_counter() - started,
+                             result.matched_count, result.modified_count)
+        if result.matched_count:
+            return result.modified_count
+        
+        METRICS.count('write_conflicts')
+        fresh = reclean_records(collection, [record_info['_id']])
+        if not fresh:
+            return 0
+        record_info = fresh[0]
+    
+    return 0
+
+
+def send_batch(collection, operations, batch_number, verbose=True):
+    """
+    Send one unordered bulk_write batch and report its outcome.
+
+    A failing batch is reported and skipped so the remaining batches still run.
+    verbose=False reports only failures.
+    Returns (matched, modified, upserted, failed) counts for the batch.
+    """
+    started = time.perf_counter()
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+    except PyMongoError as e:
+        return report_batch(operations, batch_number, started, e, verbose)
+    return report_batch(operations, batch_number, started, result, verbose)
+
+
+def report_batch(operations, batch_number, started, outcome, verbose=True):
+    """
+    Report a sent bulk_write batch and return its (matched, modified,
+    upserted, failed) counts.
+
+    outcome is the BulkWriteResult, or the PyMongoError the batch raised;
+    started is its time.perf_counter() start.
+    """
+    if isinstance(outcome, BulkWriteError):
+        # Unordered batches keep going past individual errors, so the
+        # successful part of the batch is still reported
+        details = outcome.details
+        matched = details.get('nMatched', 0)
+        modified = details.get('nModified', 0)
+        upserted = details.get('nUpserted', 0)
+        failed = len(details.get('writeErrors', []))
+        print_error(f"  Batch {batch_number}: {failed} write error(s)")
+    elif isinstance(outcome, PyMongoError):
+        METRICS.record_write(time.perf_counter() - started, 0, 0, len(operations))
+        print_error(f"  Batch {batch_number} failed: {outcome}")
+        return 0, 0, 0, len(operations)
+    else:
+        matched, modified, upserted, failed = (outcome.matched_count, outcome.modified_count,
+                                               outcome.upserted_count, 0)
+
+    METRICS.record_write(time.perf_counter() - started, matched, modified, failed)
+    if verbose:
+        print_info(f"  Batch {batch_number}: {len(operations)} updates, "
+                   f"matched {matched}, modified {modified}"
+                   + (f", upserted {upserted}" if upserted else ""))
+    return matched, modified, upserted, failed
+
+
+def write_batch(collection, operations, batch_number, verbose=True):
+    """Send one batch as send_batch does. Returns (matched, modified, failed) counts."""
+    matched, modified, _, failed = send_batch(collection, operations, batch_number, verbose)
+    return matched, modified, failed
+
+
+def apply_cleanup_batched(db, records_to_update, batch_size=DEFAULT_BATCH_SIZE, verbose=True,
+                          audit=None):
+    """Apply cleanup using unordered bulk_write batches of batch_size updates"""
+    audit = audit or AuditLog()
+    attendance_collection = db['attendances']
+    totals = {'matched': 0, 'modified': 0, 'failed': 0, 'conflicts': 0}
+    
+    for batch_number, batch in enumerate(chunked(records_to_update, batch_size), start=1):
+        matched, modified, failed, conflicts = write_cleaned_batch(
+            attendance_collection, batch, batch_number, verbose)
+        audit_batch(audit, batch_number, batch, matched, modified, failed, conflicts)
+        totals['matched'] += matched
+        totals['modified'] += modified
+        totals['failed'] += failed
+        totals['conflicts'] += conflicts
+    
+    print_info(f"Bulk write totals: matched {totals['matched']}, "
+               f"modified {totals['modified']}, failed {totals['failed']}")
+    if totals['failed'] or totals['conflicts']:
+        print_warning(f"{totals['failed'] + totals['conflicts']} updates failed or kept "
+                      f"conflicting; re-run the script to retry them")
+    
+    return totals['modified']
+
+
+def write_cleanup_plan(db, path, batch_size=DEFAULT_BATCH_SIZE, audit=None):
+    """
+    Dry run that writes every record needing cleaning to a plan file.
+
+    Records are streamed off a cursor, so memory stays flat. Returns
+    (records_count, total_changes).
+    """
+    audit = audit or AuditLog()
+    attendance_collection = db['attendances']
+    total_changes = empty_changes()
+    
+    cursor = attendance_collection.find({}, ATTENDANCE_PROJECTION, batch_size=batch_size)
+    with PlanWriter(path, PLAN_SCRIPT, db.name, attendance_collection.name) as writer:
+        for record, (plan, changes) in iter_planned_records(cursor):
+            if not needs_cleaning(plan, changes):
+                continue
+            
+            METRICS.count('documents_dirty')
+            writer.add(record['_id'], record.get('userId'), plan, changes, record_hash(record),
+                       record.get(VERSION_FIELD), build_plan_diff(record, plan))
+            audit.record('would_update', _id=record['_id'], userId=record.get('userId'),
+                         changes=changes)
+            for key in total_changes:
+                total_changes[key] += changes[key]
+    
+    return writer.count, total_changes
+
+
+def apply_plan_file(collection, entries, projection, build_entry_update,
+                    batch_size=DEFAULT_BATCH_SIZE, verbose=True, audit=None):
+    """
+    Apply the records of a plan file in unordered bulk_write batches.
+
+    Each batch is re-read by _id first, and only the records whose hash
+    still matches the plan are written. Records changed or deleted since
+    the plan was made are skipped.
+
+    Returns (totals, total_changes): totals counts the records applied,
+    modified, changed, missing and failed, and total_changes adds up the
+    planned changes of the applied records.
+    """
+    audit = audit or AuditLog()
+    totals = {'applied': 0, 'modified': 0, 'changed': 0, 'missing': 0, 'failed': 0}
+    total_changes = Counter()
+    
+    for batch_number, batch in enumerate(chunked(entries, batch_size), start=1):
+        with METRICS.phase('verify'):
+            unchanged, changed, missing = split_unchanged(collection, batch, projection)
+        
+        for status, skipped in (('changed', changed), ('missing', missing)):
+            totals[status] += len(skipped)
+            for entry in skipped:
+                audit_record(audit, f'skipped_{status}', entry)
+        
+        if not unchanged:
+            continue
+        
+        # The version guard catches saves landing between the re-read and the write
+        operations = [build_update(entry, build_entry_update) for entry in unchanged]
+        matched, modified, failed = write_batch(collection, operations, batch_number, verbose)
+        conflicts = max(0, len(unchanged) - matched - failed)
+        METRICS.count('write_conflicts', conflicts)
+        audit_batch(audit, batch_number, unchanged, matched, modified, failed, conflicts)
+        totals['applied'] += len(unchanged) - conflicts
+        totals['changed'] += conflicts
+        totals['modified'] += modified
+        totals['failed'] += failed
+        for entry in unchanged:
+            total_changes.update(entry['changes'])
+    
+    return totals, total_changes
+
+
+def print_plan_totals(totals):
+    """Print what happened to the records of a plan file"""
+    print_info(f"Plan records written: {totals['applied']}, modified: {totals['modified']}, "
+               f"failed: {totals['failed']}")
+    if totals['changed']:
+        print_warning(f"{totals['changed']} records changed after the plan was made and were "
+                      f"skipped; make a new plan to clean them")
+    if totals['missing']:
+        print_warning(f"{totals['missing']} planned records no longer exist")
+
+
+def run_plan_file(db, path, batch_size, audit=None):
+    """Write a plan file instead of asking for confirmation"""
+    print_info(f"Writing the cleanup plan to {path}...")
+    records_count, total_changes = write_cleanup_plan(db, path, batch_size, audit)
+    print_dry_run_summary(records_count, total_changes)
+    print_success(f"✓ Plan written to {path}; apply it with --apply-plan {path}")
+
+
+def run_apply_plan(db, path, batch_size, verbose=True, audit=None):
+    """Apply a plan file written by an earlier --plan-file run"""
+    header, entries = read_plan(path, PLAN_SCRIPT, db.name)
+    print_info(f"Applying the plan made at {header['created_at']}...")
+    totals, total_changes = apply_plan_file(db[header['collection']], entries,
+                                            ATTENDANCE_PROJECTION, build_plan_update,
+                                            batch_size, verbose, audit)
+    print_plan_totals(totals)
+    print_cleanup_complete(totals['modified'], total_changes)
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Remove duplicate and invalid attendance entries")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"updates per bulk_write batch in the live pass "
+                             f"(default: {DEFAULT_BATCH_SIZE}, 0 = one update_one per record)")
+    parser.add_argument('--stream', action='store_true',
+                        help="clean and write records batch by batch instead of "
+                             "loading every dirty record into memory first")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="clean _id ranges in N worker processes, each with its "
+                             "own connection (implies --stream)")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted streaming live pass from its "
+                             "saved checkpoint (implies --stream)")
+    parser.add_argument('--checkpoint-every', type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                        help=f"save streaming progress every N batches "
+                             f"(default: {DEFAULT_CHECKPOINT_EVERY})")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only clean records changed since the previous --incremental "
+                             "run (implies --stream)")
+    add_metrics_argument(parser)
+    add_output_arguments(parser)
+    add_plan_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    if (args.plan_file or args.apply_plan) and (args.workers > 1 or args.resume or args.incremental):
+        parser.error("--plan-file and --apply-plan cannot be combined with --workers, "
+                     "--resume or --incremental")
+    if args.audit_file and args.workers > 1:
+        parser.error("--audit-file cannot be combined with --workers")
+    if args.resume and args.workers > 1:
+        parser.error("--resume cannot be combined with --workers")
+    if args.incremental and (args.resume or args.workers > 1):
+        parser.error("--incremental cannot be combined with --resume or --workers")
+    return args
+
+
+def print_dry_run_summary(records_count, total_changes):
+    """Print the dry run totals"""
+    print("\n" + "="*70)
+    print_info("DRY RUN SUMMARY:")
+    print(f"  Records to update: {records_count}")
+    print(f"  Duplicate semesters to remove: {total_changes['duplicate_semesters']}")
+    print(f"  Duplicate months to remove: {total_changes['duplicate_months']}")
+    print(f"  Duplicate subjects to remove: {total_changes['duplicate_subjects']}")
+    print(f"  Invalid subjects to remove: {total_changes['invalid_subjects']}")
+    print(f"  Total subjects: {total_changes['total_before']} → {total_changes['total_after']}")
+    print("="*70 + "\n")
+
+
+def print_cleanup_complete(updated, total_changes):
+    """Print the totals of a live run"""
+    print_header("CLEANUP COMPLETE")
+    print_success(f"✓ Updated {updated} attendance records")
+    print_success(f"✓ Removed {total_changes['duplicate_semesters']} duplicate semesters")
+    print_success(f"✓ Removed {total_changes['duplicate_months']} duplicate months")
+    print_success(f"✓ Removed {total_changes['duplicate_subjects']} duplicate subjects")
+    print_success(f"✓ Removed {total_changes['invalid_subjects']} invalid subjects")
+    print_success("✓ Database cleanup successful!")
+
+
+def confirm():
+    """Ask for confirmation before the live pass"""
+    response = input(f"{Colors.WARNING}Proceed with cleanup? (yes/no): {Colors.ENDC}").strip().lower()
+    
+    if response in ['yes', 'y']:
+        return True
+    
+    print_warning(f"\nOperation cancelled. You entered: '{response}'")
+    return False
+
+
+def run_streaming(db, batch_size, workers=1, resume=False,
+                  checkpoint_every=DEFAULT_CHECKPOINT_EVERY, query=None, verbose=True, audit=None):
+    """
+    Dry run and live pass without holding the dirty records in memory
+
+    query limits both passes to part of the collection. Returns the number
+    of records whose write failed or kept conflicting, or None if the
+    cleanup was cancelled at the confirmation prompt.
+    """
+    checkpoint = None
+    if workers == 1:
+        checkpoint = Checkpoint('remove_duplicate_attendance', db.name, checkpoint_every)
+    
+    def cleanup(dry_run):
+        if workers > 1:
+            return parallel_cleanup(db, workers, batch_size, dry_run, verbose)
+        return stream_cleanup(db, batch_size, dry_run, query, checkpoint, verbose, audit)
+    
+    if resume:
+        if checkpoint.load():
+            print_info(f"Resuming the live pass after _id {checkpoint.last_id}")
+            _, total_changes, updated, failed = cleanup(dry_run=False)
+            print_cleanup_complete(updated, total_changes)
+            return failed
+        print_warning("No saved progress found, starting a new run")
+    
+    print("\n" + "="*70)
+    print_warning("⚠ DRY RUN MODE - No changes will be made yet")
+    print("="*70 + "\n")
+    
+    records_count, total_changes, _, _ = cleanup(dry_run=True)
+    
+    if not records_count:
+        print_success("\n✓ No duplicates or invalid data found! Database is clean.")
+        return 0
+    
+    print_dry_run_summary(records_count, total_changes)
+    
+    if not confirm():
+        return None
+    
+    print_info("\nApplying cleanup...")
+    _, total_changes, updated, failed = cleanup(dry_run=False)
+    print_cleanup_complete(updated, total_changes)
+    return failed
+
+
+def run_incremental(db, batch_size, checkpoint_every=DEFAULT_CHECKPOINT_EVERY, verbose=True,
+                    audit=None):
+    """Clean only the records changed since the previous incremental run"""
+    tracker = ChangeTracker(db['attendances'], 'remove_duplicate_attendance_incremental', db.name)
+    query = tracker.pending_query()
+    
+    if tracker.mode == 'change-stream':
+        print_info(f"Change stream: {len(query['_id']['$in'])} records changed since the last run")
+    elif tracker.mode == 'watermark':
+        print_warning("Change streams unavailable: only records inserted since the last run are checked")
+    else:
+        print_info("No previous incremental run found, checking every record")
+    
+    failed = run_streaming(db, batch_size, checkpoint_every=checkpoint_every, query=query,
+                           verbose=verbose, audit=audit)
+    if failed == 0:
+        tracker.commit()
+    elif failed:
+        print_warning(f"{failed} records were not cleaned; the next --incremental run "
+                      f"checks the same records again")
+
+
 def main():
     """Main execution function"""
+    args = parse_args()
     print_header("Attendance Duplicate Removal Script")
     
     # Connect to MongoDB
     db, client = connect_to_mongodb()
+    verbose = not args.quiet
+    audit = AuditLog(args.audit_file)
     
     try:
+        if args.plan_file:
+            run_plan_file(db, args.plan_file, args.batch_size or DEFAULT_BATCH_SIZE, audit)
+            return
+        
+        if args.apply_plan:
+            run_apply_plan(db, args.apply_plan, args.batch_size or DEFAULT_BATCH_SIZE, verbose, audit)
+            return
+        
+        if args.incremental:
+            run_incremental(db, args.batch_size or DEFAULT_BATCH_SIZE, args.checkpoint_every,
+                            verbose, audit)
+            return
+        
+        if args.stream or args.workers > 1 or args.resume:
+            run_streaming(db, args.batch_size or DEFAULT_BATCH_SIZE, args.workers,
+                          args.resume, args.checkpoint_every, verbose=verbose, audit=audit)
+            return
+        
         # Find and clean records
         records_to_update, total_changes = find_and_clean_attendance(db)
         
@@ -312,34 +1284,16 @@ def main():
         print("="*70 + "\n")
         
         # Perform dry run
-        apply_cleanup(db, records_to_update, dry_run=True)
+        apply_cleanup(db, records_to_update, dry_run=True, verbose=verbose, audit=audit)
         
-        print("\n" + "="*70)
-        print_info("DRY RUN SUMMARY:")
-        print(f"  Records to update: {len(records_to_update)}")
-        print(f"  Duplicate semesters to remove: {total_changes['duplicate_semesters']}")
-        print(f"  Duplicate months to remove: {total_changes['duplicate_months']}")
-        print(f"  Duplicate subjects to remove: {total_changes['duplicate_subjects']}")
-        print(f"  Invalid subjects to remove: {total_changes['invalid_subjects']}")
-        print(f"  Total subjects: {total_changes['total_before']} → {total_changes['total_after']}")
-        print("="*70 + "\n")
+        print_dry_run_summary(len(records_to_update), total_changes)
         
         # Ask for confirmation
-        response = input(f"{Colors.WARNING}Proceed with cleanup? (yes/no): {Colors.ENDC}").strip().lower()
-        
-        if response in ['yes', 'y']:
+        if confirm():
             print_info("\nApplying cleanup...")
-            updated = apply_cleanup(db, records_to_update, dry_run=False)
-            
-            print_header("CLEANUP COMPLETE")
-            print_success(f"✓ Updated {updated} attendance records")
-            print_success(f"✓ Removed {total_changes['duplicate_semesters']} duplicate semesters")
-            print_success(f"✓ Removed {total_changes['duplicate_months']} duplicate months")
-            print_success(f"✓ Removed {total_changes['duplicate_subjects']} duplicate subjects")
-            print_success(f"✓ Removed {total_changes['invalid_subjects']} invalid subjects")
-            print_success("✓ Database cleanup successful!")
-        else:
-            print_warning(f"\nOperation cancelled. You entered: '{response}'")
+            updated = apply_cleanup(db, records_to_update, dry_run=False,
+                                    batch_size=args.batch_size, verbose=verbose, audit=audit)
+            print_cleanup_complete(updated, total_changes)
     
     except Exception as e:
         print_error(f"\nAn error occurred: {e}")
@@ -347,8 +1301,13 @@ def main():
         traceback.print_exc()
     
     finally:
+        audit.close()
         client.close()
         print_info("\nMongoDB connection closed.")
+        if args.audit_file:
+            print_info(f"Audit log written to {args.audit_file}")
+        if args.metrics_file:
+            print_info(f"Metrics written to {METRICS.write(args.metrics_file, 'remove_duplicate_attendance')}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Asyncio variant of remove_duplicate_attendance.py.
+
+Cursor reads, cleaning and bulk writes run as separate tasks connected by
+bounded queues, so the next cursor batch is fetched and cleaned while
+earlier updates are still in flight. The cleanup rules and the summary
+output are the same as in remove_duplicate_attendance.py.
+
+Writes are guarded by the record version (__v) the same way. A record
+changed by the app after it was read is read, cleaned and written again,
+up to MAX_CONFLICT_RETRIES times. Records that still fail are reported,
+and the script then exits with status 1.
+
+The write bookkeeping (GuardedBatch, report_batch) and the --quiet,
+--audit-file and --metrics-file options are shared with
+remove_duplicate_attendance.py, so the two paths report the same way.
+
+Usage:
+    python scripts/remove_duplicate_attendance_async.py [--batch-size N] [--max-in-flight N]
+                                                        [--quiet] [--audit-file PATH]
+                                                        [--metrics-file PATH]
+
+Requirements:
+    pip install "pymongo>=4.13" python-dotenv
+    (or pip install motor with an older pymongo)
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import inspect
+
+from pymongo.errors import PyMongoError
+
+from cleanup_audit import AuditLog, add_output_arguments
+from cleanup_metrics import METRICS, add_metrics_argument
+from remove_duplicate_attendance import (
+    ATTENDANCE_PROJECTION,
+    DEFAULT_BATCH_SIZE,
+    MONGODB_URI,
+    GuardedBatch,
+    audit_batch,
+    audit_record,
+    confirm,
+    database_name,
+    dirty_record_info,
+    empty_changes,
+    needs_cleaning,
+    plan_attendance_cleanup,
+    print_cleanup_complete,
+    print_dry_run_summary,
+    print_error,
+    print_header,
+    print_info,
+    print_success,
+    print_warning,
+    report_batch,
+)
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+    except ImportError:
+        print("Error: the asyncio mode needs pymongo>=4.13 or motor.")
+        print("Install it using: pip install --upgrade pymongo")
+        sys.exit(1)
+
+
+# Bulk writes allowed to run at the same time
+DEFAULT_MAX_IN_FLIGHT = 4
+
+
+async def connect_to_mongodb():
+    """Connect to MongoDB and return the database and client"""
+    print_info("Connecting to MongoDB...")
+    with METRICS.phase('connect'):
+        client = AsyncMongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000,
+                                  event_listeners=[METRICS.commands])
+        await client.admin.command('ping')
+
+    db_name = database_name()
+    print_success(f"Connected to MongoDB database: {db_name}")
+    return client[db_name], client
+
+
+async def close_client(client):
+    """Close a client from either driver (motor's close() is synchronous)"""
+    result = client.close()
+    if inspect.isawaitable(result):
+        await result
+
+
+async def read_records(collection, read_queue, batch_size):
+    """Feed projected attendance records into read_queue, then a None sentinel"""
+    async for record in collection.find({}, ATTENDANCE_PROJECTION, batch_size=batch_size):
+        METRICS.count('documents_scanned')
+        await read_queue.put(record)
+    await read_queue.put(None)
+
+
+def plan_record(record):
+    """Return (record_info, changes) for a record that needs cleaning, or (None, changes)"""
+    started = time.perf_counter()
+    plan, changes = plan_attendance_cleanup(record)
+    METRICS.add_time('clean', time.perf_counter() - started)
+    if not needs_cleaning(plan, changes):
+        return None, changes
+    return dirty_record_info(record, plan, changes), changes
+
+
+async def reclean_records(collection, record_ids):
+    """Read records again and return the ones that still need cleaning"""
+    batch = []
+    async for record in collection.find({'_id': {'$in': record_ids}}, ATTENDANCE_PROJECTION):
+        record_info, _ = plan_record(record)
+        if record_info:
+            batch.append(record_info)
+    return batch
+
+
+async def clean_records(read_queue, write_queue, totals, batch_size):
+    """Clean records from read_queue and queue batches of dirty ones for writing"""
+    batch = []
+    while (record := await read_queue.get()) is not None:
+        record_info, changes = plan_record(record)
+        if not record_info:
+            continue
+
+        METRICS.count('documents_dirty')
+        totals['records'] += 1
+        for key in totals['changes']:
+            totals['changes'][key] += changes[key]
+
+        batch.append(record_info)
+        if len(batch) == batch_size:
+            await write_queue.put(batch)
+            batch = []
+
+    if batch:
+        await write_queue.put(batch)
+    await write_queue.put(None)
+
+
+async def write_batch(collection, operations, batch_number, verbose=True):
+    """
+    Send one unordered bulk_write batch and report it with report_batch.
+
+    Returns (matched, modified, failed) counts for the batch.
+    """
+    started = time.perf_counter()
+    try:
+        outcome = await collection.bulk_write(operations, ordered=False)
+    except PyMongoError as e:
+        outcome = e
+    matched, modified, _, failed = report_batch(operations, batch_number, started, outcome, verbose)
+    return matched, modified, failed
+
+
+async def write_cleaned_batch(collection, batch, batch_number, verbose=True):
+    """
+    Write one batch of cleaned records with version-guarded updates.
+
+    The same GuardedBatch loop as write_cleaned_batch in
+    remove_duplicate_attendance.py: records changed since they were read
+    are read again, cleaned again and retried, up to MAX_CONFLICT_RETRIES
+    times. Returns (matched, modified, failed, conflicts).
+    """
+    guarded = GuardedBatch(batch, batch_number)
+    while True:
+        counts = await write_batch(collection, guarded.operations(), batch_number, verbose)
+        record_ids = guarded.record(*counts)
+        if record_ids is None or not guarded.retry(await reclean_records(collection, record_ids), verbose):
+            return guarded.totals()
+
+
+async def write_batches(collection, write_queue, totals, max_in_flight, dry_run, verbose=True,
+                        audit=None):
+    """Write queued batches with at most max_in_flight bulk_writes running at once"""
+    audit = audit or AuditLog()
+    in_flight = asyncio.Semaphore(max_in_flight)
+    pending = set()
+    batch_number = 0
+
+    async def write(batch, number):
+        try:
+            matched, modified, failed, conflicts = await write_cleaned_batch(collection, batch, number,
+                                                                             verbose)
+            audit_batch(audit, number, batch, matched, modified, failed, conflicts)
+            totals['updated'] += modified
+            totals['failed'] += failed
+            totals['conflicts'] += conflicts
+        finally:
+            in_flight.release()
+
+    while (batch := await write_queue.get()) is not None:
+        batch_number += 1
+        if dry_run:
+            if verbose:
+                print_info(f"  Batch {batch_number}: {len(batch)} records would be updated")
+            for record_info in batch:
+                audit_record(audit, 'would_update', record_info)
+            continue
+
+        await in_flight.acquire()
+        task = asyncio.create_task(write(batch, batch_number))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    await asyncio.gather(*pending)
+
+
+async def async_cleanup(batch_size=DEFAULT_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                        dry_run=True, verbose=True, audit=None):
+    """
+    Run one read → clean → write pass over the attendance collection.
+
+    Returns (records_count, total_changes, updated_count, failed_count),
+    where failed_count counts the records whose write failed or kept
+    conflicting.
+    """
+    db, client = await connect_to_mongodb()
+    totals = {'records': 0, 'updated': 0, 'failed': 0, 'conflicts': 0, 'changes': empty_changes()}
+
+    try:
+        collection = db['attendances']
+        read_queue = asyncio.Queue(maxsize=batch_size)
+        write_queue = asyncio.Queue(maxsize=max_in_flight)
+
+        await asyncio.gather(
+            read_records(collection, read_queue, batch_size),
+            clean_records(read_queue, write_queue, totals, batch_size),
+            write_batches(collection, write_queue, totals, max_in_flight, dry_run, verbose, audit),
+        )
+    finally:
+        await close_client(client)
+
+    return totals['records'], totals['changes'], totals['updated'], totals['failed'] + totals['conflicts']
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Remove duplicate and invalid attendance entries (asyncio)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"cursor batch and bulk_write batch size (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help=f"bulk_write batches running at the same time "
+                             f"(default: {DEFAULT_MAX_IN_FLIGHT})")
+    add_metrics_argument(parser)
+    add_output_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print_header("Attendance Duplicate Removal Script (asyncio)")
+    verbose = not args.quiet
+    audit = AuditLog(args.audit_file)
+    failed = 0
+
+    try:
+        print("\n" + "="*70)
+        print_warning("⚠ DRY RUN MODE - No changes will be made yet")
+        print("="*70 + "\n")
+
+        records_count, total_changes, _, _ = asyncio.run(
+            async_cleanup(args.batch_size, args.max_in_flight, dry_run=True, verbose=verbose, audit=audit))
+
+        if not records_count:
+            print_success("\n✓ No duplicates or invalid data found! Database is clean.")
+            return
+
+        print_dry_run_summary(records_count, total_changes)
+
+        if confirm():
+            print_info("\nApplying cleanup...")
+            _, total_changes, updated, failed = asyncio.run(
+                async_cleanup(args.batch_size, args.max_in_flight, dry_run=False, verbose=verbose,
+                              audit=audit))
+            print_cleanup_complete(updated, total_changes)
+            if failed:
+                print_error(f"✗ {failed} records failed to write or kept changing; run the "
+                            f"cleanup again to retry them")
+
+    except Exception as e:
+        print_error(f"\nAn error occurred: {e}")
+        import traceback
+        traceback.print_exc()
+
+    finally:
+        audit.close()
+        print_info("\nMongoDB connection closed.")
+        if args.audit_file:
+            print_info(f"Audit log written to {args.audit_file}")
+        if args.metrics_file:
+            print_info(f"Metrics written to "
+                       f"{METRICS.write(args.metrics_file, 'remove_duplicate_attendance_async')}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,11 @@ This script:
 5. Provides a summary of changes
 
 Usage:
-    python scripts/remove_duplicate_iat_semesters.py
+    python scripts/remove_duplicate_iat_semesters.py [--detection aggregate|scan]
+                                                     [--resume] [--checkpoint-every N]
+                                                     [--incremental] [--metrics-file PATH]
+                                                     [--quiet] [--audit-file PATH]
+                                                     [--plan-file PATH | --apply-plan PATH]
 
 Requirements:
     - pymongo
@@ -22,6 +26,8 @@ Install dependencies:
 
 import os
 import sys
+import time
+import argparse
 from datetime import datetime
 from collections import Counter
 
@@ -33,6 +39,19 @@ except ImportError:
     print("Install it using: pip install pymongo")
     sys.exit(1)
 
+from cleanup_audit import AuditLog, add_output_arguments
+from cleanup_metrics import METRICS, add_metrics_argument
+from cleanup_plan import PlanWriter, add_plan_arguments, read_plan, record_hash
+from cleanup_state import DEFAULT_CHECKPOINT_EVERY, ChangeTracker, Checkpoint, resolve_collection
+from remove_duplicate_attendance import (
+    MAX_CONFLICT_RETRIES,
+    VERSION_FIELD,
+    apply_plan_file,
+    build_guarded_update,
+    build_pull_diff,
+    print_plan_totals,
+)
+
 try:
     from dotenv import load_dotenv
     load_dotenv()
@@ -43,6 +62,18 @@ except ImportError:
 # MongoDB Configuration
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/your_database')
 
+# Fields read by the duplicate check; everything else stays on the server
+IAT_PROJECTION = {'userId': 1, 'semesters.semester': 1, 'semesters._id': 1, '__v': 1}
+
+# Likely names of the IAT collection, tried in order before any name containing 'iat'
+IAT_COLLECTION_NAMES = ['iatmarks', 'iat', 'Iat', 'IatMarks', 'iatMarks', 'iats']
+
+# Script name recorded in (and checked against) plan files
+PLAN_SCRIPT = 'remove_duplicate_iat_semesters'
+
+# Number of flagged _ids fetched per find() in aggregate detection mode
+FETCH_BATCH_SIZE = 1000
+
 # Color codes for terminal output
 class Colors:
     HEADER = '\033[95m'
@@ -86,10 +117,12 @@ def connect_to_mongodb():
     """Connect to MongoDB and return the database instance"""
     try:
         print_info(f"Connecting to MongoDB...")
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-        
-        # Test connection
-        client.admin.command('ping')
+        with METRICS.phase('connect'):
+            client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000,
+                                 event_listeners=[METRICS.commands])
+            
+            # Test connection
+            client.admin.command('ping')
         
         # Extract database name from URI or use default
         db_name = MONGODB_URI.split('/')[-1].split('?')[0] or 'test'
@@ -107,28 +140,21 @@ def connect_to_mongodb():
         sys.exit(1)
 
 
-def find_duplicate_semesters(db):
-    """Find all IAT records with duplicate semesters"""
-    
-    # Try to find the correct collection name
-    collection_names = db.list_collection_names()
-    print_info(f"Available collections: {', '.join(collection_names)}")
-    
-    # Look for IAT collection (case-insensitive)
-    iat_collection_name = None
-    possible_names = ['iatmarks', 'iat', 'Iat', 'IatMarks', 'iatMarks']
-    
-    for name in possible_names:
-        if name in collection_names:
-            iat_collection_name = name
-            break
-    
-    if not iat_collection_name:
-        # Check for any collection with 'iat' in the name
-        for name in collection_names:
-            if 'iat' in name.lower():
-                iat_collection_name = name
-                break
+def resolve_iat_collection(db):
+    """Return the name of the IAT collection, or None if there is none"""
+    return resolve_collection(db, 'Iat', IAT_COLLECTION_NAMES, pattern='iat')
+
+
+def find_duplicate_semesters(db, detection='aggregate', query=None):
+    """
+    Find all IAT records with duplicate semesters
+
+    detection='aggregate' finds the offending _ids with a server-side
+    pipeline and fetches only those records; detection='scan' reads
+    every record and checks it in Python. query limits the search to
+    part of the collection.
+    """
+    iat_collection_name = resolve_iat_collection(db)
     
     if not iat_collection_name:
         print_error("Could not find IAT collection!")
@@ -139,155 +165,455 @@ def find_duplicate_semesters(db):
     print_info("Scanning for duplicate semesters...")
     
     iat_collection = db[iat_collection_name]
-    total_records = iat_collection.count_documents({})
+    with METRICS.phase('count'):
+        total_records = iat_collection.estimated_document_count()
     print_info(f"Total IAT records: {total_records}")
     
     if total_records == 0:
         print_warning("No records found in IAT collection!")
         return []
     
+    if detection == 'scan':
+        records = iat_collection.find(query or {}, IAT_PROJECTION)
+    else:
+        with METRICS.phase('detect'):
+            duplicate_ids = find_duplicate_ids(iat_collection, query)
+        print_info(f"Server-side detection flagged {len(duplicate_ids)} records")
+        records = fetch_records(iat_collection, duplicate_ids)
+    
     records_with_duplicates = []
     
-    for record in iat_collection.find():
-        user_id = record.get('userId')
-        record_id = record.get('_id')
-        semesters = record.get('semesters', [])
-        
-        if not semesters:
-            continue
-        
-        # Count semester occurrences
-        semester_numbers = [sem.get('semester') for sem in semesters]
-        semester_counts = Counter(semester_numbers)
-        
-        # Find duplicates
-        duplicates = {sem: count for sem, count in semester_counts.items() if count > 1}
-        
-        if duplicates:
-            # Show detailed info about which positions have duplicates
-            duplicate_positions = {}
-            for idx, sem in enumerate(semesters):
-                sem_num = sem.get('semester')
-                if sem_num in duplicates:
-                    if sem_num not in duplicate_positions:
-                        duplicate_positions[sem_num] = []
-                    duplicate_positions[sem_num].append({
-                        'index': idx,
-                        '_id': sem.get('_id', 'No _id')
-                    })
-            
-            records_with_duplicates.append({
-                '_id': record_id,
-                'userId': user_id,
-                'duplicates': duplicates,
-                'duplicate_positions': duplicate_positions,
-                'total_semesters': len(semesters),
-                'semesters': semesters,
-                'collection_name': iat_collection_name
-            })
+    for record in METRICS.timed(records, 'read', 'documents_scanned'):
+        record_info = describe_duplicates(record, iat_collection_name)
+        if record_info:
+            records_with_duplicates.append(record_info)
     
     return records_with_duplicates
 
 
-def remove_duplicates(db, records_with_duplicates, dry_run=True):
-    """Remove duplicate semesters, keeping only the latest entry"""
+def find_duplicate_ids(collection, query=None):
+    """
+    Find the _ids of records with duplicate semesters on the server.
+
+    Only the _ids of offending records cross the wire. Records whose
+    semester numbers are all distinct are dropped by the first $match
+    before anything is unwound.
+    """
+    pipeline = [{'$match': query}] if query else []
+    pipeline += [
+        {'$match': {'$expr': {'$lt': [
+            {'$size': {'$setUnion': [{'$ifNull': ['$semesters.semester', []]}, []]}},
+            {'$size': {'$ifNull': ['$semesters', []]}}
+        ]}}},
+        {'$project': {'semesters.semester': 1}},
+        {'$unwind': '$semesters'},
+        {'$group': {
+            '_id': {'record': '$_id', 'semester': '$semesters.semester'},
+            'count': {'$sum': 1}
+        }},
+        {'$match': {'count': {'$gt': 1}}},
+        {'$group': {'_id': '$_id.record'}},
+    ]
+    return [doc['_id'] for doc in collection.aggregate(pipeline, allowDiskUse=True)]
+
+
+def fetch_records(collection, record_ids, batch_size=FETCH_BATCH_SIZE, projection=IAT_PROJECTION):
+    """Fetch the given records in batches of $in queries"""
+    for start in range(0, len(record_ids), batch_size):
+        yield from collection.find({'_id': {'$in': record_ids[start:start + batch_size]}},
+                                   projection)
+
+
+def describe_duplicates(record, collection_name):
+    """Return duplicate details for a record, or None if it has no duplicates"""
+    user_id = record.get('userId')
+    record_id = record.get('_id')
+    semesters = record.get('semesters', [])
+    
+    if not semesters:
+        return None
+    
+    # Count semester occurrences
+    semester_numbers = [sem.get('semester') for sem in semesters]
+    semester_counts = Counter(semester_numbers)
+    
+    # Find duplicates
+    duplicates = {sem: count for sem, count in semester_counts.items() if count > 1}
+    
+    if not duplicates:
+        return None
+    
+    # Show detailed info about which positions have duplicates
+    duplicate_positions = {}
+    for idx, sem in enumerate(semesters):
+        sem_num = sem.get('semester')
+        if sem_num in duplicates:
+            if sem_num not in duplicate_positions:
+                duplicate_positions[sem_num] = []
+            duplicate_positions[sem_num].append({
+                'index': idx,
+                '_id': sem.get('_id', 'No _id')
+            })
+    
+    return {
+        '_id': record_id,
+        'userId': user_id,
+        'version': record.get(VERSION_FIELD),
+        'duplicates': duplicates,
+        'duplicate_positions': duplicate_positions,
+        'total_semesters': len(semesters),
+        'semesters': semesters,
+        'collection_name': collection_name,
+        'hash': record_hash(record)
+    }
+
+
+def keep_latest_indexes(semesters):
+    """Return the indexes of the last occurrence of each semester, in array order"""
+    semester_positions = {}
+    
+    # Find the LAST position of each semester
+    for idx, semester in enumerate(semesters):
+        sem_num = semester.get('semester')
+        semester_positions[sem_num] = idx  # This keeps getting updated to the last position
+    
+    return sorted(semester_positions.values())
+
+
+def build_keep_update(keep_indexes):
+    """
+    Build a pipeline update keeping only the semesters at keep_indexes.
+
+    The kept semesters are picked out of the stored document by index,
+    so their subjects never have to be read by this script.
+    """
+    return [{'$set': {'semesters': [
+        {'$arrayElemAt': ['$semesters', idx]} for idx in keep_indexes
+    ]}}]
+
+
+def update_kept_semesters(collection, record_info, keep_indexes):
+    """
+    Write the keep-latest update of one record, guarded by its version.
+
+    If the record changed since it was read, it is read again and its
+    duplicates are worked out again, up to MAX_CONFLICT_RETRIES times.
+    Returns the number of records modified (0 or 1).
+    """
+    for attempt in range(MAX_CONFLICT_RETRIES + 1):
+        started = time.perf_counter()
+        result = collection.update_one(*build_guarded_keep_update(
+            record_info['_id'], record_info.get('version'), record_info['semesters'], keep_indexes))
+        METRICS.record_write(time.perf_counter() - started,
+                             result.matched_count, result.modified_count)
+        if result.matched_count:
+            return result.modified_count
+        
+        METRICS.count('write_conflicts')
+        record = collection.find_one({'_id': record_info['_id']}, IAT_PROJECTION)
+        record_info = record and describe_duplicates(record, collection.name)
+        if not record_info:
+            # Deleted, or no duplicates left after the concurrent change
+            return 0
+        keep_indexes = keep_latest_indexes(record_info['semesters'])
+    
+    return 0
+
+
+def build_guarded_keep_update(record_id, version, semesters, keep_indexes):
+    """
+    Return the (filter, update) keeping only the semesters at
+    keep_indexes, guarded by the record's version.
+
+    keep_latest_indexes keeps array order, so a $pull of the other
+    semesters by _id does the same as the whole-array rewrite; the
+    rewrite is only used when the semesters cannot be told apart by _id.
+    """
+    diff = build_keep_diff(semesters, keep_indexes)
+    update = diff['update'] if diff else build_keep_update(keep_indexes)
+    return build_guarded_update(record_id, version, update)
+
+
+def build_keep_diff(semesters, keep_indexes):
+    """
+    Build a $pull removing the semesters not at keep_indexes by _id, or
+    None if they cannot be told apart by _id.
+    """
+    kept = set(keep_indexes)
+    removed = [semester for idx, semester in enumerate(semesters) if idx not in kept]
+    return build_pull_diff('semesters', semesters, removed)
+
+
+def remove_duplicates(db, records_with_duplicates, dry_run=True, checkpoint=None,
+                      verbose=True, audit=None):
+    """
+    Remove duplicate semesters, keeping only the latest entry
+
+    With a checkpoint, the live pass handles the records in _id order,
+    continues from the checkpoint's saved totals and records its progress
+    after every record. Progress stops advancing at the first record that
+    was not updated, and the checkpoint is kept for --resume unless every
+    update went through. verbose=False leaves out the per-record lines;
+    every record is written to the audit log, if one is given.
     
+    Returns (records_updated, duplicates_removed, records_failed).
+    """
+    
+    audit = audit or AuditLog()
     total_duplicates_removed = 0
     total_records_updated = 0
+    failed_count = 0
     
-    for record_info in records_with_duplicates:
-        record_id = record_info['_id']
-        user_id = record_info['userId']
-        duplicates = record_info['duplicates']
-        semesters = record_info['semesters']
-        collection_name = record_info.get('collection_name', 'iatmarks')
-        
-        iat_collection = db[collection_name]
-        
-        print_info(f"\nProcessing User ID: {user_id}")
-        print_info(f"  Record _id: {record_id}")
-        print_info(f"  Total semesters before: {len(semesters)}")
-        
-        # Track which semesters we've seen (keep LAST occurrence, which is the latest)
-        seen_semesters = set()
-        semesters_to_keep = []
-        duplicates_count = 0
-        
-        # Iterate through semesters in FORWARD order, marking duplicates
-        # But we'll reverse the check to keep the LAST occurrence
-        semester_positions = {}
-        
-        # First pass: find the LAST position of each semester
-        for idx, semester in enumerate(semesters):
-            sem_num = semester.get('semester')
-            semester_positions[sem_num] = idx  # This keeps getting updated to the last position
-        
-        # Second pass: keep only the last occurrence of each semester
-        for idx, semester in enumerate(semesters):
-            sem_num = semester.get('semester')
+    if checkpoint and not dry_run:
+        # Walk the records in _id order so the checkpoint marks a clean cut
+        records_with_duplicates = sorted(records_with_duplicates, key=lambda r: r['_id'])
+        if checkpoint.last_id is not None:
+            total_records_updated = checkpoint.totals['updated']
+            total_duplicates_removed = checkpoint.totals['removed']
+    else:
+        checkpoint = None
+    
+    try:
+        for record_info in records_with_duplicates:
+            record_id = record_info['_id']
+            user_id = record_info['userId']
+            semesters = record_info['semesters']
+            collection_name = record_info.get('collection_name', 'iatmarks')
             
-            if semester_positions[sem_num] == idx:
-                # This is the last occurrence - keep it
-                semesters_to_keep.append(semester)
-                print_success(f"  ✓ Keeping semester {sem_num} at index {idx} (latest entry)")
-            else:
-                # This is a duplicate - mark for removal
-                duplicates_count += 1
-                print_warning(f"  ✗ Removing duplicate semester {sem_num} at index {idx}")
-        
-        print_info(f"  Total semesters after: {len(semesters_to_keep)}")
-        print_info(f"  Duplicates removed: {duplicates_count}")
-        
-        if duplicates_count > 0:
-            total_duplicates_removed += duplicates_count
-            total_records_updated += 1
+            iat_collection = db[collection_name]
             
-            if not dry_run:
-                # Update the record with deduplicated semesters
-                result = iat_collection.update_one(
-                    {'_id': record_id},
-                    {'$set': {'semesters': semesters_to_keep}}
-                )
+            semesters_to_keep = keep_latest_indexes(semesters)
+            duplicates_count = len(semesters) - len(semesters_to_keep)
+            kept = set(semesters_to_keep)
+            
+            if verbose:
+                print_info(f"\nProcessing User ID: {user_id}")
+                print_info(f"  Record _id: {record_id}")
+                print_info(f"  Total semesters before: {len(semesters)}")
+                
+                for idx, semester in enumerate(semesters):
+                    sem_num = semester.get('semester')
+                    
+                    if idx in kept:
+                        print_success(f"  ✓ Keeping semester {sem_num} at index {idx} (latest entry)")
+                    else:
+                        print_warning(f"  ✗ Removing duplicate semester {sem_num} at index {idx}")
                 
-                if result.modified_count > 0:
-                    print_success(f"  ✓✓ Successfully updated record for User ID: {user_id}")
+                print_info(f"  Total semesters after: {len(semesters_to_keep)}")
+                print_info(f"  Duplicates removed: {duplicates_count}")
+            
+            audit_fields = {
+                '_id': record_id,
+                'userId': user_id,
+                'kept_indexes': semesters_to_keep,
+                'removed_indexes': [idx for idx in range(len(semesters)) if idx not in kept],
+            }
+            
+            if duplicates_count > 0:
+                total_duplicates_removed += duplicates_count
+                total_records_updated += 1
+                
+                if not dry_run:
+                    # Update the record with deduplicated semesters
+                    if update_kept_semesters(iat_collection, record_info, semesters_to_keep) > 0:
+                        if verbose:
+                            print_success(f"  ✓✓ Successfully updated record for User ID: {user_id}")
+                        audit.record('updated', **audit_fields)
+                    else:
+                        failed_count += 1
+                        if verbose:
+                            print_error(f"  ✗✗ Failed to update record for User ID: {user_id}")
+                        audit.record('not_modified', **audit_fields)
                 else:
-                    print_error(f"  ✗✗ Failed to update record for User ID: {user_id}")
-            else:
-                print_warning(f"  [DRY RUN] Would update record for User ID: {user_id}")
+                    if verbose:
+                        print_warning(f"  [DRY RUN] Would update record for User ID: {user_id}")
+                    audit.record('would_update', **audit_fields)
+            elif verbose:
+                print_info(f"  No duplicates found for this record")
+            
+            if checkpoint and not failed_count:
+                checkpoint.progress(record_id, {
+                    'updated': total_records_updated,
+                    'removed': total_duplicates_removed,
+                })
+    except BaseException:
+        if checkpoint:
+            checkpoint.save()
+            print_warning(f"Progress saved up to _id {checkpoint.last_id}; "
+                          f"re-run with --resume to continue")
+        raise
+    
+    if checkpoint:
+        if failed_count:
+            checkpoint.save()
+            print_warning(f"{failed_count} records were not updated; "
+                          f"re-run with --resume to retry them")
         else:
-            print_info(f"  No duplicates found for this record")
+            checkpoint.clear()
+    
+    return total_records_updated, total_duplicates_removed, failed_count
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Remove duplicate semesters from IAT records")
+    parser.add_argument('--detection', choices=['aggregate', 'scan'], default='aggregate',
+                        help="find duplicates with a server-side aggregation (default) "
+                             "or by scanning every record in Python")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted live run from its saved checkpoint")
+    parser.add_argument('--checkpoint-every', type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                        help=f"save live-run progress every N records "
+                             f"(default: {DEFAULT_CHECKPOINT_EVERY})")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only check records changed since the previous --incremental run")
+    add_metrics_argument(parser)
+    add_output_arguments(parser)
+    add_plan_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    if args.incremental and args.resume:
+        parser.error("--incremental cannot be combined with --resume")
+    if (args.plan_file or args.apply_plan) and (args.resume or args.incremental):
+        parser.error("--plan-file and --apply-plan cannot be combined with --resume or --incremental")
+    return args
+
+
+def print_cleanup_complete(updated, removed, failed=0):
+    """Print the totals of a live run"""
+    print_header("CLEANUP COMPLETE")
+    print_success(f"✓ Updated {updated} IAT records")
+    print_success(f"✓ Removed {removed} duplicate semester entries")
+    if failed:
+        print_error(f"✗ {failed} IAT records could not be updated")
+    else:
+        print_success("✓ Database cleanup successful!")
+
+
+def write_iat_plan(db, records_with_duplicates, path, audit=None):
+    """
+    Write the keep-latest plan of every record with duplicates to a plan file.
+
+    Returns (records_count, removed).
+    """
+    audit = audit or AuditLog()
+    collection_name = resolve_iat_collection(db) or IAT_COLLECTION_NAMES[0]
+    removed = 0
+    
+    with PlanWriter(path, PLAN_SCRIPT, db.name, collection_name) as writer:
+        for record_info in records_with_duplicates:
+            keep_indexes = keep_latest_indexes(record_info['semesters'])
+            changes = {'duplicate_semesters': len(record_info['semesters']) - len(keep_indexes)}
+            writer.add(record_info['_id'], record_info['userId'], keep_indexes, changes,
+                       record_info['hash'], record_info['version'],
+                       build_keep_diff(record_info['semesters'], keep_indexes))
+            audit.record('would_update', _id=record_info['_id'], userId=record_info['userId'],
+                         kept_indexes=keep_indexes)
+            removed += changes['duplicate_semesters']
+    
+    return writer.count, removed
+
+
+def run_apply_plan(db, path, verbose=True, audit=None):
+    """Apply a plan file written by an earlier --plan-file run"""
+    header, entries = read_plan(path, PLAN_SCRIPT, db.name)
+    print_info(f"Applying the plan made at {header['created_at']}...")
+    totals, total_changes = apply_plan_file(db[header['collection']], entries, IAT_PROJECTION,
+                                            build_keep_update, verbose=verbose, audit=audit)
+    print_plan_totals(totals)
+    print_cleanup_complete(totals['modified'], total_changes['duplicate_semesters'])
+
+
+def resume_live_run(db, checkpoint, detection, verbose=True, audit=None):
+    """Continue an interrupted live run after the checkpoint's last _id"""
+    print_info(f"Resuming the live run after _id {checkpoint.last_id}")
+    records_with_duplicates = find_duplicate_semesters(
+        db, detection=detection, query={'_id': {'$gt': checkpoint.last_id}})
+    updated, removed, failed = remove_duplicates(db, records_with_duplicates, dry_run=False,
+                                                 checkpoint=checkpoint, verbose=verbose, audit=audit)
+    print_cleanup_complete(updated, removed, failed)
+
+
+def start_incremental(db):
+    """
+    Work out which IAT records changed since the previous incremental run.
+
+    Returns (tracker, query); query is None when every record has to be
+    checked. Call tracker.commit() once every record has been cleaned.
+    """
+    collection_name = resolve_iat_collection(db)
+    if not collection_name:
+        return None, None
+    
+    tracker = ChangeTracker(db[collection_name], 'remove_duplicate_iat_semesters_incremental', db.name)
+    query = tracker.pending_query()
     
-    return total_records_updated, total_duplicates_removed
+    if tracker.mode == 'change-stream':
+        print_info(f"Change stream: {len(query['_id']['$in'])} records changed since the last run")
+    elif tracker.mode == 'watermark':
+        print_warning("Change streams unavailable: only records inserted since the last run are checked")
+    else:
+        print_info("No previous incremental run found, checking every record")
+    
+    return tracker, query
 
 
 def main():
     """Main execution function"""
+    args = parse_args()
     print_header("IAT Duplicate Semester Removal Script")
     
     # Connect to MongoDB
     db, client = connect_to_mongodb()
     
+    checkpoint = Checkpoint('remove_duplicate_iat_semesters', db.name, args.checkpoint_every)
+    verbose = not args.quiet
+    audit = AuditLog(args.audit_file)
+    
     try:
+        if args.apply_plan:
+            run_apply_plan(db, args.apply_plan, verbose, audit)
+            return
+        
+        if args.resume:
+            if checkpoint.load():
+                resume_live_run(db, checkpoint, args.detection, verbose, audit)
+                return
+            print_warning("No saved progress found, starting a new run")
+        
+        tracker, query = start_incremental(db) if args.incremental else (None, None)
+        
         # Find records with duplicate semesters
-        records_with_duplicates = find_duplicate_semesters(db)
+        records_with_duplicates = find_duplicate_semesters(db, detection=args.detection, query=query)
+        
+        if args.plan_file:
+            # An empty plan is still written, so a scheduled --apply-plan never
+            # picks up an older one
+            records_count, removed = write_iat_plan(db, records_with_duplicates, args.plan_file, audit)
+            print_info(f"Records to update: {records_count}, duplicate semesters to remove: {removed}")
+            print_success(f"✓ Plan written to {args.plan_file}; "
+                          f"apply it with --apply-plan {args.plan_file}")
+            return
         
         if not records_with_duplicates:
             print_success("\n✓ No duplicate semesters found! Database is clean.")
+            if tracker:
+                tracker.commit()
             return
         
         print_warning(f"\nFound {len(records_with_duplicates)} records with duplicate semesters:")
         
-        for record in records_with_duplicates:
-            print(f"\n  {'─' * 60}")
-            print(f"  Record _id: {record['_id']}")
-            print(f"  User ID: {record['userId']}")
-            print(f"  Total semesters: {record['total_semesters']}")
-            print(f"  Duplicate semesters: {record['duplicates']}")
-            if 'duplicate_positions' in record:
-                print(f"  Duplicate positions:")
-                for sem_num, positions in record['duplicate_positions'].items():
-                    print(f"    Semester {sem_num} appears at indices: {[p['index'] for p in positions]}")
+        if verbose:
+            for record in records_with_duplicates:
+                print(f"\n  {'─' * 60}")
+                print(f"  Record _id: {record['_id']}")
+                print(f"  User ID: {record['userId']}")
+                print(f"  Total semesters: {record['total_semesters']}")
+                print(f"  Duplicate semesters: {record['duplicates']}")
+                if 'duplicate_positions' in record:
+                    print(f"  Duplicate positions:")
+                    for sem_num, positions in record['duplicate_positions'].items():
+                        print(f"    Semester {sem_num} appears at indices: {[p['index'] for p in positions]}")
         
         # Ask for confirmation
         print("\n" + "="*70)
@@ -295,7 +621,8 @@ def main():
         print("="*70 + "\n")
         
         # Perform dry run
-        updated, removed = remove_duplicates(db, records_with_duplicates, dry_run=True)
+        updated, removed, _ = remove_duplicates(db, records_with_duplicates, dry_run=True,
+                                                verbose=verbose, audit=audit)
         
         print("\n" + "="*70)
         print_info("DRY RUN SUMMARY:")
@@ -308,12 +635,14 @@ def main():
         
         if response in ['yes', 'y']:
             print_info("\nRemoving duplicate semesters...")
-            updated, removed = remove_duplicates(db, records_with_duplicates, dry_run=False)
-            
-            print_header("CLEANUP COMPLETE")
-            print_success(f"✓ Updated {updated} IAT records")
-            print_success(f"✓ Removed {removed} duplicate semester entries")
-            print_success("✓ Database cleanup successful!")
+            updated, removed, failed = remove_duplicates(db, records_with_duplicates, dry_run=False,
+                                                         checkpoint=checkpoint, verbose=verbose,
+                                                         audit=audit)
+            print_cleanup_complete(updated, removed, failed)
+            if tracker and not failed:
+                tracker.commit()
+            elif tracker:
+                print_warning("The next --incremental run checks the same records again")
         else:
             print_warning(f"\nOperation cancelled. You entered: '{response}'")
             print_info("Please run the script again and enter 'yes' or 'y' to confirm.")
@@ -325,8 +654,13 @@ def main():
     
     finally:
         # Close MongoDB connection
+        audit.close()
         client.close()
         print_info("\nMongoDB connection closed.")
+        if args.audit_file:
+            print_info(f"Audit log written to {args.audit_file}")
+        if args.metrics_file:
+            print_info(f"Metrics written to {METRICS.write(args.metrics_file, 'remove_duplicate_iat_semesters')}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Remove duplicate semesters from every per-semester collection in one run.
+
+IAT, External, POAttainment and TYLScores records all have the
+userId + semesters[{semester, ...}] shape. For each selected collection:
+1. The records with duplicate semesters are found with a server-side aggregation
+2. Only those records are fetched, with just their semester numbers
+   and _ids
+3. The latest entry of each semester (the last in the array) is kept,
+   by $pull-ing the others by semesters._id like the IAT script does
+4. The updates are sent in unordered bulk_write batches, each guarded by
+   the record's version (__v). A record saved in the meantime is fetched
+   and planned again and retried, like the attendance cleanup does
+
+Without --apply the run only reports what would change.
+
+Usage:
+    python scripts/remove_duplicate_semesters.py [--collections NAME ...]
+                                                 [--batch-size N] [--apply]
+                                                 [--metrics-file PATH]
+
+Requirements:
+    pip install pymongo python-dotenv
+"""
+
+import argparse
+
+from pymongo import UpdateOne
+
+from cleanup_metrics import METRICS, add_metrics_argument
+from cleanup_state import resolve_collection
+from remove_duplicate_attendance import (
+    DEFAULT_BATCH_SIZE,
+    VERSION_FIELD,
+    chunked,
+    connect_to_mongodb,
+    print_error,
+    print_header,
+    print_info,
+    print_success,
+    print_warning,
+    write_cleaned_batch,
+)
+from remove_duplicate_iat_semesters import (
+    IAT_PROJECTION,
+    build_guarded_keep_update,
+    fetch_records,
+    find_duplicate_ids,
+    keep_latest_indexes,
+    resolve_iat_collection,
+)
+
+
+# Mongoose model name -> collection name; None means it has to be looked up
+SEMESTER_COLLECTIONS = {
+    'Iat': None,
+    'External': 'externals',
+    'POAttainment': 'poattainments',
+    'TYLScores': 'tylscores',
+}
+
+# The semester numbers pick the entries to keep, their _ids remove the others
+SEMESTER_PROJECTION = IAT_PROJECTION
+
+
+def resolve_semester_collection(db, model):
+    """Return the collection name for model, or None if it does not exist"""
+    if model == 'Iat':
+        return resolve_iat_collection(db)
+
+    return resolve_collection(db, model, [SEMESTER_COLLECTIONS[model]])
+
+
+def plan_keep(record):
+    """Return the keep-latest plan of a record, or None if it has no duplicate semesters"""
+    semesters = record.get('semesters') or []
+    keep_indexes = keep_latest_indexes(semesters)
+    if len(keep_indexes) == len(semesters):
+        return None
+    return {'_id': record['_id'], 'version': record.get(VERSION_FIELD), 'semesters': semesters,
+            'keep_indexes': keep_indexes}
+
+
+def build_keep_operation(plan):
+    """Return the version-guarded UpdateOne of a keep-latest plan"""
+    return UpdateOne(*build_guarded_keep_update(plan['_id'], plan['version'], plan['semesters'],
+                                                plan['keep_indexes']))
+
+
+def iter_keep_plans(collection, record_ids, totals):
+    """Yield the keep-latest plan of each flagged record, counting what it removes"""
+    records = fetch_records(collection, record_ids, projection=SEMESTER_PROJECTION)
+    for record in METRICS.timed(records, 'read', 'documents_scanned'):
+        plan = plan_keep(record)
+        if not plan:
+            continue
+
+        totals['records'] += 1
+        totals['removed'] += len(plan['semesters']) - len(plan['keep_indexes'])
+        yield plan
+
+
+def replan_records(collection, record_ids):
+    """Fetch records again and return the plans of the ones that still have duplicates"""
+    records = fetch_records(collection, record_ids, projection=SEMESTER_PROJECTION)
+    return [plan for plan in map(plan_keep, records) if plan]
+
+
+def dedupe_collection(collection, batch_size=DEFAULT_BATCH_SIZE, apply=False):
+    """
+    Remove duplicate semesters from one collection.
+
+    Returns a dict with the records to update, the duplicate semesters
+    removed, the records actually modified and the records skipped
+    because they kept changing through every retry.
+    """
+    totals = {'records': 0, 'removed': 0, 'updated': 0, 'conflicts': 0}
+
+    with METRICS.phase('detect'):
+        record_ids = find_duplicate_ids(collection)
+    print_info(f"Server-side detection flagged {len(record_ids)} records")
+
+    plans = iter_keep_plans(collection, record_ids, totals)
+    for batch_number, batch in enumerate(chunked(plans, batch_size), start=1):
+        if apply:
+            _, modified, _, conflicts = write_cleaned_batch(collection, batch, batch_number,
+                                                            build=build_keep_operation,
+                                                            reclean=replan_records)
+            totals['updated'] += modified
+            totals['conflicts'] += conflicts
+
+    return totals
+
+
+def print_collection_summary(collection_name, totals, apply):
+    """Print the totals of one collection"""
+    print("\n" + "="*70)
+    print_info(f"{collection_name.upper()} SUMMARY:")
+    if apply:
+        print(f"  Records updated: {totals['updated']} of {totals['records']}")
+        print(f"  Duplicate semesters removed: {totals['removed']}")
+        if totals['conflicts']:
+            print_warning(f"{totals['conflicts']} records changed during the run; "
+                          f"re-run to clean them")
+    else:
+        print(f"  Records to update: {totals['records']}")
+        print(f"  Duplicate semesters to remove: {totals['removed']}")
+    print("="*70 + "\n")
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    models = list(SEMESTER_COLLECTIONS)
+    parser = argparse.ArgumentParser(description="Remove duplicate semesters from per-semester collections")
+    parser.add_argument('--collections', nargs='+', choices=models, default=models,
+                        help="models whose collections are cleaned (default: all)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"updates per bulk_write batch (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--apply', action='store_true',
+                        help="write the changes; without it the run only reports them")
+    add_metrics_argument(parser)
+    return parser.parse_args(argv)
+
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print_header("Duplicate Semester Removal")
+
+    if not args.apply:
+        print_warning("⚠ DRY RUN MODE - pass --apply to write the changes")
+
+    db, client = connect_to_mongodb()
+
+    try:
+        for model in args.collections:
+            collection_name = resolve_semester_collection(db, model)
+            if not collection_name:
+                print_warning(f"Could not find the {model} collection, skipping it")
+                continue
+
+            print_info(f"Checking {collection_name}...")
+            totals = dedupe_collection(db[collection_name], args.batch_size, args.apply)
+            print_collection_summary(collection_name, totals, args.apply)
+
+        if args.apply:
+            print_success("✓ Duplicate semester removal complete!")
+
+    except Exception as e:
+        print_error(f"\nAn error occurred: {e}")
+        import traceback
+        traceback.print_exc()
+
+    finally:
+        client.close()
+        print_info("\nMongoDB connection closed.")
+        if args.metrics_file:
+            print_info(f"Metrics written to {METRICS.write(args.metrics_file, 'remove_duplicate_semesters')}")
+
+
+if __name__ == "__main__":
+    main()
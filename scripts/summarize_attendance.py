@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Maintain a materialised attendance summary collection.
+
+Dashboards and low-attendance reports otherwise read a student's whole
+nested attendance record and total it up on every request. This job adds
+the totals up on the server and $merges them into attendancesummaries,
+one small row per:
+- subject:  attended and total classes of one subject in one semester
+- semester: the same over every subject of the semester
+- student:  the same over every semester
+
+Every row has userId, level, semester (None on student rows), the
+attendedClasses / totalClasses sums, percentage and refreshedAt. Subject
+rows also carry subjectCode, subjectName and the number of months added
+up; semester rows the number of subjects; student rows the number of
+semesters.
+
+The pipeline reads the records the way the cleanup leaves them: the
+latest entry of each semester and month, the first of each subject
+(by subjectCode, else subjectName) and no invalid subjects. The classes
+of a subject are added up over the months of the semester.
+
+By default every student is rebuilt. --incremental refreshes only the
+students whose records changed since the previous incremental run, and
+--users refreshes the given students. Rows the refresh did not rewrite
+(e.g. a subject that is gone) are deleted afterwards, so readers never
+see an empty or half-built collection. The userId of a deleted record
+can no longer be read, so when --incremental finds that a changed record
+was deleted it rebuilds every student instead.
+
+Usage:
+    python scripts/summarize_attendance.py [--incremental | --users ID ...]
+                                           [--batch-size N] [--metrics-file PATH]
+
+Requirements:
+    pip install pymongo python-dotenv   (MongoDB 4.4+ for $merge into the
+                                         collection being aggregated)
+"""
+
+import argparse
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING
+
+from cleanup_metrics import METRICS, add_metrics_argument
+from cleanup_state import ChangeTracker
+from remove_duplicate_attendance import (
+    DEFAULT_BATCH_SIZE,
+    chunked,
+    connect_to_mongodb,
+    print_error,
+    print_header,
+    print_info,
+    print_success,
+    print_warning,
+)
+
+
+SOURCE_COLLECTION = 'attendances'
+SUMMARY_COLLECTION = 'attendancesummaries'
+
+# Indexes serving the per-student dashboards and the low-attendance reports
+SUMMARY_INDEXES = [
+    [('userId', ASCENDING), ('level', ASCENDING), ('semester', ASCENDING)],
+    [('level', ASCENDING), ('percentage', ASCENDING)],
+    [('refreshedAt', ASCENDING)],
+]
+
+# State file of --incremental runs
+TRACKER_NAME = 'summarize_attendance_incremental'
+
+# Subject fields, trimmed the way is_invalid_subject and the dedup read them
+SUBJECT_NAME = {'$trim': {'input': {'$toString': {'$ifNull': ['$subjects.subjectName', '']}}}}
+SUBJECT_CODE = {'$trim': {'input': {'$toString': {'$ifNull': ['$subjects.subjectCode', '']}}}}
+
+# Mirrors is_invalid_subject in remove_duplicate_attendance.py
+VALID_SUBJECT = {'$and': [
+    {'$ne': [SUBJECT_NAME, '']},
+    {'$not': [{'$regexMatch': {'input': SUBJECT_NAME, 'regex': r'^\d+$'}}]},
+    {'$ne': [{'$ifNull': ['$subjects.attendedClasses', None]}, None]},
+    {'$ne': [{'$ifNull': ['$subjects.totalClasses', None]}, None]},
+    {'$ne': ['$subjects.totalClasses', 0]},
+]}
+
+# subjectCode when it is set, subjectName otherwise
+SUBJECT_KEY = {'$cond': [{'$ne': [SUBJECT_CODE, '']}, SUBJECT_CODE, SUBJECT_NAME]}
+
+PERCENTAGE = {'$cond': [
+    {'$gt': ['$totalClasses', 0]},
+    {'$round': [{'$multiply': [{'$divide': ['$attendedClasses', '$totalClasses']}, 100]}, 2]},
+    None,
+]}
+
+
+def merge_stage():
+    """Return the $merge stage writing summary rows by _id"""
+    return {'$merge': {'into': SUMMARY_COLLECTION, 'on': '_id',
+                       'whenMatched': 'replace', 'whenNotMatched': 'insert'}}
+
+
+def subject_pipeline(refreshed_at, user_ids=None):
+    """
+    Build the pipeline computing the subject rows from the attendance records.
+
+    $unwind keeps array order and $group's $first / $last follow it, so
+    the latest semester and month entries and the first subject entry
+    are the ones the cleanup keeps.
+    """
+    pipeline = [{'$match': {'userId': {'$in': user_ids}}}] if user_ids is not None else []
+    pipeline += [
+        {'$project': {
+            'userId': 1,
+            'semesters.semester': 1,
+            'semesters.months.month': 1,
+            'semesters.months.subjects.subjectCode': 1,
+            'semesters.months.subjects.subjectName': 1,
+            'semesters.months.subjects.attendedClasses': 1,
+            'semesters.months.subjects.totalClasses': 1,
+        }},
+        {'$unwind': '$semesters'},
+        {'$group': {
+            '_id': {'userId': '$userId', 'semester': '$semesters.semester'},
+            'months': {'$last': '$semesters.months'},
+        }},
+        {'$unwind': '$months'},
+        {'$group': {
+            '_id': {'userId': '$_id.userId', 'semester': '$_id.semester', 'month': '$months.month'},
+            'subjects': {'$last': '$months.subjects'},
+        }},
+        {'$unwind': '$subjects'},
+        {'$match': {'$expr': VALID_SUBJECT}},
+        {'$group': {
+            '_id': {'userId': '$_id.userId', 'semester': '$_id.semester', 'month': '$_id.month',
+                    'subject': SUBJECT_KEY},
+            'subject': {'$first': '$subjects'},
+        }},
+        {'$group': {
+            '_id': {'userId': '$_id.userId', 'semester': '$_id.semester', 'subject': '$_id.subject'},
+            'subjectCode': {'$last': '$subject.subjectCode'},
+            'subjectName': {'$last': '$subject.subjectName'},
+            'attendedClasses': {'$sum': '$subject.attendedClasses'},
+            'totalClasses': {'$sum': '$subject.totalClasses'},
+            'months': {'$sum': 1},
+        }},
+        {'$set': {
+            'userId': '$_id.userId',
+            'level': 'subject',
+            'semester': '$_id.semester',
+            'percentage': PERCENTAGE,
+            'refreshedAt': refreshed_at,
+        }},
+        merge_stage(),
+    ]
+    return pipeline
+
+
+def rollup_pipeline(level, refreshed_at, user_ids=None):
+    """
+    Build the pipeline adding this run's subject rows up into semester or
+    student rows. It reads and $merges into the summary collection.
+    """
+    match = {'level': 'subject', 'refreshedAt': refreshed_at}
+    if user_ids is not None:
+        match['userId'] = {'$in': user_ids}
+
+    if level == 'semester':
+        group = {
+            '_id': {'userId': '$userId', 'semester': '$semester', 'subject': None},
+            'subjects': {'$sum': 1},
+        }
+        semester = '$_id.semester'
+    else:
+        group = {
+            '_id': {'userId': '$userId', 'semester': None, 'subject': None},
+            'semesters': {'$addToSet': '$semester'},
+        }
+        semester = None
+
+    group.update({
+        'attendedClasses': {'$sum': '$attendedClasses'},
+        'totalClasses': {'$sum': '$totalClasses'},
+    })
+    fields = {
+        'userId': '$_id.userId',
+        'level': level,
+        'semester': semester,
+        'percentage': PERCENTAGE,
+        'refreshedAt': refreshed_at,
+    }
+    if level == 'student':
+        fields['semesters'] = {'$size': '$semesters'}
+
+    return [{'$match': match}, {'$group': group}, {'$set': fields}, merge_stage()]
+
+
+def run_timestamp():
+    """Return the current time at the millisecond precision BSON dates keep"""
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def refresh_summary(db, user_ids=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Rebuild the summary rows of user_ids, or of every student.
+
+    Students are refreshed batch_size at a time. Returns the number of
+    stale rows deleted.
+    """
+    source = db[SOURCE_COLLECTION]
+    summary = db[SUMMARY_COLLECTION]
+    for keys in SUMMARY_INDEXES:
+        summary.create_index(keys)
+
+    refreshed_at = run_timestamp()
+    batches = [None] if user_ids is None else chunked(user_ids, batch_size)
+    deleted = 0
+
+    for batch in batches:
+        with METRICS.phase('aggregate'):
+            source.aggregate(subject_pipeline(refreshed_at, batch), allowDiskUse=True)
+            for level in ('semester', 'student'):
+                summary.aggregate(rollup_pipeline(level, refreshed_at, batch), allowDiskUse=True)
+
+        stale = {'refreshedAt': {'$lt': refreshed_at}}
+        if batch is not None:
+            stale['userId'] = {'$in': batch}
+        with METRICS.phase('write'):
+            deleted += summary.delete_many(stale).deleted_count
+
+    return deleted
+
+
+def changed_user_ids(db, tracker):
+    """
+    Return the userIds whose records changed since the last incremental
+    run, or None when every student has to be refreshed, as when a
+    changed record has since been deleted.
+    """
+    query = tracker.pending_query()
+    if tracker.mode == 'change-stream':
+        changed = len(query['_id']['$in'])
+        print_info(f"Change stream: {changed} records changed since the last run")
+        if db[SOURCE_COLLECTION].count_documents(query) < changed:
+            print_info("Some changed records were deleted, refreshing every student")
+            return None
+    elif tracker.mode == 'watermark':
+        print_warning("Change streams unavailable: only records inserted since the last run are refreshed")
+    else:
+        print_info("No previous incremental run found, refreshing every student")
+        return None
+
+    return db[SOURCE_COLLECTION].distinct('userId', query)
+
+
+def print_summary_totals(db):
+    """Print the row counts of the summary collection"""
+    summary = db[SUMMARY_COLLECTION]
+    print("\n" + "="*70)
+    print_info(f"{SUMMARY_COLLECTION.upper()}:")
+    for level in ('student', 'semester', 'subject'):
+        print(f"  {level.capitalize()} rows: {summary.count_documents({'level': level})}")
+    print("="*70 + "\n")
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Refresh the attendance summary collection")
+    scope = parser.add_mutually_exclusive_group()
+    scope.add_argument('--incremental', action='store_true',
+                       help="refresh only the students whose records changed since the last "
+                            "incremental run")
+    scope.add_argument('--users', nargs='+', metavar='USER_ID',
+                       help="refresh only these students")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"students refreshed per pipeline run (default: {DEFAULT_BATCH_SIZE})")
+    add_metrics_argument(parser)
+    return parser.parse_args(argv)
+
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print_header("Attendance Summary Refresh")
+
+    db, client = connect_to_mongodb()
+
+    try:
+        tracker = None
+        if args.incremental:
+            tracker = ChangeTracker(db[SOURCE_COLLECTION], TRACKER_NAME, db.name)
+            user_ids = changed_user_ids(db, tracker)
+        elif args.users:
+            user_ids = [ObjectId(user_id) if ObjectId.is_valid(user_id) else user_id
+                        for user_id in args.users]
+        else:
+            user_ids = None
+
+        if user_ids is None:
+            print_info("Rebuilding the summary of every student...")
+        else:
+            print_info(f"Refreshing the summary of {len(user_ids)} students...")
+
+        deleted = refresh_summary(db, user_ids, args.batch_size)
+        if tracker:
+            tracker.commit()
+
+        print_summary_totals(db)
+        if deleted:
+            print_info(f"Deleted {deleted} rows no longer backed by attendance data")
+        print_success("✓ Attendance summary refreshed!")
+
+    except Exception as e:
+        print_error(f"\nAn error occurred: {e}")
+        import traceback
+        traceback.print_exc()
+
+    finally:
+        client.close()
+        print_info("\nMongoDB connection closed.")
+        if args.metrics_file:
+            print_info(f"Metrics written to {METRICS.write(args.metrics_file, 'summarize_attendance')}")
+
+
+if __name__ == "__main__":
+    main()
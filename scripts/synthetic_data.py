@@ -0,0 +1,133 @@
+"""
+Synthetic attendance and IAT documents for benchmarking the cleanup scripts.
+
+The documents have the shapes Mongoose stores for src/models/Student/Attendance.js
+and src/models/Admin/IatMarks.js, including the subdocument _ids and __v.
+The rates control how much work the cleanup scripts find:
+- duplicate_rate: chance that a semester, month or subject is uploaded twice
+- invalid_rate: chance that a subject is invalid ("No Data", 0 total classes,
+  a numeric name)
+- cumulative_rate: chance that a month carries a 'Cumulative' summary subject
+
+The same seed always gives the same documents.
+"""
+
+import random
+
+from bson import ObjectId
+
+
+def new_id(rng):
+    """Return an ObjectId drawn from rng, so documents are reproducible"""
+    return ObjectId(rng.getrandbits(96).to_bytes(12, 'big'))
+
+
+def subject_code(index):
+    """Return the code of the index-th subject"""
+    return f"21CS{51 + index}"
+
+
+def attendance_subject(rng, index, invalid_rate):
+    """Build one attendance subject, invalid with probability invalid_rate"""
+    total = rng.randint(20, 40)
+    subject = {
+        '_id': new_id(rng),
+        'subjectCode': subject_code(index),
+        'subjectName': f"Subject {index + 1}",
+        'attendedClasses': rng.randint(0, total),
+        'totalClasses': total,
+    }
+    if rng.random() < invalid_rate:
+        kind = rng.randrange(3)
+        if kind == 0:
+            subject['attendedClasses'] = None
+            subject['subjectName'] = 'No Data'
+        elif kind == 1:
+            subject['totalClasses'] = 0
+        else:
+            subject['subjectName'] = str(rng.randint(1, 99))
+    return subject
+
+
+def with_duplicates(rng, items, duplicate_rate, copy):
+    """Append a fresh copy of each item with probability duplicate_rate"""
+    duplicates = [copy(item) for item in items if rng.random() < duplicate_rate]
+    return items + duplicates
+
+
+def attendance_month(rng, month, subjects, rates):
+    """Build one month of attendance"""
+    month_subjects = [attendance_subject(rng, index, rates['invalid_rate']) for index in range(subjects)]
+    month_subjects = with_duplicates(rng, month_subjects, rates['duplicate_rate'],
+                                     lambda subject: {**subject, '_id': new_id(rng)})
+    if rng.random() < rates['cumulative_rate']:
+        month_subjects.append({
+            '_id': new_id(rng),
+            'subjectCode': '',
+            'subjectName': rng.choice(['Cumulative', 'CUMULATIVE', 'cumulative']),
+            'attendedClasses': sum(s['attendedClasses'] or 0 for s in month_subjects),
+            'totalClasses': sum(s['totalClasses'] for s in month_subjects),
+        })
+    return {
+        '_id': new_id(rng),
+        'month': month,
+        'subjects': month_subjects,
+        'overallAttendance': round(rng.uniform(40, 100), 2),
+    }
+
+
+def copy_month(rng, month):
+    """Copy a month the way a repeated upload stores it, with new _ids"""
+    return {**month, '_id': new_id(rng),
+            'subjects': [{**subject, '_id': new_id(rng)} for subject in month['subjects']]}
+
+
+def generate_attendance(students=1000, semesters=8, months=5, subjects=6,
+                        duplicate_rate=0.05, invalid_rate=0.02, cumulative_rate=0.1, seed=42):
+    """Yield one attendance document per student"""
+    rng = random.Random(seed)
+    rates = {'duplicate_rate': duplicate_rate, 'invalid_rate': invalid_rate,
+             'cumulative_rate': cumulative_rate}
+
+    for _ in range(students):
+        student_semesters = []
+        for semester in range(1, semesters + 1):
+            semester_months = [attendance_month(rng, month, subjects, rates) for month in range(1, months + 1)]
+            semester_months = with_duplicates(rng, semester_months, duplicate_rate,
+                                              lambda month: copy_month(rng, month))
+            student_semesters.append({'_id': new_id(rng), 'semester': semester, 'months': semester_months})
+
+        student_semesters = with_duplicates(
+            rng, student_semesters, duplicate_rate,
+            lambda sem: {**sem, '_id': new_id(rng), 'months': [copy_month(rng, m) for m in sem['months']]})
+        yield {'_id': new_id(rng), 'userId': new_id(rng), 'semesters': student_semesters, '__v': 0}
+
+
+def iat_subject(rng, index):
+    """Build one IAT subject; the marks are stored as strings"""
+    iat1, iat2 = rng.randint(0, 30), rng.randint(0, 30)
+    return {
+        '_id': new_id(rng),
+        'subjectName': f"Subject {index + 1}",
+        'subjectCode': subject_code(index),
+        'iat1': str(iat1),
+        'iat2': str(iat2),
+        'avg': str((iat1 + iat2) / 2),
+    }
+
+
+def generate_iat(students=1000, semesters=8, subjects=6, duplicate_rate=0.05, seed=42):
+    """Yield one IAT document per student"""
+    rng = random.Random(seed)
+
+    for _ in range(students):
+        student_semesters = [
+            {'_id': new_id(rng), 'semester': semester,
+             'subjects': [iat_subject(rng, index) for index in range(subjects)]}
+            for semester in range(1, semesters + 1)
+        ]
+        student_semesters = with_duplicates(
+            rng, student_semesters, duplicate_rate,
+            lambda sem: {'_id': new_id(rng), 'semester': sem['semester'],
+                         'subjects': [iat_subject(rng, index) for index in range(subjects)]})
+        yield {'_id': new_id(rng), 'userId': new_id(rng), 'semesters': student_semesters, '__v': 0}
@@ -0,0 +1,149 @@
+"""
+A small evaluator of the aggregation expressions the scripts build.
+
+mongomock does not run update pipelines, so the tests apply them with
+this instead. Only the operators the scripts use are supported, with
+MongoDB's semantics where they differ from Python's (e.g. false is not
+equal to 0, and a missing field is not null).
+"""
+
+import copy
+import re
+
+MISSING = object()
+
+
+def same(a, b):
+    """BSON equality: booleans only equal booleans"""
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    return a is b if MISSING in (a, b) else a == b
+
+
+def field(value, path):
+    """Follow a dotted path, mapping over arrays like a field path does"""
+    for name in path:
+        if isinstance(value, list):
+            value = [item for item in (field(item, [name]) for item in value) if item is not MISSING]
+        elif isinstance(value, dict):
+            value = value.get(name, MISSING)
+        else:
+            return MISSING
+    return value
+
+
+def evaluate(expr, doc, variables=None):
+    """Evaluate an aggregation expression against doc"""
+    variables = variables or {}
+    if isinstance(expr, str) and expr.startswith('$$'):
+        name, *path = expr[2:].split('.')
+        return field(variables[name], path)
+    if isinstance(expr, str) and expr.startswith('$'):
+        return field(doc, expr[1:].split('.'))
+    if isinstance(expr, list):
+        return [evaluate(item, doc, variables) for item in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) == 1 and next(iter(expr)).startswith('$'):
+        (operator, args), = expr.items()
+        return OPERATORS[operator](args, doc, variables)
+    return {key: value for key, value in ((key, evaluate(value, doc, variables)) for key, value in expr.items())
+            if value is not MISSING}
+
+
+def _args(args, doc, variables):
+    return [evaluate(arg, doc, variables) for arg in (args if isinstance(args, list) else [args])]
+
+
+def _let(args, doc, variables):
+    scope = dict(variables)
+    scope.update({name: evaluate(value, doc, variables) for name, value in args['vars'].items()})
+    return evaluate(args['in'], doc, scope)
+
+
+def _map(args, doc, variables):
+    items = evaluate(args['input'], doc, variables)
+    return [evaluate(args['in'], doc, {**variables, args.get('as', 'this'): item}) for item in items]
+
+
+def _filter(args, doc, variables):
+    items = evaluate(args['input'], doc, variables)
+    return [item for item in items
+            if truthy(evaluate(args['cond'], doc, {**variables, args.get('as', 'this'): item}))]
+
+
+def _cond(args, doc, variables):
+    if isinstance(args, dict):
+        args = [args['if'], args['then'], args['else']]
+    branch = args[1] if truthy(evaluate(args[0], doc, variables)) else args[2]
+    return evaluate(branch, doc, variables)
+
+
+def _regex_match(args, doc, variables):
+    flags = re.IGNORECASE if 'i' in args.get('options', '') else 0
+    return re.search(args['regex'], evaluate(args['input'], doc, variables), flags) is not None
+
+
+def _merge_objects(args, doc, variables):
+    merged = {}
+    for value in _args(args, doc, variables):
+        if isinstance(value, dict):
+            merged.update(value)
+    return merged
+
+
+def _index_of_array(args, doc, variables):
+    array, value = _args(args, doc, variables)
+    return next((i for i, item in enumerate(array) if same(item, value)), -1)
+
+
+def truthy(value):
+    """Aggregation truthiness: null, missing, false and 0 are false"""
+    return value is not MISSING and value is not None and value is not False and value != 0
+
+
+def null(value):
+    return value is MISSING or value is None
+
+
+OPERATORS = {
+    '$literal': lambda args, doc, variables: copy.deepcopy(args),
+    '$let': _let,
+    '$map': _map,
+    '$filter': _filter,
+    '$cond': _cond,
+    '$regexMatch': _regex_match,
+    '$mergeObjects': _merge_objects,
+    '$indexOfArray': _index_of_array,
+    '$ifNull': lambda args, doc, variables: next(
+        (value for value in _args(args, doc, variables) if not null(value)), None),
+    '$eq': lambda args, doc, variables: same(*_args(args, doc, variables)),
+    '$in': lambda args, doc, variables: (lambda value, array: any(same(value, item) for item in array))(
+        *_args(args, doc, variables)),
+    '$not': lambda args, doc, variables: not truthy(_args(args, doc, variables)[0]),
+    '$and': lambda args, doc, variables: all(truthy(value) for value in _args(args, doc, variables)),
+    '$or': lambda args, doc, variables: any(truthy(value) for value in _args(args, doc, variables)),
+    '$size': lambda args, doc, variables: len(_args(args, doc, variables)[0]),
+    '$range': lambda args, doc, variables: list(range(*_args(args, doc, variables))),
+    '$arrayElemAt': lambda args, doc, variables: (lambda array, index: array[index])(
+        *_args(args, doc, variables)),
+    '$concatArrays': lambda args, doc, variables: [item for array in _args(args, doc, variables)
+                                                   for item in array],
+    '$add': lambda args, doc, variables: sum(_args(args, doc, variables)),
+    '$toString': lambda args, doc, variables: (lambda value: None if null(value) else str(value))(
+        _args(args, doc, variables)[0]),
+    '$trim': lambda args, doc, variables: evaluate(args['input'], doc, variables).strip(),
+}
+
+
+def apply_pipeline(doc, stages):
+    """Apply the $set stages of an update pipeline to a copy of doc"""
+    doc = copy.deepcopy(doc)
+    for stage in stages:
+        (name, fields), = stage.items()
+        assert name == '$set', f"unsupported stage {name}"
+        for key, value in fields.items():
+            value = evaluate(value, doc)
+            if value is not MISSING:
+                doc[key] = value
+    return doc
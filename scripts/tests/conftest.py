@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The scripts import their siblings by module name, as when run as python scripts/x.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,36 @@
+"""Collection wrappers the tests use to stage concurrent writes."""
+
+
+class ChangingCollection:
+    """
+    A collection whose record is saved by someone else just before the
+    first bulk_write, so its version-guarded update matches nothing.
+    """
+
+    def __init__(self, collection, record_id, update):
+        self.collection = collection
+        self.record_id = record_id
+        self.update = update
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, operations, ordered=True):
+        if self.update is not None:
+            self.collection.update_one({'_id': self.record_id}, self.update)
+            self.update = None
+        return self.collection.bulk_write(operations, ordered=ordered)
+
+
+class ReorderingCollection:
+    """A collection that applies unordered insert_many batches back to front, as a server may"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def insert_many(self, documents, ordered=True):
+        documents = list(documents)
+        return self.collection.insert_many(documents if ordered else documents[::-1], ordered=ordered)
@@ -0,0 +1,33 @@
+from benchmark_cleanup import compare_to_baseline, throughput_changes
+
+
+def baseline(**values):
+    return {'steps': [dict({'step': 'apply_cleanup', 'docs_per_sec': 1000.0, 'round_trips': 10,
+                            'bytes_sent': 5000, 'bytes_received': 2000}, **values)]}
+
+
+def test_within_tolerance_is_not_a_regression():
+    rows = baseline(round_trips=10, bytes_sent=5200)['steps']
+    assert compare_to_baseline(rows, baseline(), 0.05) == []
+
+
+def test_costlier_steps_regress():
+    rows = baseline(round_trips=12, bytes_received=2500)['steps']
+    assert compare_to_baseline(rows, baseline(), 0.05) == [
+        ('apply_cleanup', 'round_trips', 10, 12),
+        ('apply_cleanup', 'bytes_received', 2000, 2500),
+    ]
+
+
+def test_slower_steps_are_reported_but_do_not_regress():
+    rows = baseline(docs_per_sec=100.0)['steps']
+    assert compare_to_baseline(rows, baseline(), 0.05) == []
+    assert throughput_changes(rows, baseline()) == [('apply_cleanup', 1000.0, 100.0)]
+
+
+def test_unmeasured_values_and_failed_steps_are_skipped():
+    rows = baseline(docs_per_sec=1.0, round_trips=None, bytes_sent=None, bytes_received=None)['steps']
+    assert compare_to_baseline(rows, baseline(error='RuntimeError: x'), 0.05) == []
+    assert throughput_changes(rows, baseline(error='RuntimeError: x')) == []
+    assert compare_to_baseline(rows[:1], baseline(round_trips=None, bytes_sent=None,
+                                                  bytes_received=None, docs_per_sec=1.0), 0.05) == []
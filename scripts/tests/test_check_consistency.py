@@ -0,0 +1,33 @@
+from check_consistency import check_student, semester_subjects
+
+
+def attendance(*subjects):
+    return {'semesters': [{'semester': 1, 'months': [{'month': 'Jan', 'subjects': [
+        dict(subject, attendedClasses=1, totalClasses=2) for subject in subjects]}]}]}
+
+
+def marks(*subjects):
+    return {'semesters': [{'semester': 1, 'subjects': list(subjects)}]}
+
+
+def subject_mismatches(attendance_record, iat_record):
+    found = {'attendance': semester_subjects(attendance_record, 'attendance'),
+             'iat': semester_subjects(iat_record, 'iat')}
+    return [mismatch for kind, mismatch in check_student('u1', found, ['attendance', 'iat'])
+            if kind == 'subject_mismatch']
+
+
+def test_subjects_without_a_code_match_by_name():
+    assert subject_mismatches(
+        attendance({'subjectName': ' Maths '}, {'subjectCode': 'cs101', 'subjectName': 'Programming'}),
+        marks({'subjectCode': 'MA101', 'subjectName': 'maths'}, {'subjectCode': 'CS101', 'subjectName': 'Prog'}),
+    ) == []
+
+
+def test_missing_subjects_are_reported_by_code_or_name():
+    mismatches = subject_mismatches(
+        attendance({'subjectName': 'Physics'}),
+        marks({'subjectCode': 'MA101', 'subjectName': 'Maths'}),
+    )
+    assert mismatches == [{'userId': 'u1', 'semester': 1,
+                           'missing_subjects': {'attendance': ['MA101'], 'iat': ['PHYSICS']}}]
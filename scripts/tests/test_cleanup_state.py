@@ -0,0 +1,49 @@
+from cleanup_state import ChangeTracker, token_reached
+
+
+class FakeChangeStream:
+    """Replays (resume token, change or None) pairs, one per try_next()"""
+
+    def __init__(self, events):
+        self.events = list(events)
+        self.alive = True
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def try_next(self):
+        token, change = self.events.pop(0)
+        self.resume_token = {'_data': token}
+        return change
+
+
+class FakeCollection:
+    name = 'attendances'
+
+    def __init__(self, events):
+        self.events = events
+
+    def watch(self, *args, **kwargs):
+        return FakeChangeStream(self.events)
+
+
+def change(record_id):
+    return {'documentKey': {'_id': record_id}}
+
+
+def test_changes_after_an_empty_get_more_are_collected():
+    events = [('02', change(1)), ('03', None), ('04', None), ('05', change(2)), ('06', None)]
+    tracker = ChangeTracker(FakeCollection(events), 'test', 'db')
+
+    assert tracker._changed_since({'_data': '01'}, {'_data': '06'}) == {1, 2}
+
+
+def test_token_reached():
+    assert token_reached({'_data': '8265A0'}, {'_data': '8265A0'})
+    assert token_reached({'_data': '8265B0'}, {'_data': '8265A0'})
+    assert not token_reached({'_data': '82659F'}, {'_data': '8265A0'})
+    assert not token_reached(None, {'_data': '8265A0'})
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+from bson import ObjectId
+
+import export_snapshot
+
+mongomock = pytest.importorskip('mongomock')
+pytest.importorskip('pyarrow')
+
+
+def attendance_record(semester, subjects):
+    """Return a one-month attendance record; semester None leaves the number out"""
+    entry = {'months': [{'month': 8, 'overallAttendance': 75, 'subjects': subjects}]}
+    if semester is not None:
+        entry['semester'] = semester
+    return {'_id': ObjectId(), 'userId': ObjectId(), 'semesters': [entry]}
+
+
+def subject(code, attended, total=10):
+    return {'subjectCode': code, 'subjectName': code.lower(), 'attendedClasses': attended,
+            'totalClasses': total}
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_exported_rows_read_back_by_semester(tmp_path, file_format):
+    collection = mongomock.MongoClient()['test']['attendances']
+    records = [attendance_record(3, [subject('CS1', 5), subject('CS2', '7')]),
+               attendance_record(None, [subject('CS3', 'AB')])]
+    collection.insert_many(records)
+    snapshot = str(tmp_path)
+
+    count, rows = export_snapshot.export_dataset(collection, 'attendance', os.path.join(snapshot, 'attendance'),
+                                                 file_format)
+    export_snapshot.write_manifest(snapshot, {'attendance': {'format': file_format}})
+    table = export_snapshot.open_snapshot(snapshot, 'attendance').to_table()
+
+    assert count == 2 and rows == {3: 2, None: 1}
+    assert os.path.isdir(os.path.join(snapshot, 'attendance', 'semester=__HIVE_DEFAULT_PARTITION__'))
+    assert sorted(table.to_pylist(), key=lambda row: row['subjectCode']) == [
+        {'recordId': str(records[0]['_id']), 'userId': str(records[0]['userId']), 'semesterIndex': 0,
+         'month': 8, 'monthIndex': 0, 'overallAttendance': 75.0, 'subjectIndex': 0,
+         'subjectCode': 'CS1', 'subjectName': 'cs1', 'attendedClasses': 5.0, 'totalClasses': 10.0,
+         'semester': 3},
+        {'recordId': str(records[0]['_id']), 'userId': str(records[0]['userId']), 'semesterIndex': 0,
+         'month': 8, 'monthIndex': 0, 'overallAttendance': 75.0, 'subjectIndex': 1,
+         'subjectCode': 'CS2', 'subjectName': 'cs2', 'attendedClasses': 7.0, 'totalClasses': 10.0,
+         'semester': 3},
+        {'recordId': str(records[1]['_id']), 'userId': str(records[1]['userId']), 'semesterIndex': 0,
+         'month': 8, 'monthIndex': 0, 'overallAttendance': 75.0, 'subjectIndex': 0,
+         'subjectCode': 'CS3', 'subjectName': 'cs3', 'attendedClasses': None, 'totalClasses': 10.0,
+         'semester': None},
+    ]
@@ -0,0 +1,178 @@
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+import import_attendance
+from aggregation import apply_pipeline, evaluate
+
+mongomock = pytest.importorskip('mongomock')
+
+HEADER = "userId,semester,month,subjectCode,subjectName,attendedClasses,totalClasses\n"
+
+
+def run_import(tmp_path, monkeypatch, rows, batch_size):
+    """Dry-run an import, returning its totals and the months of every upsert built"""
+    sheet = tmp_path / 'sheet.csv'
+    sheet.write_text(HEADER + ''.join(rows))
+
+    upserts = []
+    build = import_attendance.build_student_upsert
+
+    def record_upsert(user_id, months):
+        upserts.append((user_id, months))
+        return build(user_id, months)
+
+    monkeypatch.setattr(import_attendance, 'build_student_upsert', record_upsert)
+    db = mongomock.MongoClient()['test']
+    totals = import_attendance.import_sheet(db, str(sheet), batch_size=batch_size)
+    return totals, upserts
+
+
+def test_rows_interleaved_across_students(tmp_path, monkeypatch):
+    students = [ObjectId() for _ in range(3)]
+    # Sorted by subject, so every student's rows are split over the sheet
+    rows = [f"{student},3,8,CS1,Maths,1,2\n" for student in students]
+    rows += [f"{student},3,8,CS2,Physics,1,2\n" for student in students]
+
+    totals, upserts = run_import(tmp_path, monkeypatch, rows, batch_size=2)
+
+    assert totals['students'] == 3
+    assert totals['months'] == 3
+    assert totals['rows'] == 6
+    assert totals['upserts'] == len(upserts)
+    # A student split over batches gets the month's full overallAttendance every time
+    assert {overall for _, months in upserts for _, overall in months.values()} == {50.0}
+    subjects = {}
+    for user_id, months in upserts:
+        for sent, _ in months.values():
+            subjects.setdefault(user_id, set()).update(subject['subjectCode'] for subject in sent)
+    assert subjects == {student: {'CS1', 'CS2'} for student in students}
+
+
+def test_rejected_row_rejects_its_whole_month(tmp_path, monkeypatch):
+    student = ObjectId()
+    rows = [
+        f"{student},3,8,CS1,Maths,1,2\n",
+        f"{student},3,9,CS1,Maths,1,2\n",
+        f"{student},3,8,CS2,Physics,3,2\n",
+    ]
+
+    totals, upserts = run_import(tmp_path, monkeypatch, rows, batch_size=1)
+
+    assert totals['rows_rejected'] == 1
+    assert totals['months_rejected'] == 1
+    assert totals['months'] == 1
+    assert [list(months) for _, months in upserts] == [[(3, 9)]]
+
+
+def test_invalid_subjects_count_toward_overall_attendance(tmp_path, monkeypatch):
+    student = ObjectId()
+    rows = [
+        f"{student},3,8,CS1,Maths,4,4\n",
+        f"{student},3,8,,12,0,4\n",
+    ]
+
+    totals, upserts = run_import(tmp_path, monkeypatch, rows, batch_size=10)
+
+    assert totals['invalid_subjects'] == 1
+    [(_, months)] = upserts
+    sent, overall = months[(3, 8)]
+    assert [subject['subjectCode'] for subject in sent] == ['CS1']
+    assert overall == 50.0
+
+
+def subject(code, name, attended, total=2):
+    return {'subjectCode': code, 'subjectName': name, 'attendedClasses': attended, 'totalClasses': total}
+
+
+@pytest.mark.parametrize('candidate', [
+    subject('CS1', 'Maths', 1),
+    subject('CS1', 'Maths', 0),
+    subject(None, 'Maths', 1),
+    subject('CS1', 'No Data', 1),
+    subject('CS1', ' 12 ', 1),
+    subject('CS1', '', 1),
+    subject('CS1', None, 1),
+    subject('CS1', 'Maths', None),
+    subject('CS1', 'Maths', False),
+    subject('CS1', 'Maths', 1, 0),
+    subject('CS1', 'Maths', 1, None),
+])
+def test_both_sides_of_the_merge_use_one_invalid_rule(candidate):
+    on_server = evaluate(import_attendance.invalid_expr('subject'), {}, {'subject': candidate})
+    assert on_server == import_attendance.is_controller_invalid_subject(candidate)
+
+
+def test_upsert_creates_a_missing_record():
+    user_id = ObjectId()
+    stages = import_attendance.student_pipeline({(3, 8): ([subject('CS1', 'Maths', 1)], 50.0)})
+
+    record = apply_pipeline({'userId': user_id}, stages)
+
+    [semester] = record['semesters']
+    [month] = semester['months']
+    assert (semester['semester'], month['month'], month['overallAttendance']) == (3, 8, 50.0)
+    assert [(s['subjectCode'], s['attendedClasses']) for s in month['subjects']] == [('CS1', 1)]
+    assert record['__v'] == 1
+
+
+def test_upsert_merges_into_an_existing_record():
+    month_id = ObjectId()
+    untouched_month = {'_id': ObjectId(), 'month': 9, 'subjects': [subject('CS1', 'Maths', 1)]}
+    untouched_semester = {'_id': ObjectId(), 'semester': 4, 'months': []}
+    record = {'userId': ObjectId(), '__v': 4, 'semesters': [
+        {'_id': ObjectId(), 'semester': 3, 'months': [
+            {'_id': month_id, 'month': 8, 'overallAttendance': 10.0, 'subjects': [
+                subject('CS1', 'Maths', 0),
+                subject(None, 'Physics', 1),
+                subject('CS1', 'Maths', 2),
+                subject('CS9', 'No Data', 1),
+            ]},
+            untouched_month,
+        ]},
+        untouched_semester,
+    ]}
+    stages = import_attendance.student_pipeline({
+        (3, 8): ([subject('CS1', 'Maths', 2), subject(None, 'Physics', 2), subject('CS3', 'Chemistry', 1)], 75.0),
+        (5, 1): ([subject('CS5', 'Biology', 1)], 50.0),
+    })
+
+    merged = apply_pipeline(record, stages)
+
+    semester, kept_semester, new_semester = merged['semesters']
+    month, kept_month = semester['months']
+    assert month['_id'] == month_id
+    assert month['overallAttendance'] == 75.0
+    # The first subject of a key is replaced, the invalid one dropped and new ones appended
+    assert [(s.get('subjectCode'), s['subjectName'], s['attendedClasses']) for s in month['subjects']] == [
+        ('CS1', 'Maths', 2), (None, 'Physics', 2), ('CS1', 'Maths', 2), ('CS3', 'Chemistry', 1)]
+    assert (kept_month, kept_semester) == (untouched_month, untouched_semester)
+    assert new_semester['semester'] == 5
+    assert [m['month'] for m in new_semester['months']] == [1]
+    assert merged['__v'] == 5
+
+
+class UpsertingCollection:
+    """Answers bulk_write like a server upserting some of the records"""
+
+    def __init__(self, matched, upserted):
+        self.matched, self.upserted = matched, upserted
+
+    def bulk_write(self, operations, ordered):
+        return SimpleNamespace(matched_count=self.matched, modified_count=self.matched,
+                               upserted_count=self.upserted)
+
+
+def test_created_records_are_the_upserted_count():
+    batch = import_attendance.ImportBatch()
+    month_totals = {}
+    for _ in range(3):
+        key = (ObjectId(), 3, 8)
+        batch.add(key, subject('CS1', 'Maths', 1))
+        month_totals[key] = [1, 2, 1]
+    totals = import_attendance.Counter()
+
+    import_attendance.flush_batch(UpsertingCollection(1, 2), batch, 1, month_totals, totals, apply=True)
+
+    assert (totals['created'], totals['updated'], totals['failed']) == (2, 1, 0)
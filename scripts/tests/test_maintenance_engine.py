@@ -0,0 +1,69 @@
+import pytest
+from bson import ObjectId
+
+import maintenance_engine
+from fakes import ChangingCollection
+from remove_duplicate_attendance import apply_plan, plan_attendance_cleanup
+
+mongomock = pytest.importorskip('mongomock')
+
+
+def attendance_record(subjects):
+    """Return a one-semester, one-month attendance record"""
+    return {'_id': 1, 'userId': 2, 'semesters': [{'semester': 1, 'months': [{'month': 8, 'subjects': subjects}]}]}
+
+
+def subject(code, name, attended=5, total=10):
+    return {'subjectCode': code, 'subjectName': name, 'attendedClasses': attended, 'totalClasses': total}
+
+
+def run_pass(rules, record):
+    """Plan a record with the attendance pass of rules and apply the plan"""
+    plan, changes = maintenance_engine.attendance_pass(rules)['plan'](record)
+    if plan is not None:
+        apply_plan(record, plan)
+    return changes
+
+
+def test_subject_dedup_alone_keeps_subjects_without_code_or_name():
+    subjects = [subject('CS1', 'Maths'), subject('', ''), subject(None, None), subject('CS1', 'Maths again')]
+    record = attendance_record(subjects)
+
+    changes = run_pass(['subject-dedup'], record)
+
+    assert record['semesters'][0]['months'][0]['subjects'] == subjects[:3]
+    assert changes['duplicate_subjects'] == 1
+    assert changes['total_after'] == 3
+
+
+def test_invalid_subject_rule_still_drops_subjects_without_a_name():
+    subjects = [subject('CS1', 'Maths'), subject('', '')]
+    record = attendance_record(subjects)
+
+    changes = run_pass(['subject-dedup', 'invalid-subjects'], record)
+
+    assert record['semesters'][0]['months'][0]['subjects'] == subjects[:1]
+    assert changes['invalid_subjects'] == 1
+
+
+def test_every_dropped_subject_is_counted():
+    subjects = [subject('', ''), subject('CS1', 'A'), subject('CS1', 'B'), subject('', '12'), subject('', '')]
+    _, changes = plan_attendance_cleanup(attendance_record(subjects))
+
+    dropped = changes['duplicate_subjects'] + changes['invalid_subjects']
+    assert changes['total_before'] - changes['total_after'] == dropped
+
+
+def test_iat_records_saved_during_the_write_are_planned_again_and_retried():
+    semesters = [{'_id': ObjectId(), 'semester': number} for number in (1, 2, 1, 2)]
+    db = mongomock.MongoClient()['test']
+    record_id = db.iatmarks.insert_one({'userId': ObjectId(), 'semesters': semesters[:3], '__v': 0}).inserted_id
+    iat_pass = maintenance_engine.iat_pass(db, ['semester-dedup'])
+    save = {'$push': {'semesters': semesters[3]}, '$inc': {'__v': 1}}
+
+    records_count, totals, updated_count, conflicts = maintenance_engine.run_pass(
+        {'iatmarks': ChangingCollection(db.iatmarks, record_id, save)}, iat_pass, apply=True)
+
+    assert (records_count, updated_count, conflicts) == (1, 1, 0)
+    assert totals == {'duplicate_semesters': 1}
+    assert db.iatmarks.find_one()['semesters'] == semesters[2:]
@@ -0,0 +1,58 @@
+import pytest
+from bson import ObjectId
+
+import migrate_flatten_attendance
+from fakes import ReorderingCollection
+
+mongomock = pytest.importorskip('mongomock')
+
+
+def attendance_record(user_id, months):
+    """Return a one-semester attendance record with a subject per (month, attended)"""
+    return {'_id': ObjectId(), 'userId': user_id, 'semesters': [{'semester': 1, 'months': [
+        {'month': month, 'subjects': [{'subjectCode': 'CS1', 'subjectName': 'Maths',
+                                       'attendedClasses': attended, 'totalClasses': 10}]}
+        for month, attended in months]}]}
+
+
+def test_build_keeps_the_older_record_of_a_shared_user_and_verifies():
+    db = mongomock.MongoClient()['test']
+    user_id = ObjectId()
+    older = attendance_record(user_id, [(8, 5)])
+    newer = attendance_record(user_id, [(8, 9), (9, 7)])
+    db.attendances.insert_many([older, newer, attendance_record(ObjectId(), [(8, 6)])])
+
+    totals = migrate_flatten_attendance.build_staging(db, 'attendancemonths')
+
+    assert totals == {'inserted': 3, 'duplicates': 1, 'failed': 0}
+    august = db.attendancemonths_staging.find_one({'userId': user_id, 'month': 8})
+    assert august['attendanceId'] == older['_id']
+    assert august['subjects'][0]['attendedClasses'] == 5
+    assert migrate_flatten_attendance.verify_staging(db, 'attendancemonths')
+
+
+def test_insert_batch_keeps_the_first_of_each_key_in_any_insert_order():
+    collection = mongomock.MongoClient()['test']['attendancemonths_staging']
+    migrate_flatten_attendance.create_flat_index(collection)
+    user_id = ObjectId()
+    documents = [{'userId': user_id, 'semester': 1, 'month': 8, 'subjects': [], 'attendanceId': number}
+                 for number in range(3)]
+
+    result = migrate_flatten_attendance.insert_batch(ReorderingCollection(collection), documents, 1)
+
+    assert result == (1, 2, 0)
+    assert collection.find_one()['attendanceId'] == 0
+
+
+def test_swap_refuses_to_overwrite_an_earlier_backup():
+    db = mongomock.MongoClient()['test']
+    db.attendancemonths.insert_one({'generation': 1})
+    db.attendancemonths_staging.insert_one({'generation': 2})
+    assert migrate_flatten_attendance.swap_staging(db, 'attendancemonths')
+
+    db.attendancemonths_staging.insert_one({'generation': 3})
+    assert not migrate_flatten_attendance.swap_staging(db, 'attendancemonths')
+
+    assert db.attendancemonths.find_one()['generation'] == 2
+    assert db.attendancemonths_previous.find_one()['generation'] == 1
+    assert db.attendancemonths_staging.find_one()['generation'] == 3
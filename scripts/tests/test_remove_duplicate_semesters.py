@@ -0,0 +1,57 @@
+import pytest
+from bson import ObjectId
+
+import remove_duplicate_semesters
+from fakes import ChangingCollection
+
+mongomock = pytest.importorskip('mongomock')
+
+
+def semester(number):
+    return {'_id': ObjectId(), 'semester': number, 'subjects': []}
+
+
+def test_keep_operation_pulls_duplicates_under_the_version_guard():
+    semesters = [semester(1), semester(2), semester(1), semester(3)]
+    collection = mongomock.MongoClient()['test']['externals']
+    record_id = collection.insert_one({'userId': ObjectId(), 'semesters': semesters, '__v': 4}).inserted_id
+    totals = {'records': 0, 'removed': 0}
+
+    [plan] = remove_duplicate_semesters.iter_keep_plans(collection, [record_id], totals)
+    operation = remove_duplicate_semesters.build_keep_operation(plan)
+    collection.update_one({'_id': record_id}, {'$inc': {'__v': 1}})
+    stale = collection.bulk_write([operation])
+    collection.update_one({'_id': record_id}, {'$inc': {'__v': -1}})
+    result = collection.bulk_write([operation])
+
+    assert totals == {'records': 1, 'removed': 1}
+    assert stale.matched_count == 0
+    assert result.modified_count == 1
+    assert collection.find_one()['semesters'] == semesters[1:]
+
+
+def test_dedupe_collection_keeps_the_latest_semesters():
+    semesters = [semester(1), semester(2), semester(1), semester(2), semester(3)]
+    collection = mongomock.MongoClient()['test']['externals']
+    collection.insert_one({'userId': ObjectId(), 'semesters': semesters, '__v': 0})
+
+    totals = remove_duplicate_semesters.dedupe_collection(collection, apply=True)
+
+    assert totals['updated'] == 1 and totals['conflicts'] == 0
+    assert collection.find_one()['semesters'] == semesters[2:]
+
+
+def test_records_saved_during_the_write_are_planned_again_and_retried():
+    semesters = [semester(1), semester(2), semester(1)]
+    saved = semesters + [semester(2)]
+    collection = mongomock.MongoClient()['test']['externals']
+    record_id = collection.insert_one({'userId': ObjectId(), 'semesters': semesters, '__v': 0}).inserted_id
+
+    save = {'$set': {'semesters': saved}, '$inc': {'__v': 1}}
+    totals = remove_duplicate_semesters.dedupe_collection(
+        ChangingCollection(collection, record_id, save), apply=True)
+
+    assert totals['updated'] == 1 and totals['conflicts'] == 0
+    record = collection.find_one()
+    assert record['semesters'] == [saved[2], saved[3]]
+    assert record['__v'] == 2
@@ -0,0 +1,30 @@
+import pytest
+
+from summarize_attendance import changed_user_ids
+
+mongomock = pytest.importorskip('mongomock')
+
+
+class FakeTracker:
+    """Reports the given record _ids as changed through the change stream"""
+
+    mode = 'change-stream'
+
+    def __init__(self, changed):
+        self.changed = changed
+
+    def pending_query(self):
+        return {'_id': {'$in': self.changed}}
+
+
+def test_changed_records_refresh_their_students():
+    db = mongomock.MongoClient().db
+    db.attendances.insert_many([{'_id': 1, 'userId': 'a'}, {'_id': 2, 'userId': 'b'}])
+    assert changed_user_ids(db, FakeTracker([2])) == ['b']
+
+
+def test_a_deleted_record_refreshes_every_student():
+    db = mongomock.MongoClient().db
+    db.attendances.insert_many([{'_id': 1, 'userId': 'a'}, {'_id': 2, 'userId': 'b'}])
+    db.attendances.delete_one({'_id': 1})
+    assert changed_user_ids(db, FakeTracker([1, 2])) is None